@@ -8,6 +8,7 @@ URI_STEMS = {'jobs': '/api/jobs',
              'progress': '/api/progress',
              'data': '/api/data',
              'cases': '/api/cases',
+             'sweeps': '/api/sweeps',
              'thumbnails': '/assets/thumbnails'}
 
 MIDDLEWARE_URL = "https://science-gateway-middleware.azurewebsites.net"
@@ -18,5 +19,99 @@ MIDDLEWARE_ONLY_JOB_FIELDS = [
     "creation_datetime",
     "start_datetime",
     "end_datetime",
-    "backend_identifier"
+    "backend_identifier",
+    "status_checked_at"
 ]
+
+# SSH connection pool settings. Connections to the compute backend are kept
+# open and reused between requests rather than reconnecting for every command
+SSH_POOL_MAX_SIZE = 4  # maximum open connections per host/user/key
+SSH_POOL_IDLE_TIMEOUT = 300  # seconds before an unused connection is closed
+SSH_POOL_ACQUIRE_TIMEOUT = 30  # seconds to wait for a free connection
+SSH_KEEPALIVE_INTERVAL = 30  # seconds between transport keepalive packets
+# Commands are multiplexed as channels over a single connection
+SSH_MAX_CHANNELS = 8  # maximum concurrent channels per connection
+SSH_COMMAND_TIMEOUT = 300  # seconds before a remote command is abandoned
+# How job files are copied to the backend: "cas" uploads only files missing
+# from a content addressed store on the backend and copies them into the job
+# directory, "archive" streams every file as a single tar archive over one
+# channel and "scp" copies the files one at a time
+FILE_TRANSFER_MODE = "cas"
+# Directory of the content addressed store, relative to SIM_ROOT. Objects not
+# used by any job for CAS_MAX_AGE days are removed from the store.
+CAS_DIRECTORY = ".cas"
+CAS_MAX_AGE = 30  # days
+
+# Compiled Mako templates are cached in memory (up to TEMPLATE_CACHE_SIZE
+# templates) and their compiled modules are written to
+# TEMPLATE_MODULE_DIRECTORY, so templates are compiled once rather than on
+# every job setup. Set the directory to None to keep them in memory only.
+TEMPLATE_CACHE_SIZE = 64
+TEMPLATE_MODULE_DIRECTORY = ".mako_modules"
+# Job setup renders templates on a pool of SETUP_CONCURRENCY threads while
+# the job directory is created, and (in "scp" mode) copies files in parallel
+SETUP_CONCURRENCY = 4
+
+# Parameter sweeps (POST /api/sweeps) create a job for every combination of
+# the swept parameter values and submit them all as a single PBS array job,
+# each subjob running SWEEP_JOB_SCRIPT in its own job directory. Sweeps of
+# more than SWEEP_MAX_JOBS jobs are rejected.
+SWEEP_MAX_JOBS = 1000
+SWEEP_JOB_SCRIPT = "pbs.sh"
+
+# Background polling of job statuses. When enabled, a thread started by
+# create_app refreshes the status of Queued and Running jobs and the job GET
+# endpoints return the last known status without contacting the backend.
+# The poll interval doubles (up to the maximum) while nothing changes and
+# drops back to the minimum as soon as a job changes status.
+JOB_STATUS_POLLER = False
+JOB_STATUS_POLL_MIN_INTERVAL = 10  # seconds
+JOB_STATUS_POLL_MAX_INTERVAL = 120  # seconds
+
+# Largest page of jobs or cases returned when a listing is paged with ?limit=
+MAX_PAGE_SIZE = 100
+
+# Loading strategy for the child collections of jobs and job templates
+# (families, parameters, templates, scripts, inputs and outputs). "selectin"
+# loads each collection with one extra SELECT ... IN query, whereas "joined"
+# loads everything in a single query whose rows are the product of all the
+# collection sizes. See dev/benchmark_job_loading.py.
+JOB_COLLECTION_LOADING = "selectin"
+
+# Compression of JSON responses for clients that send Accept-Encoding. Brotli
+# is used in preference to gzip if the brotli package is installed.
+COMPRESS_ENABLED = True
+COMPRESS_MIMETYPES = ["application/json"]
+COMPRESS_MIN_SIZE = 1024  # bytes; smaller bodies are sent uncompressed
+COMPRESS_LEVEL = 6  # gzip compression level (1-9)
+COMPRESS_BROTLI_QUALITY = 5  # brotli quality (0-11)
+
+# Cache of PROGRESS and DATA script results. Results for Running jobs are
+# reused for a few seconds, so many clients polling a job share one run of
+# the script, and results for Complete jobs are kept until evicted or the
+# job is set up or run again. The cache holds at most RESULT_CACHE_MAX_ENTRIES
+# results and RESULT_CACHE_MAX_BYTES of them, measured as JSON.
+RESULT_CACHE_MAX_ENTRIES = 256
+RESULT_CACHE_MAX_BYTES = 32 * 1024 * 1024
+RESULT_CACHE_RUNNING_TTL = 5  # seconds
+
+# Directory where the final PROGRESS and DATA results of jobs are stored when
+# they complete. Results of Complete jobs are then served from here without
+# contacting the backend. Set to None to disable. A result that cannot be
+# fetched is retried after RESULT_STORE_RETRY_INTERVAL seconds, doubling after
+# each failure up to RESULT_STORE_MAX_RETRY_INTERVAL.
+RESULT_STORE_ROOT = "./results"
+RESULT_STORE_RETRY_INTERVAL = 30  # seconds
+RESULT_STORE_MAX_RETRY_INTERVAL = 600  # seconds
+
+# Job setup and submission (POST /api/setup and /api/run) happen on a pool of
+# worker threads, and the request returns 202 Accepted straight away. The job
+# is Submitting until the scheduler accepts it (Queued) or it fails (Error).
+# When the middleware starts, jobs that have been Submitting for longer than
+# SUBMISSION_RECOVERY_TIMEOUT are marked as Error. This should be longer than
+# the slowest setup, as other middleware processes may still be submitting
+# more recent jobs.
+ASYNC_SUBMISSION = True
+SUBMISSION_WORKERS = 4
+SUBMISSION_QUEUE_SIZE = 32  # jobs waiting or in progress before a 503
+SUBMISSION_RECOVERY_TIMEOUT = 3600  # seconds
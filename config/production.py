@@ -15,3 +15,6 @@ SQLALCHEMY_TRACK_MODIFICATIONS = False
 # Load cases from resources json file
 LOAD_BLUE_CASES = True
 LOAD_DEVELOPMENT_CASES = False
+
+# Refresh job statuses in the background rather than on every GET request
+JOB_STATUS_POLLER = True
@@ -11,3 +11,9 @@ SQLALCHEMY_TRACK_MODIFICATIONS = False
 # Load cases from resources json file
 LOAD_BLUE_CASES = False
 LOAD_DEVELOPMENT_CASES = False
+
+# Do not keep job results on disk
+RESULT_STORE_ROOT = None
+
+# Set up and run jobs within the request
+ASYNC_SUBMISSION = False
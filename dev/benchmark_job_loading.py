@@ -0,0 +1,116 @@
+"""
+Compare relationship loading strategies for fetching a single job.
+
+Loads the prerun jobs from resources/prerun_*/job.json into an in-memory
+database and, for each strategy, reports the number of SQL statements, the
+number of rows returned by those statements and the mean time taken to fetch
+the job by id. The strategy is applied to every child collection of a job
+with query options, overriding JOB_COLLECTION_LOADING.
+
+Run from the repository root:
+
+    python dev/benchmark_job_loading.py [repeats]
+"""
+import glob
+import json
+import os
+import sys
+import timeit
+from flask import Flask
+from sqlalchemy import event, orm
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                "..")))
+
+from middleware.database import db  # noqa: E402
+from middleware.job.models import Job, Family  # noqa: E402
+from middleware.job.schema import JobSchema  # noqa: E402
+from middleware.job.sqlalchemy_repository import (  # noqa: E402
+    JobRepositorySqlAlchemy)
+
+STRATEGIES = ["joined", "selectin", "subquery"]
+
+
+def loader_options(strategy):
+    # e.g. orm.selectinload(Job.families).selectinload(Family.parameters)
+    method = strategy + "load"
+    load = getattr(orm, method)
+    return [getattr(load(Job.families), method)(Family.parameters),
+            load(Job.templates),
+            load(Job.scripts),
+            load(Job.inputs),
+            load(Job.outputs)]
+
+
+class StatementRecorder(object):
+    """Records the SQL statements executed on an engine"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    def __enter__(self):
+        event.listen(self.engine, "after_cursor_execute", self.record)
+        return self
+
+    def __exit__(self, *args):
+        event.remove(self.engine, "after_cursor_execute", self.record)
+
+    def record(self, conn, cursor, statement, parameters, context,
+               executemany):
+        self.statements.append((statement, parameters))
+
+    def count_rows(self):
+        # SQLite does not report a row count for SELECT statements, so run
+        # each one again and count the rows it returns
+        connection = self.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            return sum(len(cursor.execute(statement, parameters).fetchall())
+                       for statement, parameters in self.statements)
+        finally:
+            connection.close()
+
+
+def benchmark(session, job_id, strategy, repeats):
+    options = loader_options(strategy)
+
+    def get_by_id():
+        session.expunge_all()
+        return session.query(Job).options(*options)\
+            .filter_by(id=job_id).first()
+
+    with StatementRecorder(db.engine) as recorder:
+        get_by_id()
+    seconds = timeit.timeit(get_by_id, number=repeats) / repeats
+    return len(recorder.statements), recorder.count_rows(), seconds
+
+
+def main(repeats=100):
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        jobs = JobRepositorySqlAlchemy(db.session)
+        root = os.path.join(os.path.dirname(__file__), "..", "resources")
+        print("{:<28} {:<9} {:>10} {:>6} {:>10}".format(
+            "job", "strategy", "statements", "rows", "ms/get"))
+        for filename in sorted(glob.glob(os.path.join(
+                root, "prerun_*", "job.json"))):
+            with open(filename) as job_file:
+                job = JobSchema().make_job(json.load(job_file))
+            job_id = job.id
+            jobs.create(job)
+            name = os.path.basename(os.path.dirname(filename))
+            for strategy in STRATEGIES:
+                statements, rows, seconds = benchmark(
+                    db.session, job_id, strategy, repeats)
+                print("{:<28} {:<9} {:>10} {:>6} {:>10.2f}".format(
+                    name, strategy, statements, rows, seconds * 1000))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
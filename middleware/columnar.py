@@ -0,0 +1,47 @@
+"""
+Packed columnar encoding of job data series, as produced by the DATA scripts
+when run with the "binary" format argument. The layout is:
+
+    header length   little-endian uint32
+    header          UTF-8 JSON: keys, labels, units, rows, dtype, cursor...
+    columns         one packed array per key, in the order of the keys
+
+Columns are little-endian float64 ("<f8"), so a browser can read each one
+straight into a Float64Array without parsing.
+"""
+import json
+import struct
+
+COLUMNAR_MIMETYPE = "application/vnd.science-gateway.columns"
+
+
+def encode_columns(data_object):
+    """Pack a {"data": {...}, ...} object as returned by a DATA script"""
+    data = data_object["data"]
+    keys = data["keys"]
+    header = {k: v for k, v in data.items() if k not in keys}
+    header.update({k: v for k, v in data_object.items() if k != "data"})
+    header["rows"] = len(data[keys[0]]) if keys else 0
+    header["dtype"] = "<f8"
+    header_bytes = json.dumps(header).encode("utf-8")
+    chunks = [struct.pack("<I", len(header_bytes)), header_bytes]
+    for key in keys:
+        chunks.append(struct.pack("<{}d".format(len(data[key])), *data[key]))
+    return b"".join(chunks)
+
+
+def decode_columns(payload):
+    """Unpack columns into the {"data": {...}, ...} object they encode"""
+    header_length, = struct.unpack_from("<I", payload)
+    header = json.loads(payload[4:4 + header_length].decode("utf-8"))
+    rows = header.pop("rows")
+    header.pop("dtype")
+    position = 4 + header_length
+    data = {k: header.pop(k) for k in ["keys", "labels", "units"]
+            if k in header}
+    for key in data["keys"]:
+        data[key] = list(struct.unpack_from("<{}d".format(rows), payload,
+                                            position))
+        position += 8 * rows
+    header["data"] = data
+    return header
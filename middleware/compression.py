@@ -0,0 +1,93 @@
+import gzip
+import zlib
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, fall back to gzip only
+    brotli = None
+
+
+class GzipStream(object):
+    """Incremental gzip compressor with the same interface as brotli's"""
+
+    def __init__(self, level):
+        # wbits of 16 + MAX_WBITS writes a gzip header and trailer
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED,
+                                            16 + zlib.MAX_WBITS)
+
+    def process(self, data):
+        return self._compressor.compress(data)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+def available_encodings():
+    if brotli is not None:
+        return ['br', 'gzip']
+    return ['gzip']
+
+
+def compress(data, encoding, config):
+    if encoding == 'br':
+        return brotli.compress(data, quality=config['COMPRESS_BROTLI_QUALITY'])
+    return gzip.compress(data, compresslevel=config['COMPRESS_LEVEL'])
+
+
+def compress_stream(chunks, encoding, config, charset):
+    if encoding == 'br':
+        compressor = brotli.Compressor(
+            quality=config['COMPRESS_BROTLI_QUALITY'])
+    else:
+        compressor = GzipStream(config['COMPRESS_LEVEL'])
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode(charset)
+        data = compressor.process(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def weaken_etag(response):
+    # The same entity tag labels every encoding of a response, so it is only
+    # a weak validator when the client may be sent a compressed encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+
+
+def compress_response(response):
+    """
+    after_request handler that compresses responses with the best encoding
+    the client accepts. Bodies smaller than COMPRESS_MIN_SIZE are sent as
+    they are, and streamed bodies are compressed chunk by chunk as they are
+    sent rather than being read into memory first.
+    """
+    config = current_app.config
+    if not config.get('COMPRESS_ENABLED'):
+        return response
+    encoding = request.accept_encodings.best_match(available_encodings())
+    if encoding is None:
+        return response
+    response.vary.add('Accept-Encoding')
+    weaken_etag(response)
+
+    if (response.status_code < 200 or response.status_code in [204, 304] or
+            response.mimetype not in config['COMPRESS_MIMETYPES'] or
+            'Content-Encoding' in response.headers):
+        return response
+
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoding,
+                                            config, response.charset)
+        response.direct_passthrough = False
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < config['COMPRESS_MIN_SIZE']:
+            return response
+        response.set_data(compress(data, encoding, config))
+    response.headers['Content-Encoding'] = encoding
+    return response
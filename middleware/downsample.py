@@ -0,0 +1,71 @@
+"""
+Downsampling of time series data for plotting, using the largest triangle
+three buckets (LTTB) algorithm, which keeps the points that contribute most to
+the visual shape of a series (peaks, troughs and changes of slope).
+"""
+
+
+def lttb_indices(x, y, threshold):
+    """
+    Return the indices of (at most) `threshold` points of the series (x, y)
+    chosen by largest triangle three buckets. The first and last points are
+    always kept.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+
+    # Bucket size, leaving the first and last points in buckets of their own
+    every = (n - 2) / (threshold - 2)
+    indices = [0]
+    a = 0
+    for i in range(threshold - 2):
+        # Average point of the next bucket
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, n)
+        avg_count = avg_end - avg_start
+        avg_x = sum(x[avg_start:avg_end]) / avg_count
+        avg_y = sum(y[avg_start:avg_end]) / avg_count
+
+        # Pick the point in this bucket forming the largest triangle with the
+        # previously selected point and the average of the next bucket
+        ax, ay = x[a], y[a]
+        max_area = -1
+        for j in range(int(i * every) + 1, int((i + 1) * every) + 1):
+            area = abs((ax - avg_x) * (y[j] - ay) - (ax - x[j]) * (avg_y - ay))
+            if area > max_area:
+                max_area = area
+                next_a = j
+        indices.append(next_a)
+        a = next_a
+    indices.append(n - 1)
+    return indices
+
+
+def downsample(data, points):
+    """
+    Downsample the series output by a job's DATA script, of the form
+    {"keys": [x_key, y_key, ...], x_key: [...], y_key: [...], ...}, where
+    every series shares the first (x) series as its axis.
+
+    Points are chosen for each series against the x axis and the union of the
+    chosen rows is kept in every series, so the series stay aligned. Each
+    series keeps at least its own `points` most significant points.
+    """
+    keys = data.get("keys") or []
+    if len(keys) < 2:
+        return data
+    x = data[keys[0]]
+    if len(x) <= points:
+        return data
+
+    rows = set()
+    for key in keys[1:]:
+        rows.update(lttb_indices(x, data[key], points))
+    rows = sorted(rows)
+
+    downsampled = dict(data)
+    for key in keys:
+        values = data[key]
+        downsampled[key] = [values[row] for row in rows]
+    return downsampled
@@ -5,8 +5,14 @@ from middleware.job.sqlalchemy_repository import JobRepositorySqlAlchemy
 from middleware.job.sqlalchemy_repository import CaseRepositorySqlAlchemy
 from middleware.job.api import (JobApi, JobsApi, SetupApi, RunApi, ProgressApi,
                                 DataApi, CancelApi, CaseApi, CasesApi,
-                                ThumbnailApi)
+                                SweepsApi, ThumbnailApi)
 from middleware.database import db, ma
+from middleware.job_status_poller import JobStatusPoller
+from middleware.job.case_catalogue import CaseCatalogue
+from middleware.job.result_cache import ResultCache
+from middleware.job.result_store import ResultStore
+from middleware.job.submission import SubmissionQueue
+from middleware.compression import compress_response
 from middleware.job.schema import CaseSchema, JobSchema
 import json
 
@@ -105,6 +111,27 @@ def create_app(config_name,
     app._case_repository = case_repository
     app._job_repository = job_repository
 
+    # Cases rarely change, so the case endpoints are served from an in-memory
+    # catalogue that is rebuilt only when the case tables change
+    app._case_catalogue = CaseCatalogue(app._case_repository)
+
+    # PROGRESS and DATA results are cached to save running the scripts over
+    # SSH for every request
+    app._result_cache = ResultCache(
+        max_entries=app.config.get('RESULT_CACHE_MAX_ENTRIES'),
+        max_bytes=app.config.get('RESULT_CACHE_MAX_BYTES'),
+        running_ttl=app.config.get('RESULT_CACHE_RUNNING_TTL'))
+
+    # The final results of Complete jobs are kept locally
+    app._result_store = None
+    if app.config.get('RESULT_STORE_ROOT'):
+        app._result_store = ResultStore(
+            app.config['RESULT_STORE_ROOT'],
+            retry_interval=app.config.get('RESULT_STORE_RETRY_INTERVAL'),
+            max_retry_interval=app.config.get(
+                'RESULT_STORE_MAX_RETRY_INTERVAL'),
+            logger=app.logger)
+
     prerun_job_list = [
         './resources/prerun_product_changeover/job.json',
         './resources/prerun_stirred_tank/job.json',
@@ -133,53 +160,99 @@ def create_app(config_name,
             for case in case_list:
                 app._case_repository.create(case)
 
+    # When statuses are refreshed in the background, job reads serve the
+    # last known status instead of querying the backend themselves
+    refresh_status_on_read = not app.config.get('JOB_STATUS_POLLER')
+    if app.config.get('JOB_STATUS_POLLER'):
+        app._job_status_poller = JobStatusPoller(
+            app, app._job_repository,
+            result_store=app._result_store,
+            min_interval=app.config.get('JOB_STATUS_POLL_MIN_INTERVAL'),
+            max_interval=app.config.get('JOB_STATUS_POLL_MAX_INTERVAL'))
+        app._job_status_poller.start()
+
+    # Set up and submit jobs on a pool of worker threads rather than in the
+    # request
+    app._submission_queue = None
+    if app.config.get('ASYNC_SUBMISSION'):
+        app._submission_queue = SubmissionQueue(
+            app, app._job_repository,
+            max_workers=app.config.get('SUBMISSION_WORKERS'),
+            max_pending=app.config.get('SUBMISSION_QUEUE_SIZE'))
+        # Jobs interrupted by a restart would otherwise stay Submitting
+        app._submission_queue.recover(
+            app.config.get('SUBMISSION_RECOVERY_TIMEOUT'))
+
+    # Compress large JSON responses for clients that accept it
+    app.after_request(compress_response)
+
     api = Api(app)
 
     api.add_resource(JobApi, '{}/<string:job_id>'.format(URI_STEMS['jobs']),
                      resource_class_kwargs={
                      'job_repository': app._job_repository,
                      'middleware_only_fields':
-                     app.config.get("MIDDLEWARE_ONLY_JOB_FIELDS")})
+                     app.config.get("MIDDLEWARE_ONLY_JOB_FIELDS"),
+                     'refresh_status': refresh_status_on_read,
+                     'result_store': app._result_store})
 
     api.add_resource(JobsApi, URI_STEMS['jobs'],
-                     resource_class_kwargs={'job_repository':
-                                            app._job_repository})
+                     resource_class_kwargs={
+                     'job_repository': app._job_repository,
+                     'refresh_status': refresh_status_on_read,
+                     'max_page_size': app.config.get('MAX_PAGE_SIZE')})
 
     api.add_resource(CasesApi, URI_STEMS['cases'],
-                     resource_class_kwargs={'case_repository':
-                                            app._case_repository})
+                     resource_class_kwargs={
+                     'case_catalogue': app._case_catalogue,
+                     'max_page_size': app.config.get('MAX_PAGE_SIZE')})
 
     api.add_resource(CaseApi, '{}/<string:case_id>'.format(URI_STEMS['cases']),
-                     resource_class_kwargs={'case_repository':
-                                            app._case_repository})
+                     resource_class_kwargs={'case_catalogue':
+                                            app._case_catalogue})
 
     api.add_resource(SetupApi, '{}/<string:job_id>'.format(URI_STEMS['setup']),
                      resource_class_kwargs={
                      'job_repository': app._job_repository,
                      'middleware_only_fields':
-                     app.config.get("MIDDLEWARE_ONLY_JOB_FIELDS")})
+                     app.config.get("MIDDLEWARE_ONLY_JOB_FIELDS"),
+                     'submission_queue': app._submission_queue,
+                     'result_cache': app._result_cache})
 
     api.add_resource(RunApi, '{}/<string:job_id>'.format(URI_STEMS['run']),
                      resource_class_kwargs={
                      'job_repository': app._job_repository,
                      'middleware_only_fields':
-                     app.config.get("MIDDLEWARE_ONLY_JOB_FIELDS")})
+                     app.config.get("MIDDLEWARE_ONLY_JOB_FIELDS"),
+                     'submission_queue': app._submission_queue,
+                     'result_cache': app._result_cache,
+                     'result_store': app._result_store})
 
     api.add_resource(ProgressApi,
                      '{}/<string:job_id>'.format(URI_STEMS['progress']),
-                     resource_class_kwargs={'job_repository':
-                                            app._job_repository})
+                     resource_class_kwargs={
+                         'job_repository': app._job_repository,
+                         'result_cache': app._result_cache,
+                         'result_store': app._result_store})
 
     api.add_resource(DataApi,
                      '{}/<string:job_id>'.format(URI_STEMS['data']),
-                     resource_class_kwargs={'job_repository':
-                                            app._job_repository})
+                     resource_class_kwargs={
+                         'job_repository': app._job_repository,
+                         'result_cache': app._result_cache,
+                         'result_store': app._result_store})
 
     api.add_resource(CancelApi,
                      '{}/<string:job_id>'.format(URI_STEMS['cancel']),
                      resource_class_kwargs={'job_repository':
                                             app._job_repository})
 
+    api.add_resource(SweepsApi, URI_STEMS['sweeps'],
+                     resource_class_kwargs={
+                     'job_repository': app._job_repository,
+                     'case_catalogue': app._case_catalogue,
+                     'max_sweep_size': app.config.get('SWEEP_MAX_JOBS')})
+
     # for development, serve static files from flask itself
     api.add_resource(ThumbnailApi,
                      '{}/<path:path>'.format(URI_STEMS['thumbnails']))
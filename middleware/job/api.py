@@ -1,13 +1,144 @@
+import base64
+import hashlib
+import json
 import json_merge_patch
+import struct
 from flask_restful import Resource, abort, request
-from flask import current_app, send_from_directory
+from flask import current_app, send_from_directory, Response
+from werkzeug.http import http_date, quote_etag
 from middleware.job_information_manager import job_information_manager as JIM
+from middleware.job_information_manager import (job_statuses,
+                                                ACTIVE_JOB_STATUSES)
 from middleware.job.schema import (job_to_json, json_to_job,
-                                   job_to_summary_json,
-                                   case_to_summary_json)
-from middleware.job.models import case_to_job, copy_job_fields
+                                   job_to_summary_json)
+from middleware.job.models import (copy_job_fields, job_uri,
+                                   INTERNAL_JOB_FIELDS)
+from middleware.job.submission import (SubmissionQueueFull,
+                                       SUBMITTING_STATUS, ERROR_STATUS)
+from middleware.job.sweep import (SweepError, sweep_points, check_job_script,
+                                  sweep_jobs, sweep_upload, submit_sweep,
+                                  array_backend_identifiers)
+from middleware.downsample import downsample
+from middleware.columnar import (COLUMNAR_MIMETYPE, encode_columns,
+                                 decode_columns)
+from middleware.job.result_store import data_after_cursor
+from middleware.job.pagination import (PaginationError, encode_cursor,
+                                       decode_cursor, datetime_cursor,
+                                       parse_limit, parse_datetime,
+                                       parse_sort)
 import arrow
 import os
+from uuid import uuid4
+
+
+def page_arguments(max_page_size):
+    """Read the limit and cursor query parameters for a paged listing"""
+    limit = parse_limit(request.args.get("limit"), max_page_size)
+    cursor = request.args.get("cursor")
+    after = decode_cursor(cursor) if cursor else None
+    return limit, after
+
+
+def next_page(items, limit, position):
+    """
+    Split off the extra item fetched beyond the page limit, if any, and return
+    the page with the cursor for the page after it (None on the last page).
+    """
+    if limit is None or len(items) <= limit:
+        return items, None
+    items = items[:limit]
+    return items, encode_cursor(*position(items[-1]))
+
+
+def content_etag(body):
+    """Strong entity tag from a hash of a JSON response body"""
+    content = json.dumps(body, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def job_etag(job):
+    """
+    Strong entity tag from the job's version, which the repository increments
+    whenever the job is saved, so the job need not be serialised to check it
+    """
+    return "{}-{}".format(job.id, job.version)
+
+
+def conditional_response(body, etag, last_modified=None):
+    """
+    Return the JSON body with its validators, or an empty 304 response if the
+    client already holds the current version (If-None-Match takes precedence
+    over If-Modified-Since). body may also be a function returning the body,
+    which is then only called if the body is sent.
+    """
+    headers = {'ETag': quote_etag(etag)}
+    if last_modified is not None:
+        headers['Last-Modified'] = http_date(last_modified.datetime)
+    if request.if_none_match:
+        # Compressed responses carry the tag as a weak validator, which is
+        # still good enough to tell the client its copy is current
+        not_modified = request.if_none_match.contains_weak(etag)
+    elif request.if_modified_since and last_modified is not None:
+        # HTTP dates have a resolution of one second
+        not_modified = (last_modified.floor('second') <=
+                        arrow.get(request.if_modified_since))
+    else:
+        not_modified = False
+    if not_modified:
+        return Response(status=304, headers=headers)
+    headers['Content-Type'] = 'application/json'
+    if callable(body):
+        body = body()
+    return body, 200, headers
+
+
+def cached_result(result_cache, job, action, arguments, run):
+    # Run a job's script through the result cache, if there is one
+    if result_cache is None:
+        return run()
+    return result_cache.get(job, action, arguments, run)
+
+
+def invalidate_results(result_cache, job_id):
+    # Cached results no longer describe a job that is set up or run again
+    if result_cache is not None:
+        result_cache.invalidate(job_id)
+
+
+def stored_result(result_store, job, action, job_repository):
+    # The final results of Complete jobs are served from the result store
+    if result_store is None or job.status != "Complete":
+        return None
+    return result_store.result(job, action, job_repository)
+
+
+def reuse_results(result_store, job, job_repository):
+    # Complete a job straight away with the results of a Complete job with
+    # the same parameter hash, if there is one whose results are available
+    if result_store is None or job.parameter_hash is None:
+        return None
+    match = job_repository.find_by_parameter_hash(
+        job.parameter_hash, status="Complete", exclude_id=job.id)
+    if match is None or not result_store.copy(match, job.id, job_repository):
+        return None
+    job.status = "Complete"
+    job.end_datetime = job.start_datetime
+    job_repository.update(job)
+    uri = job_uri(job.id)
+    return ({"id": job.id, "status": "Complete", "uri": uri,
+             "reused_job_id": match.id}, 200)
+
+
+def queue_submission(submission_queue, job_id, action):
+    # Queue a job's SETUP or RUN action and point the client at the job,
+    # whose status shows how the submission is progressing
+    try:
+        submission_queue.submit(job_id, action)
+    except SubmissionQueueFull as e:
+        abort(503, message=str(e))
+    uri = job_uri(job_id)
+    return ({"id": job_id, "status": SUBMITTING_STATUS, "uri": uri}, 202,
+            {"Location": uri})
 
 
 class JobApi(Resource):
@@ -17,6 +148,10 @@ class JobApi(Resource):
         # Inject job service
         self.jobs = kwargs['job_repository']
         self.middleware_only_fields = kwargs.get('middleware_only_fields')
+        # Check job status against the backend on read (set to False when a
+        # background poller keeps statuses up to date)
+        self.refresh_status = kwargs.get('refresh_status', True)
+        self.result_store = kwargs.get('result_store')
 
     def abort_if_not_found(self, job_id):
         if not self.jobs.exists(job_id):
@@ -30,12 +165,13 @@ class JobApi(Resource):
         # TODO: Test this directly? (we already test the update_job_status()
         # method to ensure it returns an exception that will be passed to
         # client)
-        manager = JIM(job, job_repository=self.jobs)
-        job.status = manager.update_job_status()
-        job = self.jobs.update(job)
+        if self.refresh_status and job.status in ACTIVE_JOB_STATUSES:
+            manager = JIM(job, job_repository=self.jobs)
+            job.status = manager.update_job_status()
+            job.status_checked_at = arrow.utcnow()
+            job = self.jobs.update(job)
 
-        job_json = job_to_json(job)
-        return job_json, 200, {'Content-Type': 'application/json'}
+        return conditional_response(lambda: job_to_json(job), job_etag(job))
 
     def put(self, job_id):
         # Require Job to exist in order to amend it
@@ -54,7 +190,8 @@ class JobApi(Resource):
             abort(400, message="Message body is not valid Job JSON")
         # Ignore any middleware only fields by copying the existing values
         copy_job_fields(source=job_old, destination=job_new,
-                        fields=self.middleware_only_fields)
+                        fields=self.middleware_only_fields +
+                        INTERNAL_JOB_FIELDS)
         # Check job_id route parameter consistent with provided Job data
         if job_id != job_new.id:
             abort(409, message="Job ID in URL ({}) does not match job "
@@ -98,7 +235,8 @@ class JobApi(Resource):
             abort(400, message="Message body is not valid Job JSON")
         # Ignore any middleware only fields by copying the existing values
         copy_job_fields(source=job_old, destination=job_new,
-                        fields=self.middleware_only_fields)
+                        fields=self.middleware_only_fields +
+                        INTERNAL_JOB_FIELDS)
         # Check job_id route parameter consistent with provided Job data
         if job_id != job_new.id:
             abort(409, message="Job ID in URL ({}) does not match job "
@@ -123,6 +261,8 @@ class JobApi(Resource):
             self.abort_if_not_found(job_id)
         # Delete job
         self.jobs.delete(job_id)
+        if self.result_store is not None:
+            self.result_store.delete(job_id)
         deleted_job = self.jobs.get_by_id(job_id)
         return deleted_job, 204
 
@@ -133,26 +273,59 @@ class JobsApi(Resource):
     def __init__(self, **kwargs):
         # Inject job service
         self.jobs = kwargs['job_repository']
+        self.refresh_status = kwargs.get('refresh_status', True)
+        self.max_page_size = kwargs.get('max_page_size', 100)
 
     def get(self):
-
-        def list_job_summary_json(job_id):
-            job = self.jobs.get_by_id(job_id)
-            # Update job status from job manager and save updated job
-            # TODO: Test this directly? (we already test the update_job_status
-            # method to ensure it returns an exception that will be passed to
-            # client)
-            manager = JIM(job, job_repository=self.jobs)
-            job.status = manager.update_job_status()
-            job = self.jobs.update(job)
-            # Return summary Job data as JSON
-            summary_json = job_to_summary_json(job)
-            return summary_json
-
-        job_ids = self.jobs.list_ids()
-        summary_list = [list_job_summary_json(job_id) for job_id in job_ids]
-        return {"jobs": summary_list}, 200,
-        {'Content-Type': 'application/json'}
+        try:
+            limit, after = page_arguments(self.max_page_size)
+            after = datetime_cursor(after)
+            sort, descending = parse_sort(
+                request.args.get("sort", "creation_datetime"),
+                request.args.get("order", "asc"))
+            created_after = parse_datetime(
+                request.args.get("created_after"), "created_after")
+            created_before = parse_datetime(
+                request.args.get("created_before"), "created_before")
+        except PaginationError as e:
+            abort(400, message=str(e))
+        status = request.args.get("status")
+        if status is not None:
+            status = status.split(",")
+
+        # Summaries hold only the columns we return, so listing does not load
+        # every job in full. Fetch one job more than the limit to find out
+        # whether there is a next page.
+        jobs = self.jobs.list_summaries(
+            limit=None if limit is None else limit + 1,
+            after=after,
+            status=status,
+            user=request.args.get("user"),
+            case_id=request.args.get("case_id"),
+            created_after=created_after,
+            created_before=created_before,
+            sort=sort,
+            descending=descending)
+        jobs, next_cursor = next_page(
+            jobs, limit, lambda job: (getattr(job, sort), job.id))
+
+        # Update job statuses with a single batched call to the backend and
+        # save the result for jobs that were checked
+        if self.refresh_status:
+            active_jobs = [job for job in jobs
+                           if job.status in ACTIVE_JOB_STATUSES]
+            statuses = job_statuses(active_jobs)
+            checked_at = arrow.utcnow()
+            for job in active_jobs:
+                job.status = statuses[job.id]
+                job.status_checked_at = checked_at
+                self.jobs.update_status(job.id, job.status, checked_at)
+
+        summary_list = [job_to_summary_json(job) for job in jobs]
+        response = {"jobs": summary_list}
+        if limit is not None:
+            response["next_cursor"] = next_cursor
+        return conditional_response(response, content_etag(response))
 
     def post(self):
         job_json = request.json
@@ -177,38 +350,40 @@ class JobsApi(Resource):
 class CasesApi(Resource):
     """API endpoint called to get a list of cases (GET)"""
     def __init__(self, **kwargs):
-        self.cases = kwargs['case_repository']
+        # Inject case catalogue
+        self.catalogue = kwargs['case_catalogue']
+        self.max_page_size = kwargs.get('max_page_size', 100)
 
     def get(self):
-
-        def list_case_summary_json(case_id):
-            case = self.cases.get_by_id(case_id)
-            summary_json = case_to_summary_json(case)
-            return summary_json
-
-        case_ids = self.cases.list_ids()
-        summary_list = [list_case_summary_json(case_id) for
-                        case_id in case_ids]
-        return {"cases": summary_list}, 200,
-        {'Content-Type': 'application/json'}
+        try:
+            limit, after = page_arguments(self.max_page_size)
+        except PaginationError as e:
+            abort(400, message=str(e))
+        summary_list = self.catalogue.summaries(
+            limit=None if limit is None else limit + 1, after=after)
+        summary_list, next_cursor = next_page(
+            summary_list, limit, lambda case: (case["label"], case["id"]))
+
+        response = {"cases": summary_list}
+        if limit is not None:
+            response["next_cursor"] = next_cursor
+        # The same catalogue content and query always give the same page, so
+        # the catalogue tag identifies the response without hashing it
+        etag, built_at = self.catalogue.validators()
+        return conditional_response(response, etag, last_modified=built_at)
 
 
 class CaseApi(Resource):
     """API endpoint called to get specific case job template (GET)"""
 
     def __init__(self, **kwargs):
-        # Inject case service
-        self.cases = kwargs['case_repository']
-
-    def abort_if_not_found(self, case_id):
-        if not self.cases.exists(case_id):
-            abort(404, message="Case {} not found".format(case_id))
+        # Inject case catalogue
+        self.catalogue = kwargs['case_catalogue']
 
     def get(self, case_id):
-        self.abort_if_not_found(case_id)
-        case = self.cases.get_by_id(case_id)
-        job = case_to_job(case)
-        job_json = job_to_json(job)
+        job_json = self.catalogue.job_json(case_id)
+        if job_json is None:
+            abort(404, message="Case {} not found".format(case_id))
         return job_json, 200, {'Content-Type': 'application/json'}
 
 
@@ -218,6 +393,9 @@ class SetupApi(Resource):
         # Inject job service
         self.jobs = kwargs['job_repository']
         self.middleware_only_fields = kwargs.get('middleware_only_fields')
+        # Jobs are set up in the background if there is a submission queue
+        self.submissions = kwargs.get('submission_queue')
+        self.result_cache = kwargs.get('result_cache')
 
     def abort_if_not_found(self, job_id):
         if not self.jobs.exists(job_id):
@@ -227,6 +405,9 @@ class SetupApi(Resource):
         job_api = JobApi(job_repository=self.jobs,
                          middleware_only_fields=self.middleware_only_fields)
         updated_job = job_api._patch_job(job_id, request)
+        invalidate_results(self.result_cache, job_id)
+        if self.submissions is not None:
+            return queue_submission(self.submissions, job_id, "SETUP")
         manager = JIM(updated_job, job_repository=self.jobs)
         return manager.setup()
 
@@ -239,13 +420,20 @@ class ProgressApi(Resource):
     def __init__(self, **kwargs):
         # Inject job service
         self.jobs = kwargs['job_repository']
+        self.result_cache = kwargs.get('result_cache')
+        self.result_store = kwargs.get('result_store')
 
     def get(self, job_id):
 
         job = self.jobs.get_by_id(job_id)
         if job:
+            result = stored_result(self.result_store, job, "PROGRESS",
+                                   self.jobs)
+            if result is not None:
+                return result, 200
             manager = JIM(job, job_repository=self.jobs)
-            return manager.progress()
+            return cached_result(self.result_cache, job, "PROGRESS", [],
+                                 manager.progress)
         else:
             abort(404, message="Job {} not found".format(job_id))
 
@@ -255,13 +443,66 @@ class DataApi(Resource):
     def __init__(self, **kwargs):
         # Inject job service
         self.jobs = kwargs['job_repository']
+        self.result_cache = kwargs.get('result_cache')
+        self.result_store = kwargs.get('result_store')
 
     def get(self, job_id):
+        # Optional cursor returned by a previous call, to fetch only new rows
+        cursor = request.args.get("cursor")
+        if cursor is not None:
+            if not cursor.isdigit():
+                abort(400, message="Cursor must be a non-negative integer")
+            cursor = int(cursor)
+        # Optional number of points to downsample each series to
+        points = request.args.get("points")
+        if points is not None:
+            if not points.isdigit() or int(points) < 3:
+                abort(400, message="Points must be an integer of at least 3")
+            points = int(points)
+
+        # Packed columns are returned in place of JSON if the client prefers
+        binary = request.accept_mimetypes.best_match(
+            ["application/json", COLUMNAR_MIMETYPE]) == COLUMNAR_MIMETYPE
 
         job = self.jobs.get_by_id(job_id)
         if job:
+            result = stored_result(self.result_store, job, "DATA", self.jobs)
+            if result is not None:
+                result = data_after_cursor(result, cursor)
+            if result is not None:
+                # Stored results are kept as JSON, so are packed here if the
+                # client wants columns
+                output = result["stdout"]
+                if points:
+                    output["data"] = downsample(output["data"], points)
+                if binary:
+                    return Response(encode_columns(output),
+                                    mimetype=COLUMNAR_MIMETYPE)
+                return result, 200
+
             manager = JIM(job, job_repository=self.jobs)
-            return manager.data()
+            result, code = cached_result(
+                self.result_cache, job, "DATA", [cursor, binary],
+                lambda: manager.data(cursor=cursor, binary=binary))
+            output = result.get("stdout")
+            if binary and code == 200 and output:
+                # Pass the script's columns through, only unpacking them if
+                # they need to be downsampled
+                try:
+                    payload = base64.b64decode(output)
+                    if points:
+                        data_object = decode_columns(payload)
+                        data_object["data"] = downsample(data_object["data"],
+                                                         points)
+                        payload = encode_columns(data_object)
+                except (ValueError, KeyError, struct.error):
+                    # binascii.Error is a ValueError
+                    abort(502, message="DATA script output is not base64 "
+                                       "encoded packed columns")
+                return Response(payload, mimetype=COLUMNAR_MIMETYPE)
+            if points and isinstance(output, dict) and "data" in output:
+                output["data"] = downsample(output["data"], points)
+            return result, code
         else:
             abort(404, message="Job {} not found".format(job_id))
 
@@ -288,6 +529,10 @@ class RunApi(Resource):
         # Inject job service
         self.jobs = kwargs['job_repository']
         self.middleware_only_fields = kwargs.get('middleware_only_fields')
+        # Jobs are submitted in the background if there is a submission queue
+        self.submissions = kwargs.get('submission_queue')
+        self.result_cache = kwargs.get('result_cache')
+        self.result_store = kwargs.get('result_store')
 
     def abort_if_not_found(self, job_id):
         if not self.jobs.exists(job_id):
@@ -297,11 +542,93 @@ class RunApi(Resource):
         job_api = JobApi(job_repository=self.jobs,
                          middleware_only_fields=self.middleware_only_fields)
         updated_job = job_api._patch_job(job_id, request)
+        invalidate_results(self.result_cache, job_id)
         updated_job.start_datetime = arrow.utcnow()
         manager = JIM(updated_job, job_repository=self.jobs)
+        updated_job.parameter_hash = manager.parameter_hash()
+        self.jobs.update(updated_job)
+        # With ?reuse=true, the results of an identical Complete job are
+        # used instead of running the job again
+        if request.args.get("reuse", "false").lower() == "true":
+            reused = reuse_results(self.result_store, updated_job, self.jobs)
+            if reused is not None:
+                return reused
+        if self.submissions is not None:
+            return queue_submission(self.submissions, job_id, "RUN")
         return manager.run()
 
 
+class SweepsApi(Resource):
+    """
+    API endpoint called to create a parameter sweep of a case and run it on
+    the cluster as a single PBS array job (POST)
+    """
+    def __init__(self, **kwargs):
+        # Inject job service and case catalogue
+        self.jobs = kwargs['job_repository']
+        self.catalogue = kwargs['case_catalogue']
+        self.max_sweep_size = kwargs.get('max_sweep_size', 1000)
+
+    def post(self):
+        sweep_json = request.json
+        if sweep_json is None:
+            abort(400, message="Message body could not be parsed as JSON")
+        case_id = sweep_json.get("case_id")
+        job_json = self.catalogue.job_json(case_id)
+        if job_json is None:
+            abort(404, message="Case {} not found".format(case_id))
+        try:
+            check_job_script(job_json)
+            points = sweep_points(job_json, sweep_json.get("parameters"),
+                                  self.max_sweep_size)
+        except SweepError as e:
+            abort(400, message=str(e))
+
+        # Every job is rendered before any is saved, so a sweep that cannot
+        # be set up leaves no jobs behind
+        sweep_id = str(uuid4())
+        jobs = sweep_jobs(job_json, points)
+        archive_bytes, command = sweep_upload(sweep_id, jobs)
+        job_links = [{"id": job.id, "uri": job.uri} for job in jobs]
+        jobs = self.jobs.create_many(jobs)
+
+        start_datetime = arrow.utcnow()
+        try:
+            out, err, exit_code = submit_sweep(archive_bytes, command)
+        except Exception:
+            for job in jobs:
+                job.status = ERROR_STATUS
+            self.jobs.update_many(jobs)
+            raise
+        backend_identifier = None
+        identifiers = None
+        if exit_code == 0 and out.strip():
+            backend_identifier = out.strip().splitlines()[-1].strip()
+            identifiers = array_backend_identifiers(backend_identifier,
+                                                    len(jobs))
+            if identifiers is None:
+                # The array job was accepted, so keep the identifier qsub
+                # gave it even though the subjob identifiers are unknown
+                identifiers = [backend_identifier] * len(jobs)
+        for index, job in enumerate(jobs):
+            job.start_datetime = start_datetime
+            if identifiers is None:
+                job.status = ERROR_STATUS
+            else:
+                job.backend_identifier = identifiers[index]
+                job.status = "Queued"
+        self.jobs.update_many(jobs)
+
+        return {"id": sweep_id,
+                "case_id": case_id,
+                "backend_identifier": backend_identifier,
+                "status": "Queued" if identifiers else ERROR_STATUS,
+                "stdout": out,
+                "stderr": err,
+                "exit_code": exit_code,
+                "jobs": job_links}, 200
+
+
 class ThumbnailApi(Resource):
     """API endpoint called to return static files (GET)"""
     def __init__(self, **kwargs):
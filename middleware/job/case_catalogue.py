@@ -0,0 +1,116 @@
+import hashlib
+import json
+import threading
+import arrow
+from uuid import uuid4
+from sqlalchemy import event
+from middleware.job.models import (Case, JobTemplate, FamilyTemplate,
+                                   ParameterTemplate, TemplateTemplate,
+                                   ScriptTemplate, InputTemplate,
+                                   OutputTemplate, case_to_job, job_uri)
+from middleware.job.schema import job_to_json, case_to_summary_json
+
+# Models whose tables make up the case catalogue. Any insert, update or delete
+# of one of these through the ORM invalidates every catalogue.
+CASE_MODELS = [Case, JobTemplate, FamilyTemplate, ParameterTemplate,
+               TemplateTemplate, ScriptTemplate, InputTemplate, OutputTemplate]
+
+_version_lock = threading.Lock()
+_case_table_version = 0
+
+
+def case_table_version():
+    return _case_table_version
+
+
+def _case_table_changed(mapper, connection, target):
+    global _case_table_version
+    with _version_lock:
+        _case_table_version += 1
+
+
+for model in CASE_MODELS:
+    for change in ["after_insert", "after_update", "after_delete"]:
+        event.listen(model, change, _case_table_changed)
+
+
+def _label_order(case_json):
+    # Order by label with null labels last, then by id, as jobs are paged
+    return (case_json["label"] is None, case_json["label"] or "",
+            case_json["id"])
+
+
+class CaseCatalogue(object):
+    """
+    In-memory cache of the case catalogue. Holds the summary JSON of every
+    case and the JSON of the job built from each case template, so the case
+    endpoints are served without querying the database or serialising.
+
+    Cases are only loaded at startup, so the catalogue is built on first use
+    and rebuilt only after the case tables are changed through the ORM. Bulk
+    query updates and deletes bypass the ORM events and are not detected.
+    """
+
+    def __init__(self, case_repository):
+        self.cases = case_repository
+        self._lock = threading.Lock()
+        self._version = None
+        self._summaries = []
+        self._job_json = {}
+        self._etag = None
+        self._built_at = None
+
+    def _refresh(self):
+        with self._lock:
+            version = case_table_version()
+            if self._version == version:
+                return
+            summaries = []
+            job_json = {}
+            for case_id in self.cases.list_ids():
+                case = self.cases.get_by_id(case_id)
+                summaries.append(case_to_summary_json(case))
+                job_json[case_id] = job_to_json(case_to_job(case))
+            self._summaries = sorted(summaries, key=_label_order)
+            self._job_json = job_json
+            content = json.dumps([self._summaries, job_json], sort_keys=True)
+            self._etag = hashlib.sha256(content.encode("utf-8")).hexdigest()
+            self._built_at = arrow.utcnow()
+            self._version = version
+
+    def validators(self):
+        """
+        Return an entity tag identifying the content of the catalogue and the
+        time the catalogue was built, for use in conditional requests.
+        """
+        self._refresh()
+        return self._etag, self._built_at
+
+    def summaries(self, limit=None, after=None):
+        """
+        Return case summary JSON ordered by label, starting after the
+        (label, id) position `after` if given.
+        """
+        self._refresh()
+        summaries = self._summaries
+        if after is not None:
+            position = _label_order({"label": after[0], "id": after[1]})
+            summaries = [summary for summary in summaries
+                         if _label_order(summary) > position]
+        if limit is not None:
+            summaries = summaries[:limit]
+        return summaries
+
+    def job_json(self, case_id):
+        """
+        Return the JSON of a new job built from a case, with a fresh job id,
+        or None if there is no such case.
+        """
+        self._refresh()
+        template_json = self._job_json.get(case_id)
+        if template_json is None:
+            return None
+        job_json = dict(template_json)
+        job_json["id"] = str(uuid4())
+        job_json["uri"] = job_uri(job_json["id"])
+        return job_json
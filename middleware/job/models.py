@@ -1,7 +1,7 @@
 from middleware.database import db
 from uuid import uuid4
 from sqlalchemy_utils import ArrowType
-from config.base import MIDDLEWARE_URL, URI_STEMS
+from config.base import MIDDLEWARE_URL, URI_STEMS, JOB_COLLECTION_LOADING
 
 
 class Case(db.Model):
@@ -29,15 +29,20 @@ class JobTemplate(db.Model):
     user = db.Column(db.String)
 
     families = db.relationship(
-        "FamilyTemplate", back_populates="job", lazy="joined")
+        "FamilyTemplate", back_populates="job",
+        lazy=JOB_COLLECTION_LOADING)
     templates = db.relationship(
-        "TemplateTemplate", back_populates="job", lazy="joined")
+        "TemplateTemplate", back_populates="job",
+        lazy=JOB_COLLECTION_LOADING)
     scripts = db.relationship(
-        "ScriptTemplate", back_populates="job", lazy="joined")
+        "ScriptTemplate", back_populates="job",
+        lazy=JOB_COLLECTION_LOADING)
     inputs = db.relationship(
-        "InputTemplate", back_populates="job", lazy="joined")
+        "InputTemplate", back_populates="job",
+        lazy=JOB_COLLECTION_LOADING)
     outputs = db.relationship(
-        "OutputTemplate", back_populates="job", lazy="joined")
+        "OutputTemplate", back_populates="job",
+        lazy=JOB_COLLECTION_LOADING)
 
     def __init__(
             self,
@@ -80,31 +85,55 @@ class JobTemplate(db.Model):
 
 
 class Job(db.Model):
+    # Support paging through jobs ordered by each of the datetime fields
+    __table_args__ = (
+        db.Index('ix_job_creation_datetime_id', 'creation_datetime', 'id'),
+        db.Index('ix_job_start_datetime_id', 'start_datetime', 'id'),
+        db.Index('ix_job_end_datetime_id', 'end_datetime', 'id'),
+    )
+
     id = db.Column(db.String, primary_key=True)
 
     backend_identifier = db.Column(db.String)
     description = db.Column(db.String)
     name = db.Column(db.String)
-    status = db.Column(db.String)
+    status = db.Column(db.String, index=True)
     uri = db.Column(db.String)
-    user = db.Column(db.String)
+    user = db.Column(db.String, index=True)
 
     creation_datetime = db.Column(ArrowType)
     start_datetime = db.Column(ArrowType)
     end_datetime = db.Column(ArrowType)
+    # when the status was last checked against the compute backend
+    status_checked_at = db.Column(ArrowType)
+    # fingerprint of the inputs to the last successful setup of the job
+    setup_fingerprint = db.Column(db.String)
+    # hash of everything that determines the job's results, so a Complete
+    # job with the same hash can stand in for running it again
+    parameter_hash = db.Column(db.String, index=True)
+    # when the job was last queued to be set up or submitted
+    submitted_at = db.Column(ArrowType)
+    # incremented each time the job is saved, so serves as the job's ETag
+    version = db.Column(db.Integer, nullable=False, default=1)
 
     families = db.relationship(
-        "Family", back_populates="job", lazy="joined")
+        "Family", back_populates="job",
+        lazy=JOB_COLLECTION_LOADING)
     templates = db.relationship(
-        "Template", back_populates="job", lazy="joined")
+        "Template", back_populates="job",
+        lazy=JOB_COLLECTION_LOADING)
     scripts = db.relationship(
-        "Script", back_populates="job", lazy="joined")
+        "Script", back_populates="job",
+        lazy=JOB_COLLECTION_LOADING)
     inputs = db.relationship(
-        "Input", back_populates="job", lazy="joined")
+        "Input", back_populates="job",
+        lazy=JOB_COLLECTION_LOADING)
     outputs = db.relationship(
-        "Output", back_populates="job", lazy="joined")
+        "Output", back_populates="job",
+        lazy=JOB_COLLECTION_LOADING)
 
-    case_id = db.Column(db.Integer, db.ForeignKey('case_summary._id'))
+    case_id = db.Column(db.Integer, db.ForeignKey('case_summary._id'),
+                        index=True)
     case = db.relationship("CaseSummary", back_populates="jobs", lazy="joined")
 
     def __init__(
@@ -119,6 +148,9 @@ class Job(db.Model):
             creation_datetime=None,
             start_datetime=None,
             end_datetime=None,
+            status_checked_at=None,
+            setup_fingerprint=None,
+            parameter_hash=None,
             families=[],
             templates=[],
             scripts=[],
@@ -145,6 +177,9 @@ class Job(db.Model):
         self.creation_datetime = creation_datetime
         self.start_datetime = start_datetime
         self.end_datetime = end_datetime
+        self.status_checked_at = status_checked_at
+        self.setup_fingerprint = setup_fingerprint
+        self.parameter_hash = parameter_hash
 
         # list fields
         self.families = families
@@ -192,7 +227,7 @@ class FamilyTemplate(db.Model):
     name = db.Column(db.String)
 
     parameters = db.relationship("ParameterTemplate", back_populates="family",
-                                 lazy="joined")
+                                 lazy=JOB_COLLECTION_LOADING)
 
     def __eq__(self, other):
         if isinstance(other, self.__class__):
@@ -238,7 +273,7 @@ class Family(db.Model):
     job = db.relationship("Job", back_populates="families")
 
     parameters = db.relationship("Parameter", back_populates="family",
-                                 lazy="joined")
+                                 lazy=JOB_COLLECTION_LOADING)
 
     def __eq__(self, other):
         if isinstance(other, self.__class__):
@@ -671,7 +706,7 @@ class Output(db.Model):
 
 class CaseSummary(db.Model):
     _id = db.Column(db.Integer, primary_key=True)
-    id = db.Column(db.String)
+    id = db.Column(db.String, index=True)
     jobs = db.relationship("Job", back_populates="case")
 
     uri = db.Column(db.String)
@@ -749,14 +784,16 @@ def output_template_to_output(output_template):
     return output_
 
 
+def job_uri(job_id):
+    return "{}{}/{}".format(MIDDLEWARE_URL, URI_STEMS['jobs'], job_id)
+
+
 def case_to_job(case, job_id=None):
     job = Job(job_id)
     job.description = case.job.description
     job.name = case.job.name
     job.user = case.job.user
-    job.uri = "{}{}/{}".format(MIDDLEWARE_URL,
-                               URI_STEMS['jobs'],
-                               job.id)
+    job.uri = job_uri(job.id)
 
     job.case = CaseSummary(
         id=case.id,
@@ -784,6 +821,11 @@ def case_to_job(case, job_id=None):
     return job
 
 
+# Fields kept by the middleware that are not part of the job JSON at all, so
+# must be carried over when a job is replaced from JSON
+INTERNAL_JOB_FIELDS = ["setup_fingerprint", "parameter_hash"]
+
+
 def copy_job_fields(source, destination, fields):
     for field in fields:
         try:
@@ -0,0 +1,80 @@
+import base64
+import json
+import arrow
+from arrow.parser import ParserError
+
+# Job fields that listings can be sorted by
+JOB_SORT_FIELDS = ['creation_datetime', 'start_datetime', 'end_datetime']
+
+
+class PaginationError(ValueError):
+    """Raised when listing query parameters cannot be understood"""
+    pass
+
+
+def encode_cursor(sort_value, id):
+    """
+    Encode the position of the last item on a page as an opaque string. The
+    cursor holds the item's sort value and id so the next page can continue
+    from that position without an offset.
+    """
+    if sort_value is not None and not isinstance(sort_value, str):
+        sort_value = sort_value.isoformat()
+    position = json.dumps([sort_value, id]).encode("utf-8")
+    return base64.urlsafe_b64encode(position).decode("ascii")
+
+
+def decode_cursor(cursor):
+    try:
+        position = json.loads(
+            base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8"))
+    except (ValueError, TypeError, UnicodeError):
+        raise PaginationError("Invalid cursor")
+    if not (isinstance(position, list) and len(position) == 2 and
+            isinstance(position[0], (str, type(None))) and
+            isinstance(position[1], str)):
+        raise PaginationError("Invalid cursor")
+    return position[0], position[1]
+
+
+def datetime_cursor(after):
+    """
+    Convert the sort value of a decoded cursor into a datetime, for listings
+    sorted by a datetime column
+    """
+    if after is None or after[0] is None:
+        return after
+    try:
+        return arrow.get(after[0]), after[1]
+    except (ParserError, ValueError, TypeError):
+        raise PaginationError("Invalid cursor")
+
+
+def parse_limit(limit, max_limit):
+    if limit is None:
+        return None
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise PaginationError("Limit must be an integer")
+    if limit < 1:
+        raise PaginationError("Limit must be at least 1")
+    return min(limit, max_limit)
+
+
+def parse_datetime(value, name):
+    if value is None:
+        return None
+    try:
+        return arrow.get(value)
+    except (ParserError, ValueError, TypeError):
+        raise PaginationError("{} is not a valid datetime".format(name))
+
+
+def parse_sort(sort, order):
+    if sort not in JOB_SORT_FIELDS:
+        raise PaginationError("Jobs can only be sorted by {}".format(
+            ", ".join(JOB_SORT_FIELDS)))
+    if order not in ["asc", "desc"]:
+        raise PaginationError("Sort order must be asc or desc")
+    return sort, order == "desc"
@@ -0,0 +1,128 @@
+import copy
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Call(object):
+    """A script execution in progress, shared by identical requests"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+
+class ResultCache(object):
+    """
+    Cache of the results of a job's PROGRESS and DATA scripts, so repeated
+    requests for the same job do not each run the script over SSH.
+
+    Results for Running jobs expire after running_ttl seconds and results for
+    Complete jobs are kept until evicted. Entries are only used while the job
+    has the status they were cached under, and results for jobs in any other
+    status are never cached. Only successful runs of a script are cached.
+    The results of a job should be invalidated when it is set up or run
+    again, as they no longer describe the job.
+
+    Concurrent requests for the same result share a single execution of the
+    script. At most max_entries results, taking up at most max_bytes when
+    serialised as JSON, are kept, evicting the least recently used first.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=32 * 1024 * 1024,
+                 running_ttl=5, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # Time to live of results by job status, None meaning no expiry
+        self.ttls = {"Running": running_ttl, "Complete": None}
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._size = 0
+        self._calls = {}
+
+    def _lookup(self, key, status):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        entry_status, expires_at, result, size = entry
+        if entry_status != status or (expires_at is not None and
+                                      self._clock() >= expires_at):
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return result
+
+    def _remove(self, key):
+        self._size -= self._entries.pop(key)[3]
+
+    def _store(self, key, status, result):
+        size = len(json.dumps(result, default=str))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        ttl = self.ttls[status]
+        expires_at = None if ttl is None else self._clock() + ttl
+        self._entries[key] = (status, expires_at, result, size)
+        self._size += size
+        while (len(self._entries) > self.max_entries or
+               self._size > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+
+    def invalidate(self, job_id):
+        """
+        Forget the cached results of a job, including those of scripts still
+        running, which are returned to their callers but not kept
+        """
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == job_id]:
+                self._remove(key)
+            for key in [key for key in self._calls if key[0] == job_id]:
+                del self._calls[key]
+
+    def get(self, job, action, arguments, run):
+        """
+        Return the (result, code) of running the job's `action` script with
+        `arguments`, calling run() to execute the script when there is no
+        cached result. Callers are given their own copy of the result, which
+        they are free to modify.
+        """
+        if job.status not in self.ttls:
+            return run()
+        key = (job.id, action, tuple(arguments))
+        status = job.status
+
+        with self._lock:
+            cached = self._lookup(key, status)
+            if cached is not None:
+                return copy.deepcopy(cached)
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.result is not None:
+                return copy.deepcopy(call.result)
+            return run()  # the shared execution failed
+
+        try:
+            result, code = run()
+            call.result = copy.deepcopy((result, code))
+            with self._lock:
+                # Unless the job's results were invalidated in the meantime
+                if (self._calls.get(key) is call and code == 200 and
+                        result.get("exit_code") == 0):
+                    self._store(key, status, call.result)
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+            call.done.set()
+        return result, code
+
+    def __len__(self):
+        return len(self._entries)
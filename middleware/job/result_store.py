@@ -0,0 +1,167 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from middleware.job_information_manager import job_information_manager as JIM
+
+# Actions whose final output is kept once a job is Complete
+STORED_ACTIONS = ["PROGRESS", "DATA"]
+
+
+class ResultStore(object):
+    """
+    Local store of the final PROGRESS and DATA results of Complete jobs, so
+    they are served without running the scripts on the cluster and survive
+    the job's working directory being purged.
+
+    Each result is kept as the gzipped JSON of the script's result
+    ({"stdout": ..., "stderr": ..., "exit_code": ...}), in the file
+    <root>/<SHA-256 of job id>/<action>.json.gz. Job ids come from clients,
+    so are hashed rather than used as paths.
+
+    A result that could not be pulled is not tried again for retry_interval
+    seconds, doubling after each further failure up to max_retry_interval.
+    """
+
+    def __init__(self, root, retry_interval=30, max_retry_interval=600,
+                 logger=None, clock=time.monotonic):
+        self.root = root
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self.logger = logger or logging.getLogger(__name__)
+        self._clock = clock
+        self._lock = threading.Lock()
+        # (job id, action): (failures in a row, time of next attempt)
+        self._failures = {}
+
+    def _directory(self, job_id):
+        return os.path.join(self.root, hashlib.sha256(
+            job_id.encode("utf-8")).hexdigest())
+
+    def _path(self, job_id, action):
+        return os.path.join(self._directory(job_id),
+                            "{}.json.gz".format(action.lower()))
+
+    def get(self, job_id, action):
+        """Return the stored result of a job's action script, or None"""
+        try:
+            with gzip.open(self._path(job_id, action), "rt",
+                           encoding="utf-8") as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def put(self, job_id, action, result):
+        path = self._path(job_id, action)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # Write to a temporary file first so readers never see a partly
+        # written result
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as raw, \
+                    gzip.open(raw, "wt", encoding="utf-8") as f:
+                json.dump(result, f)
+            os.replace(temp_path, path)
+        except Exception:
+            os.remove(temp_path)
+            raise
+
+    def delete(self, job_id):
+        shutil.rmtree(self._directory(job_id), ignore_errors=True)
+        with self._lock:
+            for action in STORED_ACTIONS:
+                self._failures.pop((job_id, action), None)
+
+    def _failed(self, job_id, action):
+        with self._lock:
+            failures = self._failures.get((job_id, action), (0, None))[0] + 1
+            delay = min(self.retry_interval * 2 ** (failures - 1),
+                        self.max_retry_interval)
+            self._failures[(job_id, action)] = (failures,
+                                                self._clock() + delay)
+
+    def _backing_off(self, job_id, action):
+        with self._lock:
+            failure = self._failures.get((job_id, action))
+            return failure is not None and self._clock() < failure[1]
+
+    def pull(self, job, job_repository=None, actions=STORED_ACTIONS):
+        """
+        Fetch the final results of a Complete job's action scripts (by
+        default PROGRESS and DATA) from the cluster and store them. Failures
+        are logged and otherwise ignored, so results missing now can be
+        pulled again later. Returns True if every result was stored.
+        """
+        manager = JIM(job, job_repository=job_repository)
+        fetch = {"PROGRESS": manager.progress, "DATA": manager.data}
+        stored = True
+        for action in actions:
+            try:
+                result, code = fetch[action]()
+                if code != 200 or result.get("exit_code") != 0:
+                    self._failed(job.id, action)
+                    stored = False
+                    continue
+                self.put(job.id, action, result)
+                with self._lock:
+                    self._failures.pop((job.id, action), None)
+            except Exception:
+                self.logger.exception("Storing the %s result of job %s "
+                                      "failed", action, job.id)
+                self._failed(job.id, action)
+                stored = False
+        return stored
+
+    def result(self, job, action, job_repository=None):
+        """
+        Return the stored result of a Complete job's action script, pulling
+        it from the cluster if it has not been stored yet and did not fail
+        to be pulled recently. Returns None if there is no stored result.
+        """
+        result = self.get(job.id, action)
+        if result is None and not self._backing_off(job.id, action):
+            self.pull(job, job_repository, actions=[action])
+            result = self.get(job.id, action)
+        return result
+
+    def copy(self, source_job, job_id, job_repository=None):
+        """
+        Store the results of the Complete job source_job as the results of
+        the job job_id. Returns False, storing nothing, unless every result
+        of the source job is available.
+        """
+        results = {}
+        for action in STORED_ACTIONS:
+            results[action] = self.result(source_job, action, job_repository)
+            if results[action] is None:
+                return False
+        for action, result in results.items():
+            self.put(job_id, action, result)
+        return True
+
+
+def data_after_cursor(result, cursor):
+    """
+    Return a stored DATA result as it would be returned by the DATA script
+    for the given cursor, or None if it cannot be worked out from the stored
+    result. Only cursors before the first row and the final cursor are known.
+    """
+    output = result.get("stdout")
+    if not isinstance(output, dict) or "data" not in output:
+        return None
+    if cursor is None or cursor <= output.get("offset", 0):
+        return result
+    if cursor != output.get("cursor"):
+        return None
+    # Every row has already been read
+    data = dict(output["data"])
+    for key in data.get("keys", []):
+        data[key] = []
+    output = dict(output, data=data, offset=cursor)
+    return dict(result, stdout=output)
@@ -89,6 +89,7 @@ class JobSchema(ma.ModelSchema):
                   'creation_datetime',
                   'start_datetime',
                   'end_datetime',
+                  'status_checked_at',
                   'families',
                   'templates',
                   'scripts',
@@ -135,6 +136,12 @@ class JobSchema(ma.ModelSchema):
         else:
             end_datetime = None
 
+        data_status_checked_at = data.get("status_checked_at")
+        if data_status_checked_at:
+            status_checked_at = arrow.get(data_status_checked_at)
+        else:
+            status_checked_at = None
+
         job = Job(
             id=data.get("id"),
             backend_identifier=data.get("backend_identifier"),
@@ -146,6 +153,7 @@ class JobSchema(ma.ModelSchema):
             creation_datetime=creation_datetime,
             start_datetime=start_datetime,
             end_datetime=end_datetime,
+            status_checked_at=status_checked_at,
             families=families,
             templates=templates,
             scripts=scripts,
@@ -166,6 +174,7 @@ class JobSummarySchema(ma.ModelSchema):
                   'creation_datetime',
                   'start_datetime',
                   'end_datetime',
+                  'status_checked_at',
                   'case'
                   )
     case = ma.Nested('CaseSummarySchema')
@@ -1,5 +1,66 @@
+from types import SimpleNamespace
+import arrow
+from sqlalchemy import or_, func
 from middleware.job.models import Job
 from middleware.job.models import Case
+from middleware.job.models import CaseSummary
+
+# Columns needed to build a job summary, plus the backend identifier so that
+# statuses can be refreshed without loading the full job
+JOB_SUMMARY_COLUMNS = ['id', 'uri', 'description', 'name', 'status',
+                       'backend_identifier', 'creation_datetime',
+                       'start_datetime', 'end_datetime', 'status_checked_at']
+CASE_SUMMARY_COLUMNS = ['id', 'uri', 'label', 'thumbnail', 'description']
+
+
+def keyset_page(query, sort_column, id_column, after=None, descending=False,
+                limit=None):
+    """
+    Return the page of rows of a query following the `after` position, a
+    (sort value, id) pair taken from the last row of the previous page, in
+    order of a (possibly null) sort column with the id column as a
+    tie-breaker. Null sort values always come last. Seeking to a position
+    rather than using an offset keeps later pages as cheap to fetch as the
+    first.
+
+    Rows with a sort value and rows without are fetched as two separate runs,
+    ordered by (sort value, id) and by id respectively, so an index on
+    (sort column, id) gives the order of both without sorting any rows.
+    """
+    def later(column, value):
+        return column < value if descending else column > value
+
+    def ordered(column):
+        return column.desc() if descending else column
+
+    rows = []
+    if after is None or after[0] is not None:
+        page = query.filter(sort_column.isnot(None))
+        if after is not None:
+            value, id = after
+            # The bound on the sort column alone lets the index be used
+            page = page.filter(
+                sort_column <= value if descending else sort_column >= value,
+                or_(later(sort_column, value), later(id_column, id)))
+        page = page.order_by(ordered(sort_column), ordered(id_column))
+        if limit is not None:
+            page = page.limit(limit)
+        rows = page.all()
+    if limit is None or len(rows) < limit:
+        page = query.filter(sort_column.is_(None))
+        if after is not None and after[0] is None:
+            page = page.filter(later(id_column, after[1]))
+        page = page.order_by(ordered(id_column))
+        if limit is not None:
+            page = page.limit(limit - len(rows))
+        rows += page.all()
+    return rows
+
+
+def next_version():
+    # Increment the version of a job in the database as part of saving it,
+    # rather than from the (possibly stale) version held in memory
+    return func.coalesce(Job.version, 0) + 1
 
 
 class JobRepositorySqlAlchemy():
@@ -26,15 +87,32 @@ class JobRepositorySqlAlchemy():
     def get_by_id(self, job_id):
         return self._session.query(Job).filter_by(id=job_id).first()
 
+    def create_many(self, jobs):
+        # Add new jobs in a single transaction. The caller makes sure that
+        # the job ids are new.
+        self._session.add_all(jobs)
+        self._session.commit()
+        return jobs
+
     def update(self, job):
         job_id = job.id
         if self.exists(job_id):
+            job.version = next_version()
             self._session.merge(job)
             self._session.commit()
         # Return result of querying repo for Job. This will be None if the Job
         # did not already exist in the repo and the updated Job if it did
         return self.get_by_id(job_id)
 
+    def update_many(self, jobs):
+        # Save changes to jobs already in the repository in a single
+        # transaction
+        for job in jobs:
+            job.version = next_version()
+            self._session.merge(job)
+        self._session.commit()
+        return jobs
+
     def delete(self, job_id):
         if self.exists(job_id):
             # If job exists, remove job from dictionary and return removed job
@@ -49,6 +127,91 @@ class JobRepositorySqlAlchemy():
         # elements when we put Job.id in the query
         return [id[0] for id in self._session.query(Job.id)]
 
+    def list_summaries(self, limit=None, after=None, status=None, user=None,
+                       case_id=None, created_after=None, created_before=None,
+                       sort="creation_datetime", descending=False):
+        """
+        Return a lightweight summary of jobs, selecting only the job summary
+        columns and the case summary in a single query rather than loading
+        each full job with all of its child objects.
+
+        Filtering, sorting and paging are all done in the database. `status`
+        may be a single status or a list of statuses. `after` is the
+        (sort value, id) position of the last job on the previous page.
+        """
+        columns = [getattr(Job, name) for name in JOB_SUMMARY_COLUMNS]
+        case_columns = [getattr(CaseSummary, name).label('case_' + name)
+                        for name in CASE_SUMMARY_COLUMNS]
+        # The case primary key tells jobs without a case apart in the join
+        case_columns.append(CaseSummary._id.label('case_pk'))
+        query = self._session.query(*(columns + case_columns))\
+            .outerjoin(Job.case)
+
+        if status is not None:
+            if isinstance(status, str):
+                status = [status]
+            query = query.filter(Job.status.in_(status))
+        if user is not None:
+            query = query.filter(Job.user == user)
+        if case_id is not None:
+            query = query.filter(CaseSummary.id == case_id)
+        if created_after is not None:
+            query = query.filter(Job.creation_datetime >= created_after)
+        if created_before is not None:
+            query = query.filter(Job.creation_datetime < created_before)
+
+        if after is not None and after[0] is not None:
+            # Cursor positions hold datetimes as strings
+            after = (arrow.get(after[0]), after[1])
+        rows = keyset_page(query, getattr(Job, sort), Job.id, after=after,
+                           descending=descending, limit=limit)
+
+        summaries = []
+        for row in rows:
+            summary = SimpleNamespace(
+                **{name: getattr(row, name) for name in JOB_SUMMARY_COLUMNS})
+            if row.case_pk is None:
+                summary.case = None
+            else:
+                summary.case = SimpleNamespace(
+                    **{name: getattr(row, 'case_' + name)
+                       for name in CASE_SUMMARY_COLUMNS})
+            summaries.append(summary)
+        return summaries
+
+    def list_by_status(self, statuses):
+        return self._session.query(Job).filter(Job.status.in_(statuses)).all()
+
+    def find_by_parameter_hash(self, parameter_hash, status=None,
+                               exclude_id=None):
+        """
+        Return the most recently finished job with the given parameter hash
+        (and status, if given), other than the job exclude_id, or None.
+        """
+        query = self._session.query(Job).filter(
+            Job.parameter_hash == parameter_hash)
+        if status is not None:
+            query = query.filter(Job.status == status)
+        if exclude_id is not None:
+            query = query.filter(Job.id != exclude_id)
+        return query.order_by(Job.end_datetime.is_(None),
+                              Job.end_datetime.desc()).first()
+
+    def update_status(self, job_id, status, status_checked_at=None,
+                      submitted_at=None):
+        # Update just the status columns rather than merging the whole job.
+        # The times the status was checked and the job was submitted are
+        # only changed if given.
+        values = {"status": status, "version": next_version()}
+        if status_checked_at is not None:
+            values["status_checked_at"] = status_checked_at
+        if submitted_at is not None:
+            values["submitted_at"] = submitted_at
+        count = self._session.query(Job).filter_by(id=job_id).update(
+            values, synchronize_session="fetch")
+        self._session.commit()
+        return count > 0
+
 
 class CaseRepositorySqlAlchemy():
     """Case service backed by an SQLAlchemy provided database.
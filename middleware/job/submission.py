@@ -0,0 +1,108 @@
+import threading
+import arrow
+from concurrent.futures import ThreadPoolExecutor
+from middleware.job_information_manager import job_information_manager as JIM
+
+# Status of a job while it is waiting for or being set up and submitted
+SUBMITTING_STATUS = "Submitting"
+# Status of a job whose setup or submission failed
+ERROR_STATUS = "Error"
+
+
+class SubmissionQueueFull(Exception):
+    pass
+
+
+class SubmissionQueue(object):
+    """
+    Bounded pool of worker threads that set up and submit jobs, so the
+    template patching, file transfers and remote scripts involved happen
+    outside of the HTTP request.
+
+    A job is marked as Submitting when it is queued. A job that is run moves
+    on to Queued once the scheduler accepts it, and a job that is only set
+    up goes back to its previous status. If anything fails the job is marked
+    as Error. A job without a SETUP script is set up once its files have
+    been copied. At most max_pending jobs may be waiting or in progress at
+    once.
+    """
+
+    def __init__(self, app, job_repository, max_workers=4, max_pending=32):
+        self.app = app
+        self.jobs = job_repository
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def submit(self, job_id, action):
+        """
+        Queue the SETUP or RUN action for a job, returning a future of the
+        action's (result, code). Raises SubmissionQueueFull if too many jobs
+        are already waiting.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise SubmissionQueueFull("Too many jobs are waiting to be "
+                                      "submitted")
+        try:
+            previous_status = self.jobs.get_by_id(job_id).status
+            self.jobs.update_status(job_id, SUBMITTING_STATUS,
+                                    submitted_at=arrow.utcnow())
+            return self._executor.submit(self._process, job_id, action,
+                                         previous_status)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _process(self, job_id, action, previous_status):
+        try:
+            with self.app.app_context():
+                job = self.jobs.get_by_id(job_id)
+                manager = JIM(job, job_repository=self.jobs)
+                try:
+                    if action == "RUN":
+                        result, code = manager.run()
+                    else:
+                        result, code = manager.setup()
+                except Exception as e:
+                    self.app.logger.exception("%s of job %s failed", action,
+                                              job_id)
+                    result, code = {"message": str(e)}, 500
+
+                failed = (code != 200 or
+                          result.get("exit_code") not in [0, None])
+                if (failed and code == 400 and action != "RUN" and
+                        not manager.has_action_script("SETUP")):
+                    # Only the SETUP script was missing
+                    failed = False
+                status = self.jobs.get_by_id(job_id).status
+                if failed:
+                    status = ERROR_STATUS
+                elif action == "RUN" and status == SUBMITTING_STATUS:
+                    # The scheduler did not return a backend identifier
+                    status = ERROR_STATUS
+                elif action != "RUN":
+                    status = previous_status
+                self.jobs.update_status(job_id, status)
+                return result, code
+        finally:
+            self._slots.release()
+
+    def recover(self, timeout):
+        """
+        Mark jobs that have been Submitting for longer than timeout seconds as
+        Error, as the middleware process that queued them must have stopped
+        before setting them up or submitting them. More recent jobs are left
+        alone, as other processes sharing the database (e.g. under IIS
+        FastCGI) may still be working on them. Returns the number of jobs
+        marked.
+        """
+        cutoff = arrow.utcnow().shift(seconds=-timeout)
+        with self.app.app_context():
+            jobs = [job for job in
+                    self.jobs.list_by_status([SUBMITTING_STATUS])
+                    if job.submitted_at is None or job.submitted_at < cutoff]
+            for job in jobs:
+                self.jobs.update_status(job.id, ERROR_STATUS)
+        return len(jobs)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,285 @@
+import copy
+import hashlib
+import itertools
+import posixpath
+import re
+import shlex
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation
+import arrow
+from uuid import uuid4
+from middleware.job.models import job_uri
+from middleware.job.schema import json_to_job
+from middleware.job_information_manager import (
+    job_information_manager as JIM, RenderedTemplate, pooled_connection,
+    map_on, file_content, unix_line_endings, objects_to_archive)
+from config.base import (SSH_COMMAND_TIMEOUT, SETUP_CONCURRENCY,
+                         CAS_DIRECTORY, SWEEP_JOB_SCRIPT)
+
+
+class SweepError(Exception):
+    """Raised when a sweep request cannot be carried out"""
+
+
+def parameter_values(name, parameter, value_range, max_count):
+    """
+    Return the values of a swept parameter, as strings, from min_value to
+    max_value inclusive in steps of step. Any of these not given in
+    value_range are taken from the parameter itself, i.e. from the case's
+    parameter template. Decimal arithmetic is used so values such as 0.1 are
+    stepped exactly.
+    """
+    bounds = []
+    for field in ["min_value", "max_value", "step"]:
+        value = value_range.get(field, parameter.get(field))
+        try:
+            value = Decimal(str(value))
+        except (InvalidOperation, ValueError):
+            value = None
+        if value is None or not value.is_finite():
+            raise SweepError("Parameter {} has an invalid {}".format(
+                name, field))
+        bounds.append(value)
+    min_value, max_value, step = bounds
+    if step <= 0:
+        raise SweepError("Parameter {} must have a positive step".format(
+            name))
+    if min_value > max_value:
+        raise SweepError("Parameter {} has a min_value greater than its "
+                         "max_value".format(name))
+    count = int((max_value - min_value) / step) + 1
+    if count > max_count:
+        raise SweepError("Parameter {} has more than {} values".format(
+            name, max_count))
+    return [str(min_value + i * step) for i in range(count)]
+
+
+def sweep_points(job_json, ranges, max_jobs):
+    """
+    Return the parameter values of each job in a sweep of a case's job: one
+    {parameter name: value} dictionary for every combination of the values
+    of the swept parameters. ranges maps the name of each swept parameter to
+    its (possibly empty) range, e.g. {"tank_radius": {"max_value": "0.05"}}.
+    """
+    if not isinstance(ranges, dict) or not ranges:
+        raise SweepError("At least one parameter must be swept")
+    parameters = {parameter["name"]: parameter
+                  for family in job_json.get("families") or []
+                  for parameter in family.get("parameters") or []}
+    names = sorted(ranges)
+    values = []
+    for name in names:
+        if name not in parameters:
+            raise SweepError("Parameter {} not found in case".format(name))
+        value_range = ranges[name] or {}
+        if not isinstance(value_range, dict):
+            raise SweepError("Range of parameter {} must be an "
+                             "object".format(name))
+        values.append(parameter_values(name, parameters[name], value_range,
+                                       max_jobs))
+
+    size = 1
+    for parameter_values_list in values:
+        size *= len(parameter_values_list)
+    if size > max_jobs:
+        raise SweepError("Sweep of {} jobs is larger than the maximum of "
+                         "{}".format(size, max_jobs))
+    return [dict(zip(names, point)) for point in itertools.product(*values)]
+
+
+def check_job_script(job_json, job_script=SWEEP_JOB_SCRIPT):
+    """Check that a case's job has the script each array subjob runs"""
+    names = [posixpath.basename(script.get("source_uri") or "")
+             for script in job_json.get("scripts") or []]
+    if job_script not in names:
+        raise SweepError("Case has no {} script to run in a job "
+                         "array".format(job_script))
+
+
+def sweep_jobs(job_json, points):
+    """Build a new Draft job from a case's job for each point of a sweep"""
+    created = arrow.utcnow()
+    jobs = []
+    for point in points:
+        variant = copy.deepcopy(job_json)
+        variant["id"] = str(uuid4())
+        variant["uri"] = job_uri(variant["id"])
+        variant["name"] = "{} ({})".format(variant.get("name"), ", ".join(
+            "{}={}".format(name, value)
+            for name, value in sorted(point.items())))
+        for family in variant.get("families") or []:
+            for parameter in family.get("parameters") or []:
+                if parameter["name"] in point:
+                    parameter["value"] = point[parameter["name"]]
+        job = json_to_job(variant)
+        job.creation_datetime = created
+        job.status = "Draft"
+        jobs.append(job)
+    return jobs
+
+
+def array_directives(job_script_content):
+    """
+    Return the #PBS directives of a job script to give each subjob of an
+    array job, and the file the script's output is sent to with -o, if any.
+    The -o and -e options are left out, as every subjob would write to the
+    same file, and so is -J, as the sweep sets the range of the array.
+    """
+    directives = []
+    output_name = None
+    for line in job_script_content.decode("utf-8", "replace").splitlines():
+        if not line.startswith("#PBS"):
+            continue
+        try:
+            options = shlex.split(line[len("#PBS"):])
+        except ValueError:
+            options = []
+        option = options[0] if options else ""
+        if option[:2] in ["-o", "-e", "-J"]:
+            value = option[2:] or (options[1] if len(options) > 1 else "")
+            if option[:2] == "-o" and value:
+                output_name = posixpath.basename(value)
+            continue
+        directives.append(line)
+    return directives, output_name
+
+
+def sweep_upload(sweep_id, jobs, job_script=SWEEP_JOB_SCRIPT):
+    """
+    Render the templates of every job in a sweep and pack everything needed
+    to run the sweep into one tar archive. Returns the archive and the remote
+    command which unpacks it and submits the sweep as a single PBS array job.
+
+    Files are stored once per distinct content in the content addressed
+    store (SIM_ROOT/CAS_DIRECTORY) and copied into each job's directory, so
+    scripts and inputs shared by every job are only uploaded once, while
+    each job gets files of its own to change. The sweep directory
+    (SIM_ROOT/sweep-<sweep id>) holds the scripts that copy the files, run
+    each job's SETUP script and, in each subjob, run job_script in the
+    directory of the job given by PBS_ARRAY_INDEX, writing its output to
+    the file of the job script's -o option in that directory.
+    """
+    managers = [JIM(job) for job in jobs]
+    with ThreadPoolExecutor(max_workers=SETUP_CONCURRENCY) as executor:
+        map_on(executor, lambda manager: manager.patch_all_templates(),
+               managers)
+
+    simulation_root = managers[0].simulation_root
+    store_path = posixpath.join(simulation_root, CAS_DIRECTORY)
+    sweep_path = posixpath.join(simulation_root, "sweep-{}".format(sweep_id))
+
+    hashed_files = {}
+
+    def hashed_content(file_object):
+        # Files on disk are the same for every job, so are only read once
+        if isinstance(file_object, RenderedTemplate):
+            content = unix_line_endings(file_object.content)
+            return hashlib.sha256(content).hexdigest(), content
+        if file_object.source_uri not in hashed_files:
+            content = unix_line_endings(file_content(file_object))
+            hashed_files[file_object.source_uri] = (
+                hashlib.sha256(content).hexdigest(), content)
+        return hashed_files[file_object.source_uri]
+
+    objects = {}
+    directories = set()
+    copies = []
+    setup_lines = ["#!/bin/bash", "set -e"]
+    job_directories = []
+    for manager in managers:
+        for file_object in manager._files_to_transfer():
+            digest, content = hashed_content(file_object)
+            objects[digest] = content
+            destination = posixpath.join(
+                manager.job_working_directory_path,
+                manager._destination_name(file_object))
+            directories.add(posixpath.dirname(destination))
+            copies.append("cp {} {}".format(
+                shlex.quote(posixpath.join(store_path, digest)),
+                shlex.quote(destination)))
+
+        scripts = {posixpath.basename(script.source_uri): script
+                   for script in manager.script_list}
+        job_directories.append(posixpath.normpath(posixpath.join(
+            manager.job_working_directory_path,
+            scripts[job_script].destination_path or "")))
+        for script in manager.script_list:
+            if script.action == "SETUP":
+                setup_lines.append("(cd {} && bash {})".format(
+                    shlex.quote(posixpath.normpath(posixpath.join(
+                        manager.job_working_directory_path,
+                        script.destination_path or ""))),
+                    shlex.quote(posixpath.basename(script.source_uri))))
+                break
+
+    copy_lines = ["#!/bin/bash", "set -e", "mkdir -p {}".format(
+        " ".join(shlex.quote(d) for d in sorted(directories)))] + copies
+    # Subjobs get the scheduler options of the job script
+    directives, output_name = array_directives(
+        hashed_content(scripts[job_script])[1])
+    run_line = "bash {}".format(shlex.quote(job_script))
+    if output_name:
+        run_line += " >{} 2>&1".format(shlex.quote(output_name))
+    jobs_path = posixpath.join(sweep_path, "jobs")
+    array_lines = ["#!/bin/bash"] + directives + [
+        'cd "$(sed -n "${{PBS_ARRAY_INDEX}}p" {})" || exit 1'.format(
+            shlex.quote(jobs_path)),
+        'export PBS_O_WORKDIR="$PWD"',
+        run_line]
+    # The RUN script of a single job keeps the PBS id in pbs_job_id, which
+    # the other action scripts read, so do the same for each subjob
+    id_lines = ["#!/bin/bash",
+                "n=0",
+                "while read -r directory; do",
+                "    n=$((n + 1))",
+                '    echo "${1/\\[\\]/[$n]}" > "$directory/pbs_job_id"',
+                "done < jobs"]
+    sweep_files = {"jobs": job_directories,
+                   "copy.sh": copy_lines,
+                   "setup.sh": setup_lines,
+                   "array.sh": array_lines,
+                   "ids.sh": id_lines}
+    archive_bytes = objects_to_archive(
+        [(posixpath.join("objects", digest), content)
+         for digest, content in sorted(objects.items())] +
+        [(posixpath.join("sweep", name), ("\n".join(lines) + "\n").encode(
+            "utf-8")) for name, lines in sorted(sweep_files.items())])
+
+    command = " && ".join([
+        "mkdir -p {} {}".format(shlex.quote(store_path),
+                                shlex.quote(sweep_path)),
+        "cd {}".format(shlex.quote(sweep_path)),
+        # Unpack into a temporary directory first, so an interrupted upload
+        # never leaves a partial object in the store
+        'tmp=$(mktemp -d tmp.XXXXXX)',
+        'tar -xf - -C "$tmp"',
+        'mv -f "$tmp"/objects/* {}'.format(shlex.quote(store_path)),
+        'mv -f "$tmp"/sweep/* .',
+        'rm -rf "$tmp"',
+        "bash copy.sh",
+        "bash setup.sh >setup.log 2>&1",
+        "id=$(qsub -J 1-{} array.sh)".format(len(jobs)),
+        'bash ids.sh "$id"',
+        'echo "$id"'])
+    return archive_bytes, command
+
+
+def array_backend_identifiers(string, count):
+    """
+    Work out the PBS identifiers of the subjobs of an array job from the
+    identifier printed by qsub, e.g. "1234[].cx1b" gives "1234[1].cx1b",
+    "1234[2].cx1b", ... and "1234[]" gives "1234[1]", ... Returns None if
+    string is not an array job identifier.
+    """
+    match = re.match(r"(\d+)\[\](\.\S+)?$", string.strip())
+    if not match:
+        return None
+    return ["{}[{}]{}".format(match.group(1), index, match.group(2) or "")
+            for index in range(1, count + 1)]
+
+
+def submit_sweep(archive_bytes, command):
+    """Upload a sweep and submit its array job with a single ssh command"""
+    with pooled_connection() as connection:
+        return connection.pass_command(command, timeout=SSH_COMMAND_TIMEOUT,
+                                       stdin_data=archive_bytes)
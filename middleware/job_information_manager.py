@@ -1,12 +1,27 @@
 import os
 import posixpath
-from mako.template import Template as MakoTemplate
-from middleware.job.schema import Template
-from middleware.ssh import ssh
+from middleware.ssh import ConnectionPool
+from middleware.template_cache import TemplateCache
 import re
 import json
+import socket
+import shlex
+import hashlib
+import time
+import tarfile
+from io import BytesIO
+import xml.etree.ElementTree as ET
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from instance.config import *
-from werkzeug.exceptions import ServiceUnavailable
+from config.base import (SSH_POOL_MAX_SIZE, SSH_POOL_IDLE_TIMEOUT,
+                         SSH_POOL_ACQUIRE_TIMEOUT, SSH_KEEPALIVE_INTERVAL,
+                         SSH_MAX_CHANNELS, SSH_COMMAND_TIMEOUT,
+                         FILE_TRANSFER_MODE, CAS_DIRECTORY, CAS_MAX_AGE,
+                         TEMPLATE_CACHE_SIZE, TEMPLATE_MODULE_DIRECTORY,
+                         SETUP_CONCURRENCY)
+from werkzeug.exceptions import (ServiceUnavailable, GatewayTimeout,
+                                 BadGateway)
 
 # precedence for secrets variables is:
 # 1. Via environment varables
@@ -57,6 +72,225 @@ if debug_variables:
     print('SSH_PRIVATE_KEY_PATH', SSH_PRIVATE_KEY_PATH)
     print('SSH_PRIVATE_KEY_STRING', SSH_PRIVATE_KEY_STRING)
 
+# Process-wide pool of ssh connections shared by all job managers, so that
+# successive actions reuse an open connection instead of reconnecting
+connection_pool = ConnectionPool(
+    max_size=SSH_POOL_MAX_SIZE,
+    idle_timeout=SSH_POOL_IDLE_TIMEOUT,
+    acquire_timeout=SSH_POOL_ACQUIRE_TIMEOUT,
+    keepalive=SSH_KEEPALIVE_INTERVAL,
+    max_channels=SSH_MAX_CHANNELS)
+
+# Process-wide cache of compiled templates shared by all job managers
+template_cache = TemplateCache(max_size=TEMPLATE_CACHE_SIZE,
+                               module_directory=TEMPLATE_MODULE_DIRECTORY)
+
+
+@contextmanager
+def pooled_connection(hostname=SSH_HOSTNAME, username=SSH_USR, port=SSH_PORT,
+                      private_key_path=SSH_PRIVATE_KEY_PATH,
+                      private_key_string=SSH_PRIVATE_KEY_STRING):
+    """
+    Borrow a connection to the compute backend from the shared pool, turning
+    connection failures and command timeouts into HTTP errors.
+    """
+    try:
+        connection = connection_pool.acquire(
+            hostname, username, port,
+            private_key_path=private_key_path,
+            private_key_string=private_key_string,
+            debug=True)
+    except Exception:
+        # If connection cannot be made, raise a ServiceUnavailble
+        # exception that will be passed to API client as a HTTP error
+        raise(ServiceUnavailable(
+            description="Unable to connect to backend compute resource"))
+    try:
+        yield connection
+    except socket.timeout:
+        # Remote command did not complete within SSH_COMMAND_TIMEOUT
+        raise(GatewayTimeout(
+            description="Backend compute resource did not respond"))
+    finally:
+        connection_pool.release(connection)
+
+
+def check_transfer(output):
+    """
+    Raise a BadGateway error, which is passed to the API client as an HTTP
+    error, if the (stdout, stderr, exit code) of a command copying files to
+    the backend show that it failed. Returns the output otherwise.
+    """
+    out, err, exit_code = output
+    if exit_code != 0:
+        raise(BadGateway(
+            description="Unable to copy files to backend compute resource: "
+                        "{}".format(err.strip())))
+    return output
+
+
+# Job statuses for which the scheduler needs to be asked for an update
+ACTIVE_JOB_STATUSES = ["Queued", "Running"]
+
+
+def qstat_status_to_job_status(qstat_status):
+    if(qstat_status == 'Q' or qstat_status == 'W'):
+        # Q: Job is	queued, eligable to run or routed.
+        # W: Job is waiting for its	execution time (-a option) to
+        #    be reached.
+        return "Queued"
+    if(qstat_status == 'R'):
+        # R: Job is running
+        return "Running"
+    if(qstat_status == 'C'):
+        # C: Job is completed
+        return "Complete"
+    else:
+        return None
+
+
+def parse_qstat_xml(qstat_xml):
+    """
+    Parse the XML printed by `qstat -x` into a dictionary mapping backend
+    identifiers to single letter job states, e.g. {"93.cx1b": "R"}. Jobs qstat
+    did not report on are absent from the dictionary.
+    """
+    # qstat may print one <Data> document per job, so strip any XML
+    # declarations and wrap everything in a single root element
+    body = re.sub(r"<\?xml[^>]*\?>", "", qstat_xml)
+    try:
+        root = ET.fromstring("<qstat>{}</qstat>".format(body))
+    except ET.ParseError:
+        return {}
+    states = {}
+    for job in root.iter("Job"):
+        job_id = job.findtext("Job_Id")
+        job_state = job.findtext("job_state")
+        if job_id and job_state:
+            states[job_id.strip()] = job_state.strip()
+    return states
+
+
+def backend_job_states(backend_identifiers):
+    """
+    Fetch scheduler states for many jobs with a single `qstat -x` call over a
+    single ssh command, rather than one remote call per job.
+    """
+    backend_identifiers = sorted(set(i for i in backend_identifiers if i))
+    if not backend_identifiers:
+        return {}
+    # Unknown (e.g. long finished) job ids are reported on stderr, the
+    # remaining jobs are still printed on stdout
+    status_cmd = "qstat -x {}".format(
+        " ".join(shlex.quote(i) for i in backend_identifiers))
+    with pooled_connection() as connection:
+        out, err, exit_code = connection.pass_command(
+            status_cmd, timeout=SSH_COMMAND_TIMEOUT)
+    return parse_qstat_xml(out)
+
+
+def job_statuses(jobs):
+    """
+    Work out the current status of each job in a collection, using a single
+    batched qstat call for all jobs that are on the scheduler queue. Returns a
+    dictionary mapping job ids to their (possibly unchanged) status.
+    """
+    active_identifiers = [job.backend_identifier for job in jobs
+                          if job.status in ACTIVE_JOB_STATUSES]
+    states = backend_job_states(active_identifiers)
+    statuses = {}
+    for job in jobs:
+        state = states.get(job.backend_identifier, '')
+        statuses[job.id] = job_status_from_qstat(job.status, state)
+    return statuses
+
+
+def job_status_from_qstat(job_status, qstat_status):
+    """
+    Given a job's last known status and the state reported by qstat, return
+    the job's new status.
+    """
+    if(job_status not in ACTIVE_JOB_STATUSES):
+        # Leave job status unchanged
+        return job_status
+
+    if(qstat_status is not None):
+        # If we get a qstat status, try and convert it to a job status
+        new_job_status = qstat_status_to_job_status(qstat_status)
+    else:
+        # If we have a previous backend status confirming the job was
+        # on the queue, an empty qstat status means the Job has
+        # completed and been removed from the queue.
+        # Note: Jobs only stay on the queue for abour 5 mins after they
+        # complete
+        new_job_status = "Complete"
+
+    if(new_job_status is None):
+        # Leave job status unchanged
+        new_job_status = job_status
+
+    return new_job_status
+
+
+def unix_line_endings(content):
+    """
+    Convert DOS line endings to unix ones, as dos2unix would. Like dos2unix,
+    files that look binary (contain a NUL byte) are left unchanged.
+    """
+    if b"\0" in content:
+        return content
+    return content.replace(b"\r\n", b"\n")
+
+
+def objects_to_archive(objects):
+    """Pack (name, content) pairs into an in-memory tar archive"""
+    archive_buffer = BytesIO()
+    with tarfile.open(fileobj=archive_buffer, mode='w') as archive:
+        for name, content in objects:
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            info.mode = 0o644
+            info.mtime = time.time()
+            archive.addfile(info, BytesIO(content))
+    return archive_buffer.getvalue()
+
+
+class RenderedTemplate(object):
+    """
+    A patched template held in memory until it is transferred. It has the
+    same source_uri and destination_path as the template it was rendered
+    from, so it ends up in the same place in the job directory.
+    """
+
+    def __init__(self, source_uri, destination_path, content):
+        self.source_uri = source_uri
+        self.destination_path = destination_path
+        self.content = content
+
+    def __eq__(self, other):
+        return (isinstance(other, RenderedTemplate) and
+                self.source_uri == other.source_uri and
+                self.destination_path == other.destination_path and
+                self.content == other.content)
+
+
+def map_on(executor, function, items):
+    """
+    Apply function to each item, on the executor's threads if one is given,
+    returning the results in order. The first exception raised is re-raised.
+    """
+    if executor is None:
+        return [function(item) for item in items]
+    return list(executor.map(function, items))
+
+
+def file_content(file_object):
+    """Return the bytes to transfer for a file on disk or in memory"""
+    if isinstance(file_object, RenderedTemplate):
+        return file_object.content
+    with open(file_object.source_uri, 'rb') as f:
+        return f.read()
+
 
 class job_information_manager():
     """
@@ -116,60 +350,45 @@ class job_information_manager():
                 mako_dict[p.name] = p.value
         return mako_dict
 
-    def _apply_patch(self, template_path, parameters, destination_path):
+    def _apply_patch(self, template_path, parameters):
         """
-        Method to apply a patch based on a supplied template file.
+        Method to render a supplied template file with the given parameters,
+        returning the patched content.
         Access via the patch_all_templates method.
         """
-        template = MakoTemplate(filename=template_path, input_encoding='utf-8')
+        template = template_cache.get(template_path)
         mako_dict = self._parameters_to_mako_dict(parameters)
+        return template.render(parameters=mako_dict)
 
-        with open(destination_path, "w") as f:
-            f.write(template.render(parameters=mako_dict))
+    def _render_template(self, template):
+        rendered = self._apply_patch(template.source_uri,
+                                     self.extracted_parameters)
+        return RenderedTemplate(source_uri=template.source_uri,
+                                destination_path=template.destination_path,
+                                content=rendered.encode('utf-8'))
 
-    def patch_all_templates(self):
+    def patch_all_templates(self, executor=None):
         """
         Wrapper around the _apply_patch method which patches all files in
-        self.template_list
+        self.template_list. Patched templates are kept in memory (in
+        self.patched_templates) and streamed to the cluster by
+        transfer_all_files, so concurrent setups never share files on disk.
+        If an executor is given, templates are rendered in parallel on it.
         """
-
-        for template in self.template_list:
-
-            template_file = template.source_uri
-            template_filename = os.path.basename(template_file)
-
-            # make a dedicated directory for patching
-            # TODO make temporary directory for each new job-id
-            if template.destination_path:
-                tmp_path = os.path.join('tmp', template.destination_path)
-            else:
-                tmp_path = template.destination_path
-
-            tmp_file = os.path.join(tmp_path, template_filename)
-            os.makedirs(tmp_path, exist_ok=True)
-
-            self._apply_patch(template_file,
-                              self.extracted_parameters,
-                              tmp_file)
-            patched_tempate = Template(
-                source_uri=tmp_file,
-                destination_path=template.destination_path)
-
-            self.patched_templates.append(patched_tempate)
+        self.patched_templates = map_on(executor, self._render_template,
+                                        self.template_list)
 
     def _ssh_connection(self):
-        try:
-            connection = ssh(
-                self.hostname, self.username, self.port,
-                private_key_path=self.private_key_path,
-                private_key_string=self.private_key_string,
-                debug=True)
-            return connection
-        except Exception:
-            # If connection cannot be made, raise a ServiceUnavailble
-            # exception that will be passed to API client as a HTTP error
-            raise(ServiceUnavailable(
-                description="Unable to connect to backend compute resource"))
+        """
+        Borrow a connection from the shared pool for the duration of a with
+        block. The connection is returned to the pool (not closed) afterwards.
+        The connection may be shared with other threads, each running its own
+        channel.
+        """
+        return pooled_connection(
+            self.hostname, self.username, self.port,
+            private_key_path=self.private_key_path,
+            private_key_string=self.private_key_string)
 
     def create_job_directory(self, debug=False):
         """
@@ -178,54 +397,202 @@ class job_information_manager():
         following path structure:
             SIM_ROOT/<case.label>-<job.id>
         """
-        connection = self._ssh_connection()
         command = "mkdir -p {}".format(self.job_working_directory_path)
-        out, err, exit_code = connection.pass_command(command)
+        with self._ssh_connection() as connection:
+            out, err, exit_code = connection.pass_command(
+                command, timeout=SSH_COMMAND_TIMEOUT)
         if debug:
             print(out)
         return out, err, exit_code
 
-    def transfer_all_files(self, file_system='unix'):
-        """
-        Method to copy all needed files to the cluster using a single
-        ssh connection.
-        """
-        connection = self._ssh_connection()
+    def _files_to_transfer(self):
         all_files = []
         all_files.extend(self.script_list)
         all_files.extend(self.inputs_list)
         all_files.extend(self.patched_templates)
-
-        # these are Script and Input model objects
-        for file_object in all_files:
-            file_full_path = file_object.source_uri
-            file_name = os.path.basename(file_full_path)
-            if file_object.destination_path:
-                dest_path = posixpath.join(
-                    self.job_working_directory_path,
-                    file_object.destination_path)
-            else:  # support {"destination_path": null} in job json
-                dest_path = self.job_working_directory_path
+        return all_files
+
+    def _destination_name(self, file_object):
+        # path of a transferred file relative to the job directory
+        file_name = os.path.basename(file_object.source_uri)
+        if file_object.destination_path:
+            return posixpath.normpath(posixpath.join(
+                file_object.destination_path, file_name))
+        else:  # support {"destination_path": null} in job json
+            return file_name
+
+    def transfer_all_files(self, file_system='unix', mode=None,
+                           executor=None):
+        """
+        Method to copy all needed files to the cluster using a single
+        ssh connection. The mode defaults to FILE_TRANSFER_MODE:
+            "cas": only files not already in the remote content addressed
+                   store are uploaded, then copied into the job directory
+            "archive": every file is sent as a single tar stream
+            "scp": each file is copied separately
+        If an executor is given, files are copied ("scp") or read and hashed
+        ("cas") in parallel on it. Raises BadGateway if the remote command of
+        the "cas" or "archive" modes fails.
+        """
+        mode = mode or FILE_TRANSFER_MODE
+        if mode == 'cas':
+            return self._transfer_cas(file_system, executor)
+        if mode == 'archive':
+            return self._transfer_archive(file_system)
+
+        with self._ssh_connection() as connection:
+            # these are Script and Input model objects, and patched templates
+            map_on(executor,
+                   lambda file_object: self._copy_file(
+                       connection, file_object, file_system),
+                   self._files_to_transfer())
+
+    def _copy_file(self, connection, file_object, file_system='unix'):
+        file_full_path = file_object.source_uri
+        file_name = os.path.basename(file_full_path)
+        if file_object.destination_path:
+            dest_path = posixpath.join(
+                self.job_working_directory_path,
+                file_object.destination_path)
+        else:  # support {"destination_path": null} in job json
+            dest_path = self.job_working_directory_path
+        if isinstance(file_object, RenderedTemplate):
+            connection.secure_copy_data(
+                file_object.content,
+                posixpath.join(dest_path, file_name))
+        else:
             connection.secure_copy(file_full_path, dest_path)
 
-            # convert line endings
-            if file_system == 'unix':
-                destination_full_path = posixpath.join(dest_path, file_name)
-                dos2unix = "dos2unix {}".format(destination_full_path)
-                out, err, exit_code = connection.pass_command(dos2unix)
+        # convert line endings
+        if file_system == 'unix':
+            destination_full_path = posixpath.join(dest_path, file_name)
+            dos2unix = "dos2unix {}".format(destination_full_path)
+            out, err, exit_code = connection.pass_command(
+                dos2unix, timeout=SSH_COMMAND_TIMEOUT)
 
-        connection.close_connection()
-
-    def _run_remote_script(self, script_name, remote_path, debug=False):
+    def _transfer_archive(self, file_system='unix'):
+        """
+        Pack all files into an in-memory tar archive and stream it to a
+        single remote command, which unpacks it into the job directory and
+        converts line endings, so the number of round trips does not depend
+        on the number of files.
         """
-        Method to run a given script, located in a remote location.
+        archive_buffer = BytesIO()
+        destination_names = []
+        with tarfile.open(fileobj=archive_buffer, mode='w') as archive:
+            for file_object in self._files_to_transfer():
+                # paths in the archive are relative to the job directory
+                destination_name = self._destination_name(file_object)
+                if isinstance(file_object, RenderedTemplate):
+                    info = tarfile.TarInfo(destination_name)
+                    info.size = len(file_object.content)
+                    info.mode = 0o644
+                    info.mtime = time.time()
+                    archive.addfile(info, BytesIO(file_object.content))
+                else:
+                    archive.add(file_object.source_uri,
+                                arcname=destination_name)
+                destination_names.append(destination_name)
+
+        command = "mkdir -p {0} && cd {0} && tar -xf -".format(
+            shlex.quote(self.job_working_directory_path))
+        if file_system == 'unix' and destination_names:
+            command += " && dos2unix {}".format(
+                " ".join(shlex.quote(name) for name in destination_names))
+
+        with self._ssh_connection() as connection:
+            return check_transfer(connection.pass_command(
+                command, timeout=SSH_COMMAND_TIMEOUT,
+                stdin_data=archive_buffer.getvalue()))
+
+    def _transfer_cas(self, file_system='unix', executor=None):
+        """
+        Copy files via a content addressed store on the cluster
+        (SIM_ROOT/CAS_DIRECTORY), which holds one object per distinct file
+        content, named by its SHA-256 hash. Line endings are converted before
+        hashing, so objects are stored ready to use.
+
+        One remote command lists which objects already exist and a second
+        uploads the missing objects as a tar stream and copies every file
+        into the job directory. Files shared between cases, or unchanged
+        since the job was last set up, are not uploaded again. Files are
+        copied rather than hard linked, so a job writing to its files cannot
+        change the objects in the store.
+
+        Listing an object marks it as used, and objects not used for
+        CAS_MAX_AGE days are removed from the store when it is listed.
+        """
+        def hashed_content(file_object):
+            content = file_content(file_object)
+            if file_system == 'unix':
+                content = unix_line_endings(content)
+            return hashlib.sha256(content).hexdigest(), content
+
+        all_files = self._files_to_transfer()
+        objects = {}
+        links = []
+        for file_object, (digest, content) in zip(
+                all_files, map_on(executor, hashed_content, all_files)):
+            objects[digest] = content
+            links.append((digest, self._destination_name(file_object)))
+        if not links:
+            return
+
+        store_path = posixpath.join(self.simulation_root, CAS_DIRECTORY)
+        list_command = (
+            "mkdir -p {0} && cd {0} && {{ touch -c -- {2}; "
+            "find . -maxdepth 1 -type f -mtime +{1} -delete; "
+            "ls -1 -- {2}; }} 2>/dev/null").format(
+                shlex.quote(store_path), CAS_MAX_AGE,
+                " ".join(sorted(objects)))
+
+        with self._ssh_connection() as connection:
+            out, err, exit_code = connection.pass_command(
+                list_command, timeout=SSH_COMMAND_TIMEOUT)
+            missing = sorted(set(objects) - set(out.split()))
+
+            commands = ["cd {}".format(shlex.quote(store_path))]
+            archive_bytes = None
+            if missing:
+                archive_bytes = objects_to_archive(
+                    [(digest, objects[digest]) for digest in missing])
+                # Unpack into a temporary directory first, so an interrupted
+                # upload never leaves a partial object in the store
+                commands.append('tmp=$(mktemp -d tmp.XXXXXX) && '
+                                'tar -xf - -C "$tmp" && mv -f "$tmp"/* . && '
+                                'rmdir "$tmp"')
+            job_path = self.job_working_directory_path
+            directories = sorted(set(
+                posixpath.join(job_path, posixpath.dirname(name))
+                for digest, name in links))
+            commands.append("mkdir -p {}".format(
+                " ".join(shlex.quote(d) for d in directories)))
+            for digest, name in links:
+                # Remove the destination first, in case it is a hard link
+                # into the store left by an earlier version
+                destination = shlex.quote(posixpath.join(job_path, name))
+                commands.append("rm -f {1} && cp {0} {1}".format(
+                    digest, destination))
+            return check_transfer(connection.pass_command(
+                " && ".join(commands), timeout=SSH_COMMAND_TIMEOUT,
+                stdin_data=archive_bytes))
+
+    def _run_remote_script(self, script_name, remote_path, debug=False,
+                           arguments=None):
+        """
+        Method to run a given script, located in a remote location, passing
+        it any (shell quoted) arguments.
         Set the debug flag to print stdout to the terminal, and to enable
         logging in ./logs/ssh.log
         Shouldnt be called directly.
         """
-        connection = self._ssh_connection()
         command = "cd {}; bash {}".format(remote_path, script_name)
-        out, err, exit_code = connection.pass_command(command)
+        if arguments:
+            command = " ".join([command] +
+                               [shlex.quote(arg) for arg in arguments])
+        with self._ssh_connection() as connection:
+            out, err, exit_code = connection.pass_command(
+                command, timeout=SSH_COMMAND_TIMEOUT)
         if debug:
             print(out)
         return out, err, exit_code
@@ -235,8 +602,9 @@ class job_information_manager():
         Method to run a given command remotely via SSH
         Shouldnt be called directly.
         """
-        connection = self._ssh_connection()
-        out, err, exit_code = connection.pass_command(command)
+        with self._ssh_connection() as connection:
+            out, err, exit_code = connection.pass_command(
+                command, timeout=SSH_COMMAND_TIMEOUT)
         if debug:
             print(out)
         return out, err, exit_code
@@ -261,11 +629,17 @@ class job_information_manager():
         else:
             return None
 
-    def trigger_action_script(self, action):
+    def has_action_script(self, action):
+        """Whether the job has a script for the action (eg 'SETUP')"""
+        return any(script.action == action for script in self.script_list)
+
+    def trigger_action_script(self, action, arguments=None, parse_json=True):
         """
         Pass in the job and the required action (eg 'RUN' or 'CANCEL')
         and this method will run the remote script which
-        corresponds to that action
+        corresponds to that action, with any arguments provided.
+        The JSON output of DATA and PROGRESS scripts is parsed unless
+        parse_json is False.
         """
         to_trigger = None
 
@@ -284,7 +658,12 @@ class job_information_manager():
             else:  # support {"destination_path": null} in job json
                 script_path = self.job_working_directory_path
 
-            out, err, exit = self._run_remote_script(script_name, script_path)
+            if arguments:
+                out, err, exit = self._run_remote_script(
+                    script_name, script_path, arguments=arguments)
+            else:
+                out, err, exit = self._run_remote_script(script_name,
+                                                         script_path)
 
             # for "RUN" actions, we need to persist the backend identifier
             # and submission status to the database
@@ -294,7 +673,7 @@ class job_information_manager():
                     self.job.backend_identifier = backend_identifier
                     self.job.status = "Queued"
                     self.jobs.update(self.job)
-            if to_trigger.action in ["DATA", "PROGRESS"]:
+            if to_trigger.action in ["DATA", "PROGRESS"] and parse_json:
                 # convert stdout json string to json
                 # guard against empty string (for queued jobs)
                 if out:
@@ -307,19 +686,7 @@ class job_information_manager():
             return result, 400
 
     def _qstat_status_to_job_status(self, qstat_status):
-        if(qstat_status == 'Q' or qstat_status == 'W'):
-            # Q: Job is	queued, eligable to run or routed.
-            # W: Job is waiting for its	execution time (-a option) to
-            #    be reached.
-            return "Queued"
-        if(qstat_status == 'R'):
-            # R: Job is running
-            return "Running"
-        if(qstat_status == 'C'):
-            # C: Job is completed
-            return "Complete"
-        else:
-            return None
+        return qstat_status_to_job_status(qstat_status)
 
     def _qstat_status(self):
         status_cmd = 'qstat {} -x | grep -P -o "<job_state>\K."'.format(
@@ -329,60 +696,129 @@ class job_information_manager():
         qstat_status = out.strip()
         return qstat_status
 
-    def update_job_status(self):
+    def update_job_status(self, qstat_status=None):
+        """
+        Return the current status of the job. A qstat_status already fetched
+        (e.g. by a batched backend_job_states() call) can be passed in to
+        avoid a remote call for this job.
+        """
         # No need to make remote call to qstat if Job is not yet submitted or
         # has already completed
-        if(self.job.status not in ["Queued", "Running"]):
+        if(self.job.status not in ACTIVE_JOB_STATUSES):
             # Leave job status unchanged
             return self.job.status
 
         # Check current qstat status for job
-        qstat_status = self._qstat_status()
-        if(qstat_status is not None):
-            # If we get a qstat status, try and convert it to a job status
-            new_job_status = self._qstat_status_to_job_status(qstat_status)
-        else:
-            if(self.job.status in ["Submitted", "Queued", "Running"]):
-                # If we have a previous backend status confirming the job was
-                # on the queue, an empty qstat status means the Job has
-                # completed and been removed from the queue.
-                # Note: Jobs only stay on the queue for abour 5 mins after they
-                # complete
-                new_job_status = "Complete"
-
-        if(new_job_status is None):
-            # Leave job status unchanged
-            new_job_status = self.job.status
+        if qstat_status is None:
+            qstat_status = self._qstat_status()
+        return job_status_from_qstat(self.job.status, qstat_status)
 
-        return new_job_status
+    def setup_fingerprint(self):
+        """
+        Return a hash of everything that goes into setting up the job: the
+        working directory, the parameter values and the paths and contents
+        of the templates, scripts and inputs.
+        """
+        fingerprint = hashlib.sha256()
+
+        def add(value):
+            fingerprint.update(str(value).encode("utf-8"))
+            fingerprint.update(b"\0")
+
+        add(self.job_working_directory_path)
+        for name, value in sorted(self._parameters_to_mako_dict(
+                self.extracted_parameters).items()):
+            add(name)
+            add(value)
+        for file_object in (self.template_list + self.script_list +
+                            self.inputs_list):
+            add(file_object.source_uri)
+            add(file_object.destination_path)
+            try:
+                with open(file_object.source_uri, 'rb') as f:
+                    fingerprint.update(hashlib.sha256(f.read()).digest())
+            except (IOError, OSError):
+                add("missing")
+        return fingerprint.hexdigest()
+
+    def parameter_hash(self):
+        """
+        Return a hash of everything that determines the job's results: its
+        case, its parameter values and the contents of its templates, scripts
+        and inputs, with where they are placed in the job directory. Unlike
+        the setup fingerprint, it does not depend on the job itself, so jobs
+        with the same hash are expected to produce the same results.
+        """
+        parameter_hash = hashlib.sha256()
+
+        def add(value):
+            parameter_hash.update(str(value).encode("utf-8"))
+            parameter_hash.update(b"\0")
+
+        add(self.job.case.id)
+        for name, value in sorted(self._parameters_to_mako_dict(
+                self.extracted_parameters).items()):
+            add(name)
+            add(value)
+        files = [("template", f) for f in self.template_list] + \
+            [("script", f) for f in self.script_list] + \
+            [("input", f) for f in self.inputs_list]
+        for kind, name, file_object in sorted(
+                ((kind, self._destination_name(f), f) for kind, f in files),
+                key=lambda entry: entry[:2]):
+            add(kind)
+            add(name)
+            try:
+                with open(file_object.source_uri, 'rb') as f:
+                    parameter_hash.update(hashlib.sha256(f.read()).digest())
+            except (IOError, OSError):
+                add("missing")
+        return parameter_hash.hexdigest()
 
     def run(self):
         """
         This is the RUN behaviour for this job manager. This method ignores
         any data passed as part of the request.
         """
-        # Call setup to ensure that the latest params and files are loaded
-        self.setup()
+        # Call setup to ensure that the latest params and files are loaded,
+        # unless nothing has changed since the job was last set up
+        fingerprint = self.setup_fingerprint()
+        if fingerprint != self.job.setup_fingerprint:
+            self.setup(fingerprint=fingerprint)
 
         # Now execute the run script
         return self.trigger_action_script('RUN')
 
-    def setup(self):
+    def setup(self, fingerprint=None):
         """
         This is the SETUP behaviour for this job manager. This method ignores
-        any data passed as part of the request.
+        any data passed as part of the request. A successful setup records
+        the job's setup fingerprint, so a later run can skip setting up the
+        job again. A job without a SETUP script is set up once its files
+        have been copied.
         """
-        # PATCH EVERYTHING
-        self.patch_all_templates()
+        if fingerprint is None:
+            fingerprint = self.setup_fingerprint()
+
+        with ThreadPoolExecutor(max_workers=SETUP_CONCURRENCY) as executor:
+            # CREATE REQUIRED REMOTE DIRECTORIES, while templates are patched
+            directory = executor.submit(self.create_job_directory)
 
-        # CREATE REQUIRED REMOTE DIRECTORIES
-        self.create_job_directory()
+            # PATCH EVERYTHING
+            self.patch_all_templates(executor)
+            directory.result()
 
-        # COPY EVERYTHING
-        self.transfer_all_files()
+            # COPY EVERYTHING
+            self.transfer_all_files(executor=executor)
 
         # EXECUTE SETUP SCRIPT
-        return self.trigger_action_script('SETUP')
+        result, code = self.trigger_action_script('SETUP')
+        if ((code == 200 and result.get("exit_code") == 0) or
+                not self.has_action_script('SETUP')):
+            self.job.setup_fingerprint = fingerprint
+            if self.jobs is not None:
+                self.job = self.jobs.update(self.job)
+        return result, code
 
     def progress(self):
         """
@@ -392,13 +828,22 @@ class job_information_manager():
         # Execute the progress script
         return self.trigger_action_script('PROGRESS')
 
-    def data(self):
+    def data(self, cursor=None, binary=False):
         """
         This is the DATA behaviour for this job manager. Method ignores
-        any data passed as part of the request.
+        any data passed as part of the request. If a cursor (the byte offset
+        returned by a previous call) is given, only rows written since then
+        are returned. If binary is True, stdout is left as the base64 encoded
+        packed columns written by the script (see middleware.columnar).
         """
-        # Execute the progress script
-        return self.trigger_action_script('DATA')
+        # Execute the data script
+        if binary:
+            return self.trigger_action_script(
+                'DATA', arguments=[str(cursor or 0), 'binary'],
+                parse_json=False)
+        if cursor is None:
+            return self.trigger_action_script('DATA')
+        return self.trigger_action_script('DATA', arguments=[str(cursor)])
 
     def cancel(self):
         """
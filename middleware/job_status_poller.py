@@ -0,0 +1,72 @@
+import threading
+import arrow
+from middleware.job_information_manager import (ACTIVE_JOB_STATUSES,
+                                                job_statuses)
+
+
+class JobStatusPoller(threading.Thread):
+    """
+    Background thread that keeps the status of Queued and Running jobs up to
+    date, so that API reads can return the last known status without making
+    a remote call to the compute backend.
+
+    The interval between polls adapts to activity: it starts at min_interval,
+    doubles after every poll in which no job changed status (up to
+    max_interval) and drops back to min_interval as soon as one does.
+    """
+
+    def __init__(self, app, job_repository, min_interval=10,
+                 max_interval=120, result_store=None):
+        super().__init__(name="job-status-poller", daemon=True)
+        self.app = app
+        self.jobs = job_repository
+        self.result_store = result_store
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self._stop_event = threading.Event()
+
+    def poll(self):
+        """
+        Refresh the status of every active job with a single batched call to
+        the backend and write the results through the job repository.
+        Returns the number of jobs whose status changed, or None if there were
+        no active jobs to check.
+        """
+        with self.app.app_context():
+            jobs = self.jobs.list_by_status(ACTIVE_JOB_STATUSES)
+            if not jobs:
+                return None
+            statuses = job_statuses(jobs)
+            checked_at = arrow.utcnow()
+            changed = 0
+            for job in jobs:
+                if statuses[job.id] != job.status:
+                    changed += 1
+                self.jobs.update_status(job.id, statuses[job.id], checked_at)
+                if statuses[job.id] == "Complete" and self.result_store:
+                    # Keep the final results of jobs that have just completed
+                    self.result_store.pull(job, self.jobs)
+            return changed
+
+    def next_interval(self, changed):
+        if changed is None:
+            # Nothing on the queue, so check back infrequently
+            return self.max_interval
+        if changed:
+            return self.min_interval
+        return min(self.interval * 2, self.max_interval)
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                changed = self.poll()
+            except Exception:
+                # Keep polling if the backend is temporarily unavailable,
+                # but back off as if nothing had changed
+                self.app.logger.exception("Job status poll failed")
+                changed = 0
+            self.interval = self.next_interval(changed)
+
+    def stop(self):
+        self._stop_event.set()
@@ -1,7 +1,13 @@
 import paramiko
 import os
+import socket
+import threading
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from scp import SCPClient
-from io import StringIO
+from io import StringIO, BytesIO
 
 
 class ssh():
@@ -12,10 +18,17 @@ class ssh():
 
     def __init__(self, hostname, username, port,
                  private_key_path=None, private_key_string=None,
-                 debug=True):
+                 debug=True, keepalive=None, max_channels=8):
         """
         Load keys from private_key_path and private_key_string
+
+        Commands run as separate channels on a single authenticated transport,
+        so one connection can serve several threads at once. At most
+        max_channels channels are open at any time.
         """
+        self.max_channels = max_channels
+        self._channel_slots = threading.BoundedSemaphore(max_channels)
+
         if debug:
             os.makedirs(os.path.dirname('.logs/ssh.log'), exist_ok=True)
             paramiko.util.log_to_file('.logs/ssh.log')
@@ -44,24 +57,84 @@ class ssh():
             pkey=pkey,
             look_for_keys=look_for_keys)
 
-    def pass_command(self, command):
+        # keep long-lived (pooled) connections from being dropped by
+        # firewalls or the remote sshd while they sit idle
+        if keepalive:
+            self.client.get_transport().set_keepalive(keepalive)
+
+    def pass_command(self, command, timeout=None, stdin_data=None):
         """
         Run a bash command on the remote machine and return stdout as a string.
-        No error handling, stderr is ignored.
+        No error handling, stderr is ignored. If stdin_data (bytes) is given
+        it is streamed to the command's standard input, followed by end of
+        file.
+
+        Safe to call from several threads at once: each command gets its own
+        channel on the shared transport. Raises socket.timeout if the command
+        produces no output for timeout seconds or does not exit in time.
         """
-        stdin, stdout, stderr = self.client.exec_command(command)
-        exit_code = stdout.channel.recv_exit_status()
-        stdout = stdout.read().decode("utf-8")
-        stderr = stderr.read().decode("utf-8")
+        with self._channel_slots:
+            stdin, stdout, stderr = self.client.exec_command(command,
+                                                             timeout=timeout)
+            channel = stdout.channel
+            try:
+                if stdin_data is not None:
+                    stdin.write(stdin_data)
+                    stdin.flush()
+                    channel.shutdown_write()
+                # Drain output before waiting for the exit status, otherwise a
+                # command with a lot of output can stall on a full window
+                out = stdout.read().decode("utf-8")
+                err = stderr.read().decode("utf-8")
+                if not channel.status_event.wait(timeout):
+                    raise socket.timeout(
+                        "Timed out waiting for command to exit")
+                exit_code = channel.recv_exit_status()
+            finally:
+                channel.close()
+
+        return out, err, exit_code
 
-        return stdout, stderr, exit_code
+    def pass_commands(self, commands, timeout=None):
+        """
+        Run several commands concurrently, each on its own channel, and return
+        a list of (stdout, stderr, exit_code) tuples in the same order.
+        """
+        if not commands:
+            return []
+        workers = min(len(commands), self.max_channels)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(self.pass_command, command, timeout)
+                       for command in commands]
+            return [future.result() for future in futures]
 
     def secure_copy(self, filename, destination_path):
         """
         Use SCPClient to copy files over an ssh connection.
         """
-        with SCPClient(self.client.get_transport()) as scp:
-            scp.put(filename, destination_path)
+        with self._channel_slots:
+            with SCPClient(self.client.get_transport()) as scp:
+                scp.put(filename, destination_path)
+
+    def secure_copy_data(self, data, destination_file):
+        """
+        Use SCPClient to copy in-memory bytes to a file over an ssh
+        connection, without writing them to local disk first.
+        """
+        with self._channel_slots:
+            with SCPClient(self.client.get_transport()) as scp:
+                scp.putfo(BytesIO(data), destination_file)
+
+    def is_active(self):
+        """
+        Check that the underlying transport is still open and authenticated.
+        """
+        try:
+            transport = self.client.get_transport()
+            return (transport is not None and transport.is_active() and
+                    transport.is_authenticated())
+        except Exception:
+            return False
 
     def close_connection(self):
         """
@@ -69,3 +142,181 @@ class ssh():
         needed as exec_command should kill the connection on completion.
         """
         self.client.close()
+
+
+class _PooledConnection():
+    """Book-keeping for a connection held by a ConnectionPool"""
+
+    def __init__(self, key, connection):
+        self.key = key
+        self.connection = connection
+        self.leases = 0
+        self.released_at = time.monotonic()
+
+
+class ConnectionPool():
+    """
+    A process-wide pool of open ssh connections, keyed by the host, port, user
+    and private key used to open them.
+
+    Connections are borrowed with acquire() (or the connection() context
+    manager) and handed back with release(). Because commands are multiplexed
+    as channels over one transport, a connection is lent to up to
+    max_channels borrowers at once before another connection is opened. Idle
+    connections are closed once they have been unused for longer than
+    idle_timeout, and are health checked before being handed out again.
+    """
+
+    def __init__(self, max_size=4, idle_timeout=300, acquire_timeout=30,
+                 keepalive=30, max_channels=8):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.acquire_timeout = acquire_timeout
+        self.keepalive = keepalive
+        self.max_channels = max_channels
+
+        self._condition = threading.Condition()
+        # key -> list of _PooledConnection (borrowed and idle)
+        self._connections = {}
+        # id(connection) -> _PooledConnection
+        self._by_id = {}
+
+    def _key(self, hostname, username, port, private_key_path,
+             private_key_string):
+        # Avoid holding on to the key itself, we only need to tell keys apart
+        if private_key_string:
+            key_id = hashlib.sha256(
+                private_key_string.encode("utf-8")).hexdigest()
+        else:
+            key_id = private_key_path
+        return (hostname, port, username, key_id)
+
+    def _discard(self, pooled):
+        # Must be called while holding self._condition
+        self._connections[pooled.key].remove(pooled)
+        self._by_id.pop(id(pooled.connection), None)
+        try:
+            pooled.connection.close_connection()
+        except Exception:
+            pass
+
+    def _reap_idle(self, now):
+        # Close connections that have been idle for too long. Must be called
+        # while holding self._condition
+        for pooled_list in list(self._connections.values()):
+            for pooled in list(pooled_list):
+                if (pooled.leases == 0 and
+                        now - pooled.released_at > self.idle_timeout):
+                    self._discard(pooled)
+
+    def _lease(self, pooled):
+        pooled.leases += 1
+        return pooled.connection
+
+    def acquire(self, hostname, username, port, private_key_path=None,
+                private_key_string=None, debug=True):
+        """
+        Borrow an open connection, sharing one that has spare channels or
+        opening a new one if the pool for this key is not full. Blocks for up
+        to acquire_timeout seconds waiting for a channel to be released if
+        every connection is saturated and the pool is full.
+        """
+        key = self._key(hostname, username, port, private_key_path,
+                        private_key_string)
+        deadline = time.monotonic() + self.acquire_timeout
+
+        with self._condition:
+            while True:
+                self._reap_idle(time.monotonic())
+                pooled_list = self._connections.setdefault(key, [])
+
+                # Prefer the busiest connection that still has a free
+                # channel, so load is packed onto as few connections as
+                # possible and the rest can go idle and be reaped
+                candidates = sorted(
+                    (p for p in pooled_list if p.connection is not None and
+                     p.leases < self.max_channels),
+                    key=lambda p: -p.leases)
+                for pooled in candidates:
+                    if pooled.connection.is_active():
+                        return self._lease(pooled)
+                    if pooled.leases == 0:
+                        self._discard(pooled)
+
+                if len(pooled_list) < self.max_size:
+                    # reserve a slot, then connect outside the lock
+                    reserved = _PooledConnection(key, None)
+                    reserved.leases = 1
+                    pooled_list.append(reserved)
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(
+                        "Timed out waiting for a free ssh connection")
+                self._condition.wait(remaining)
+
+        try:
+            connection = ssh(hostname, username, port,
+                             private_key_path=private_key_path,
+                             private_key_string=private_key_string,
+                             debug=debug, keepalive=self.keepalive,
+                             max_channels=self.max_channels)
+        except Exception:
+            with self._condition:
+                pooled_list.remove(reserved)
+                self._condition.notify()
+            raise
+
+        with self._condition:
+            reserved.connection = connection
+            self._by_id[id(connection)] = reserved
+        return connection
+
+    def release(self, connection):
+        """
+        Return a borrowed connection to the pool. Connections that are no
+        longer healthy are closed once their last borrower releases them.
+        """
+        with self._condition:
+            pooled = self._by_id.get(id(connection))
+            if pooled is None:
+                # Not one of ours, so just close it
+                try:
+                    connection.close_connection()
+                except Exception:
+                    pass
+                return
+            pooled.leases -= 1
+            if pooled.leases == 0:
+                pooled.released_at = time.monotonic()
+                if not connection.is_active():
+                    self._discard(pooled)
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self, hostname, username, port, private_key_path=None,
+                   private_key_string=None, debug=True):
+        """
+        Context manager that borrows a connection and always releases it.
+        """
+        connection = self.acquire(hostname, username, port,
+                                  private_key_path=private_key_path,
+                                  private_key_string=private_key_string,
+                                  debug=debug)
+        try:
+            yield connection
+        finally:
+            self.release(connection)
+
+    def close_all(self):
+        """
+        Close every idle connection. Borrowed connections are closed as they
+        are released.
+        """
+        with self._condition:
+            for pooled_list in list(self._connections.values()):
+                for pooled in list(pooled_list):
+                    if pooled.leases == 0:
+                        self._discard(pooled)
+            self._condition.notify_all()
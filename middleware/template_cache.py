@@ -0,0 +1,63 @@
+import os
+import threading
+from collections import OrderedDict
+from mako.template import Template as MakoTemplate
+
+
+class TemplateCache(object):
+    """
+    Process-wide cache of compiled Mako templates, so a template file is only
+    lexed and compiled the first time it is rendered.
+
+    Templates are keyed by their absolute path, modification time and size,
+    so an edited template file is compiled again. At most max_size templates
+    are kept, evicting the least recently used first. If module_directory is
+    given, Mako also writes the compiled Python modules there, so templates
+    are not recompiled when the process restarts.
+    """
+
+    def __init__(self, max_size=64, module_directory=None):
+        self.max_size = max_size
+        self.module_directory = module_directory
+        self._lock = threading.Lock()
+        self._templates = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _key(self, filename):
+        path = os.path.abspath(filename)
+        stat = os.stat(path)
+        return path, stat.st_mtime_ns, stat.st_size
+
+    def get(self, filename):
+        """Return the compiled template for a template file"""
+        key = self._key(filename)
+        with self._lock:
+            template = self._templates.get(key)
+            if template is not None:
+                self._templates.move_to_end(key)
+                self.hits += 1
+                return template
+            self.misses += 1
+
+        # Compile outside the lock, as it is slow for large templates
+        template = MakoTemplate(filename=key[0], input_encoding='utf-8',
+                                module_directory=self.module_directory)
+        with self._lock:
+            # Drop any entry for an older version of the same file
+            for old_key in [k for k in self._templates if k[0] == key[0]]:
+                del self._templates[old_key]
+            self._templates[key] = template
+            while len(self._templates) > self.max_size:
+                self._templates.popitem(last=False)
+                self.evictions += 1
+        return template
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits,
+                    "misses": self.misses,
+                    "evictions": self.evictions,
+                    "size": len(self._templates),
+                    "max_size": self.max_size}
@@ -2,15 +2,42 @@
 
 from __future__ import print_function  # for python 2 compatability
 
+import base64
 import csv
 import json
-
-
-def csv_to_data_json(fname, data_required=None):
-
-    with open(fname, 'r') as f:
-        d_reader = csv.DictReader(f)
-        headers = d_reader.fieldnames
+import os
+import struct
+import sys
+
+
+def csv_to_data_json(fname, data_required=None, offset=0, finished=False):
+    """
+    Read the rows of a csv file starting at the byte offset `offset`. Along
+    with the data, returns the offset actually read from and a cursor (the
+    offset of the first row not yet read) to pass as the next offset, so
+    that repeated calls only return new rows. A final row without a trailing
+    newline is only read once the job has `finished` writing the file.
+    """
+
+    with open(fname, 'rb') as f:
+        headers = next(csv.reader([f.readline().decode('utf-8')]))
+        if offset < f.tell() or offset > os.fstat(f.fileno()).st_size:
+            # start from the first row (the file may have been rewritten)
+            offset = f.tell()
+        if offset > 0:
+            # the offset is only 0 if the file is still empty
+            f.seek(offset - 1)
+            if f.read(1) != b'\n':
+                # skip to the start of the next row
+                offset += len(f.readline())
+        cursor = offset
+        lines = []
+        for line in f:
+            if not line.endswith(b'\n') and not finished:
+                break  # the last row is still being written
+            lines.append(line.decode('utf-8'))
+            cursor += len(line)
+        d_reader = csv.DictReader(lines, fieldnames=headers)
 
         columns_to_process = headers  # default to processing all csv columns
         column_labels = headers
@@ -35,7 +62,26 @@ def csv_to_data_json(fname, data_required=None):
             for name in columns_to_process:
                 output[name].append(float(line[str(name)]))
 
-        return {"data": output}
+        return {"data": output, "offset": offset, "cursor": cursor}
+
+
+def pack_columns(data_object):
+    """
+    Pack the data as little-endian float64 columns in the order of its keys,
+    after a JSON header holding everything else and preceded by the header
+    length as a little-endian uint32. Base64 encoded for writing to stdout.
+    """
+    data = data_object["data"]
+    keys = data["keys"]
+    header = dict((k, v) for k, v in data.items() if k not in keys)
+    header.update((k, v) for k, v in data_object.items() if k != "data")
+    header["rows"] = len(data[keys[0]]) if keys else 0
+    header["dtype"] = "<f8"
+    header_bytes = json.dumps(header).encode('utf-8')
+    chunks = [struct.pack('<I', len(header_bytes)), header_bytes]
+    for key in keys:
+        chunks.append(struct.pack('<%dd' % len(data[key]), *data[key]))
+    return base64.b64encode(b''.join(chunks)).decode('ascii')
 
 
 data_required = [
@@ -58,9 +104,15 @@ data_required = [
 
 data_object = csv_to_data_json(
     "output.csv",
-    data_required=data_required)
-
-print(json.dumps(data_object))  # print to stdout
+    data_required=data_required,
+    offset=int(sys.argv[1]) if len(sys.argv) > 1 else 0,
+    finished=os.environ.get("JOB_FINISHED") == "1")
+
+# print to stdout, as JSON unless packed columns are requested
+if len(sys.argv) > 2 and sys.argv[2] == 'binary':
+    print(pack_columns(data_object))
+else:
+    print(json.dumps(data_object))
 
 
 # The above code uses csv and json from the standard library
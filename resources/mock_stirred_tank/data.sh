@@ -6,9 +6,10 @@ EXEC_HOST=$(bash get_exec_host.sh)
 TMPDIR="/tmp/pbs.$PBS_JOB_ID"
 
 if [ "$PBS_JOB_STATE" == "R" ]; then
-  ssh $EXEC_HOST "cd $TMPDIR && python csv_to_data_json.py"
+  ssh $EXEC_HOST "cd $TMPDIR && python csv_to_data_json.py $*"
 elif [ "$PBS_JOB_STATE" == "Q" ]; then
   exit 0
 else
-  python csv_to_data_json.py
+  # the job has finished, so its last row is complete
+  JOB_FINISHED=1 python csv_to_data_json.py "$@"
 fi
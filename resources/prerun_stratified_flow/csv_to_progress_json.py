@@ -13,15 +13,25 @@
 
 from __future__ import print_function  # for python 2 compatability
 
-from collections import deque
 import csv
 import json
+import os
 import re
 
 
-def get_reference_value():
+def get_reference_value(fname='Blue.nml', cache_fname='.timestep_max'):
+    """
+    Return timestep_max from the simulation parameters. The value is cached in
+    a file next to the parameters, so they are only parsed once per job.
+    """
+    try:
+        if os.path.getmtime(cache_fname) >= os.path.getmtime(fname):
+            with open(cache_fname, 'r') as f:
+                return float(f.read())
+    except (IOError, OSError, ValueError):
+        pass  # no usable cached value
 
-    with open('Blue.nml', 'r') as f:
+    with open(fname, 'r') as f:
         parameter_lines = f.readlines()
 
     for line in parameter_lines:
@@ -29,45 +39,76 @@ def get_reference_value():
         if timestep_max_input:
             timestep_max = float(timestep_max_input.group(1))
 
+    try:
+        with open(cache_fname, 'w') as f:
+            f.write(repr(timestep_max))
+    except (IOError, OSError):
+        pass  # the cache is optional, e.g. in a read-only directory
+
     return timestep_max
 
 
-def get_last_row(fname):
+def get_header(fname):
     with open(fname, 'r') as f:
         try:
-            lastrow = deque(csv.reader(f), 1)[0]
-        except IndexError:  # empty file
-            lastrow = None
-        return lastrow
+            return next(csv.reader([f.readline()]))
+        except StopIteration:  # empty file
+            return None
+
+
+def get_last_row(fname, block_size=4096):
+    """
+    Return the last complete row of a csv file, reading blocks backwards from
+    the end of the file rather than reading the whole file. A final row with
+    no trailing newline is still being written, so is skipped.
+    """
+    with open(fname, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        tail = b''
+        while position > 0:
+            read_size = min(block_size, position)
+            position -= read_size
+            f.seek(position)
+            tail = f.read(read_size) + tail
+            end = tail.rfind(b'\n')
+            if end == -1:
+                continue
+            start = tail.rfind(b'\n', 0, end)
+            if start != -1 or position == 0:
+                line = tail[start + 1:end].decode('utf-8')
+                return next(csv.reader([line]))
+    return None  # no complete rows
 
 
 def csv_to_progress_json(fname):
-    with open(fname, 'r') as f:
 
-        output = {
-            "range_min": 0,
-            "range_max": 100,
-            "value": 100,
-            "units": "%"
-        }
-
-        # d_reader = csv.DictReader(f)
-        # headers = d_reader.fieldnames
-        #
-        # try:
-        #     index = headers.index('timestep')
-        # except:
-        #     # csv file is empty
-        #     return {"progress": output}
-        #
-        # last_row = get_last_row(fname)
-        # latest_value = float(last_row[index])
-        #
-        # reference_value = get_reference_value()
-        # progress = latest_value/reference_value
-        # output["value"] = progress
-
-        return {"progress": output}
+    output = {
+        "range_min": 0,
+        "range_max": 100,
+        "value": 100,
+        "units": "%"
+    }
+
+    # headers = get_header(fname)
+    #
+    # try:
+    #     index = headers.index('timestep')
+    # except (AttributeError, ValueError):
+    #     # csv file is empty
+    #     return {"progress": output}
+    #
+    # last_row = get_last_row(fname)
+    # if last_row is None or last_row == headers:
+    #     # no rows written yet
+    #     return {"progress": output}
+    # latest_value = float(last_row[index])
+    #
+    # reference_value = get_reference_value()
+    # progress = latest_value/reference_value
+    # output["value"] = progress
+
+    return {"progress": output}
 
 
 progress_object = csv_to_progress_json("output.csv")
@@ -1,17 +1,27 @@
 import os
 import re
+import hashlib
+import socket
 import posixpath
+import tarfile
+import threading
 import unittest.mock as mock
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
 import pytest
 from middleware.job_information_manager import job_information_manager as JIM
+from middleware.job_information_manager import (
+    parse_qstat_xml, backend_job_states, job_statuses, unix_line_endings,
+    RenderedTemplate)
 from middleware.ssh import ssh
 from tests.job.new_jobs import new_job5
 from instance.config import *
-from middleware.job.schema import Template
+from middleware.job.models import Script
 from middleware.job.sqlalchemy_repository import JobRepositorySqlAlchemy
 from flask import Flask
 from middleware.database import db as _db
-from werkzeug.exceptions import ServiceUnavailable
+from werkzeug.exceptions import (ServiceUnavailable, GatewayTimeout,
+                                 BadGateway)
 
 
 @pytest.fixture(scope='session')
@@ -90,8 +100,8 @@ def mock_mkdir(path, exist_ok=True):
     return True
 
 
-def mock_apply_patch(template_path, parameters, destination_path):
-    return template_path, parameters, destination_path
+def mock_apply_patch(template_path, parameters):
+    return "patched {}".format(template_path)
 
 
 def mock_secure_copy(full_file_path, destination_path):
@@ -106,7 +116,7 @@ def mock_run_remote(script_name, remote_path, debug=True):
     return script_name, 'err', '0'
 
 
-def mock_pass_command(command):
+def mock_pass_command(command, timeout=None):
     return command, 'err', '0'
 
 
@@ -114,6 +124,10 @@ def mock_ssh_exception():
     raise Exception()
 
 
+def mock_pass_command_timeout(command, timeout=None):
+    raise socket.timeout()
+
+
 class TestJIM(object):
 
     def test_constructor_no_simulation_root(self):
@@ -138,7 +152,7 @@ class TestJIM(object):
         assert jim.patched_templates == []
         assert jim.user == job.user
 
-    def test_apply_patch(self, tmpdir):
+    def test_apply_patch(self):
         job = new_job5()
         manager = JIM(job)
 
@@ -154,14 +168,8 @@ class TestJIM(object):
         template_path = template.source_uri
         in_parameter_value = parameter.value
 
-        template_filename = os.path.basename(template_path)
-        destination_path = os.path.join(tmpdir.strpath, template_filename)
-
-        manager._apply_patch(template_path, parameters, destination_path)
-
-        # read patched file
-        with open(destination_path, "r") as f:
-            content = f.readlines()
+        content = manager._apply_patch(template_path, parameters)\
+            .splitlines()
 
         for line in content:
             patched = re.search(r"^\s+viscosity_phase_1\s+=\s+(\S+)\s+!", line)
@@ -178,31 +186,94 @@ class TestJIM(object):
 
         manager.patch_all_templates()
 
-        dest = job.templates[0].destination_path
-        src = os.path.join('tmp', dest,
-                           os.path.basename(job.templates[0].source_uri))
-
-        expected = [Template(source_uri=src, destination_path=dest)]
+        source = job.templates[0].source_uri
+        expected = [RenderedTemplate(
+            source_uri=source,
+            destination_path=job.templates[0].destination_path,
+            content="patched {}".format(source).encode('utf-8'))]
         assert manager.patched_templates == expected
 
-    @mock.patch('os.makedirs', side_effect=mock_mkdir)
+    @mock.patch('os.makedirs',
+                side_effect=AssertionError("Templates should not be "
+                                           "patched on disk"))
     @mock.patch('middleware.job_information_manager.job_information_manager.'
                 '_apply_patch', side_effect=mock_apply_patch)
-    def test_patch_templates_path_construction(self, mock_patch, mock_mkdirs):
+    def test_patch_all_templates_keeps_templates_in_memory(
+            self, mock_patch, mock_mkdirs):
         job = new_job5()
         manager = JIM(job)
         manager.patch_all_templates()
+        # Patching again replaces, rather than adds to, the patched templates
+        manager.patch_all_templates()
 
         calls = mock_patch.call_args[0]
+        assert calls[0] == job.templates[0].source_uri
+        assert len(manager.patched_templates) == len(job.templates)
 
-        exp_filename = os.path.basename(job.templates[0].source_uri)
-        exp_path_1 = job.templates[0].source_uri
-        exp_path_2 = os.path.join('tmp',
-                                  job.templates[0].destination_path,
-                                  exp_filename)
+    def test_templates_are_patched_in_parallel(self):
+        job = new_job5()
+        job.templates = job.templates * 3
+        manager = JIM(job)
+        # Every render waits at the barrier, so this only completes if all
+        # three templates are rendered at the same time
+        barrier = threading.Barrier(3, timeout=5)
+
+        def apply_patch(template_path, parameters):
+            barrier.wait()
+            return template_path
+
+        with mock.patch.object(manager, '_apply_patch',
+                               side_effect=apply_patch):
+            with ThreadPoolExecutor(max_workers=3) as executor:
+                manager.patch_all_templates(executor)
+        assert [t.content for t in manager.patched_templates] == \
+            [t.source_uri.encode('utf-8') for t in job.templates]
+
+    @mock.patch('middleware.ssh.ssh.pass_command',
+                return_value=('', '', 0))
+    def test_files_are_copied_in_parallel(self, mock_pass_command):
+        job = new_job5()
+        manager = JIM(job)
+        files = job.scripts + job.inputs
+        barrier = threading.Barrier(len(files), timeout=5)
 
-        assert calls[0] == exp_path_1
-        assert calls[2] == exp_path_2
+        with mock.patch.object(ssh, '__init__',
+                               lambda self, *args, **kwargs: None):
+            with mock.patch('middleware.ssh.ssh.secure_copy',
+                            side_effect=lambda *args: barrier.wait()) \
+                    as mock_secure_copy:
+                with ThreadPoolExecutor(max_workers=len(files)) as executor:
+                    manager.transfer_all_files(mode='scp',
+                                               executor=executor)
+        assert mock_secure_copy.call_count == len(files)
+        assert mock_pass_command.call_count == len(files)
+
+    @mock.patch('middleware.ssh.ssh.secure_copy_data')
+    @mock.patch('middleware.ssh.ssh.secure_copy')
+    @mock.patch('middleware.ssh.ssh.pass_command')
+    def test_transfer_patched_templates_from_memory(
+            self, mock_pass_command, mock_secure_copy, mock_secure_copy_data):
+        mock_pass_command.return_value = ('', '', 0)
+        job = new_job5()
+        job.scripts = []
+        job.inputs = []
+        manager = JIM(job)
+        template = RenderedTemplate(source_uri="templates/a.nml",
+                                    destination_path="config",
+                                    content=b"x = 1\n")
+        manager.patched_templates = [template]
+        with mock.patch.object(ssh, '__init__',
+                               lambda self, *args, **kwargs: None):
+            manager.transfer_all_files(mode='scp')
+            manager.transfer_all_files(mode='archive')
+
+        assert mock_secure_copy.call_count == 0
+        mock_secure_copy_data.assert_called_once_with(
+            b"x = 1\n", posixpath.join(manager.job_working_directory_path,
+                                        "config", "a.nml"))
+        archive_bytes = mock_pass_command.call_args[1]['stdin_data']
+        with tarfile.open(fileobj=BytesIO(archive_bytes)) as archive:
+            assert archive.extractfile("config/a.nml").read() == b"x = 1\n"
 
     @mock.patch(
         'middleware.ssh.ssh.close_connection', side_effect=mock_close)
@@ -218,7 +289,7 @@ class TestJIM(object):
         manager = JIM(job)
         with mock.patch.object(ssh, '__init__',
                                lambda self, *args, **kwargs: None):
-            manager.transfer_all_files()
+            manager.transfer_all_files(mode='scp')
             calls = mock_secure_copy.call_args[0]
 
         job_working_directory_name = "{}-{}".format(job.case.label, job.id)
@@ -230,6 +301,200 @@ class TestJIM(object):
 
         assert calls[1] == expected_path
 
+    @mock.patch('middleware.ssh.ssh.secure_copy',
+                side_effect=AssertionError("Files should not be copied "
+                                           "one at a time"))
+    @mock.patch('middleware.ssh.ssh.pass_command')
+    def test_transfer_all_files_as_archive(self, mock_pass_command,
+                                           mock_secure_copy, tmpdir):
+        mock_pass_command.return_value = ('', '', 0)
+        job = new_job5()
+        for i, file_object in enumerate(job.scripts + job.inputs):
+            source = tmpdir.join("file{}.txt".format(i))
+            source.write("line\r\n")
+            file_object.source_uri = str(source)
+        manager = JIM(job)
+        with mock.patch.object(ssh, '__init__',
+                               lambda self, *args, **kwargs: None):
+            manager.transfer_all_files(mode='archive')
+
+        # A single command unpacks every file and converts line endings
+        assert mock_pass_command.call_count == 1
+        command = mock_pass_command.call_args[0][0]
+        archive_bytes = mock_pass_command.call_args[1]['stdin_data']
+        expected_names = [
+            posixpath.join(f.destination_path, os.path.basename(f.source_uri))
+            for f in job.scripts + job.inputs]
+        assert command.startswith("mkdir -p {0} && cd {0} && tar -xf -".format(
+            manager.job_working_directory_path))
+        assert command.endswith("dos2unix " + " ".join(expected_names))
+
+        with tarfile.open(fileobj=BytesIO(archive_bytes)) as archive:
+            assert archive.getnames() == expected_names
+            assert archive.extractfile(expected_names[0]).read() == \
+                b"line\r\n"
+
+    @mock.patch('middleware.ssh.ssh.pass_command')
+    def test_transfer_all_files_via_content_addressed_store(
+            self, mock_pass_command, tmpdir):
+        job = new_job5()
+        files = job.scripts + job.inputs
+        contents = [b"shared\r\n", b"shared\n"] + [
+            "file{}\n".format(i).encode() for i in range(len(files) - 2)]
+        for i, (file_object, content) in enumerate(zip(files, contents)):
+            source = tmpdir.join("file{}.txt".format(i))
+            source.write_binary(content)
+            file_object.source_uri = str(source)
+        # Line endings are converted before hashing, so the first two files
+        # share an object
+        digests = [hashlib.sha256(content.replace(b"\r\n", b"\n"))
+                   .hexdigest() for content in contents]
+        # The remote store already holds the last file
+        mock_pass_command.side_effect = [(digests[-1] + "\n", "", 0),
+                                         ("", "", 0)]
+        manager = JIM(job)
+        with mock.patch.object(ssh, '__init__',
+                               lambda self, *args, **kwargs: None):
+            manager.transfer_all_files(mode='cas')
+
+        assert mock_pass_command.call_count == 2
+        store = posixpath.join(manager.simulation_root, ".cas")
+        list_command = mock_pass_command.call_args_list[0][0][0]
+        assert list_command.startswith("mkdir -p {0} && cd {0} && ".format(
+            store))
+        # Objects are marked as used, and objects unused for too long
+        # removed, whenever the store is listed
+        assert "find . -maxdepth 1 -type f -mtime +30 -delete" in list_command
+        assert "touch -c -- " in list_command
+        assert all(digest in list_command for digest in digests)
+
+        command = mock_pass_command.call_args[0][0]
+        archive_bytes = mock_pass_command.call_args[1]['stdin_data']
+        with tarfile.open(fileobj=BytesIO(archive_bytes)) as archive:
+            assert sorted(archive.getnames()) == sorted(set(digests[:-1]))
+            assert archive.extractfile(digests[0]).read() == b"shared\n"
+        for digest, file_object in zip(digests, files):
+            destination = posixpath.join(
+                manager.job_working_directory_path,
+                file_object.destination_path,
+                os.path.basename(file_object.source_uri))
+            assert "rm -f {1} && cp {0} {1}".format(
+                digest, destination) in command
+        assert "ln " not in command
+
+    @pytest.mark.parametrize("mode", ["archive", "cas"])
+    @mock.patch('middleware.ssh.ssh.pass_command')
+    def test_failed_transfer_raises_bad_gateway(self, mock_pass_command,
+                                                mode, tmpdir):
+        job = new_job5()
+        for i, file_object in enumerate(job.scripts + job.inputs):
+            source = tmpdir.join("file{}.txt".format(i))
+            source.write("file{}\n".format(i))
+            file_object.source_uri = str(source)
+        mock_pass_command.side_effect = [("", "", 1),
+                                         ("", "tar: No space left", 2)]
+        if mode == "archive":
+            mock_pass_command.side_effect = [("", "tar: No space left", 2)]
+        manager = JIM(job)
+        with mock.patch.object(ssh, '__init__',
+                               lambda self, *args, **kwargs: None):
+            with pytest.raises(BadGateway) as error:
+                manager.transfer_all_files(mode=mode)
+        assert "tar: No space left" in error.value.description
+
+    def test_parameter_hash(self, tmpdir):
+        def job_with_input(job_id):
+            job = new_job5()
+            job.id = job_id
+            source = tmpdir.join("input.txt")
+            source.write("input")
+            job.inputs[0].source_uri = str(source)
+            return job
+
+        first = JIM(job_with_input("job1")).parameter_hash()
+        # The hash does not depend on the job itself
+        assert JIM(job_with_input("job2")).parameter_hash() == first
+
+        job = job_with_input("job2")
+        job.families[0].parameters[0].value = "changed"
+        assert JIM(job).parameter_hash() != first
+
+        job = job_with_input("job2")
+        tmpdir.join("input.txt").write("changed input")
+        assert JIM(job).parameter_hash() != first
+
+    @mock.patch('middleware.job_information_manager.job_information_manager.'
+                '_run_remote_script', return_value=('', '', 0))
+    @mock.patch('middleware.job_information_manager.job_information_manager.'
+                'transfer_all_files')
+    @mock.patch('middleware.job_information_manager.job_information_manager.'
+                'create_job_directory')
+    @mock.patch('middleware.job_information_manager.job_information_manager.'
+                'patch_all_templates')
+    def test_run_skips_setup_when_nothing_changed(
+            self, mock_patch, mock_create, mock_transfer, mock_run, tmpdir):
+        job = new_job5()
+        source = tmpdir.join("input.txt")
+        source.write("1")
+        job.inputs[0].source_uri = str(source)
+
+        JIM(job).run()
+        assert mock_transfer.call_count == 1
+        assert job.setup_fingerprint is not None
+
+        # Only the RUN script is run again
+        JIM(job).run()
+        assert mock_transfer.call_count == 1
+        assert [call[0][0] for call in mock_run.call_args_list] == [
+            'setup_job.sh', 'run_job.sh', 'run_job.sh']
+
+        # Changed inputs or parameters mean the job is set up again
+        source.write("2")
+        JIM(job).run()
+        assert mock_transfer.call_count == 2
+        job.families[0].parameters[0].value = "changed"
+        JIM(job).run()
+        assert mock_transfer.call_count == 3
+
+    @mock.patch('middleware.job_information_manager.job_information_manager.'
+                '_run_remote_script', return_value=('', '', 0))
+    @mock.patch('middleware.job_information_manager.job_information_manager.'
+                'transfer_all_files')
+    @mock.patch('middleware.job_information_manager.job_information_manager.'
+                'create_job_directory')
+    @mock.patch('middleware.job_information_manager.job_information_manager.'
+                'patch_all_templates')
+    def test_setup_without_setup_script_records_fingerprint(
+            self, mock_patch, mock_create, mock_transfer, mock_run, tmpdir):
+        job = new_job5()
+        job.scripts = [script for script in job.scripts
+                       if script.action != "SETUP"]
+        source = tmpdir.join("input.txt")
+        source.write("1")
+        job.inputs[0].source_uri = str(source)
+
+        result, code = JIM(job).setup()
+        assert code == 400
+        assert job.setup_fingerprint is not None
+
+        # so running the job does not copy its files again
+        JIM(job).run()
+        assert mock_transfer.call_count == 1
+        assert [call[0][0] for call in mock_run.call_args_list] == [
+            'run_job.sh']
+
+        # unless copying them failed
+        job.setup_fingerprint = None
+        mock_transfer.side_effect = BadGateway()
+        with pytest.raises(BadGateway):
+            JIM(job).setup()
+        assert job.setup_fingerprint is None
+
+    def test_unix_line_endings(self):
+        assert unix_line_endings(b"a\r\nb\r\n") == b"a\nb\n"
+        # binary files are left alone
+        assert unix_line_endings(b"\0\r\n") == b"\0\r\n"
+
     @mock.patch('middleware.job_information_manager.job_information_manager.'
                 '_run_remote_script', side_effect=mock_run_remote)
     def test_trigger_action_script_valid_verbs(self, mock_run):
@@ -285,6 +550,51 @@ class TestJIM(object):
             except Exception as e:
                 assert e == expected_exception
 
+    def test_remote_command_timeout_gives_504_exception(self):
+        job = new_job5()
+        manager = JIM(job)
+        connection = mock.Mock()
+        connection.pass_command.side_effect = mock_pass_command_timeout
+        with mock.patch('middleware.job_information_manager.connection_pool'
+                        ) as mock_pool:
+            mock_pool.acquire.return_value = connection
+            with pytest.raises(GatewayTimeout):
+                manager._run_remote_command('sleep 1000')
+            # The connection is still handed back to the pool
+            mock_pool.release.assert_called_once_with(connection)
+
+    def test_run_remote_script_quotes_arguments(self):
+        job = new_job5()
+        manager = JIM(job)
+        connection = mock.Mock()
+        connection.pass_command.return_value = ('out', 'err', 0)
+        with mock.patch('middleware.job_information_manager.connection_pool'
+                        ) as mock_pool:
+            mock_pool.acquire.return_value = connection
+            manager._run_remote_script('data.sh', 'path',
+                                       arguments=['1024', 'a b'])
+        command = connection.pass_command.call_args[0][0]
+        assert command == "cd path; bash data.sh 1024 'a b'"
+
+    @mock.patch('middleware.job_information_manager.job_information_manager.'
+                '_run_remote_script',
+                return_value=('{"data": {}, "cursor": 2048}', '', 0))
+    def test_data_passes_cursor_to_script(self, mock_run):
+        job = new_job5()
+        job.scripts.append(Script(action="DATA", source_uri="data.sh",
+                                  destination_path="."))
+        manager = JIM(job)
+        message, code = manager.data(cursor=1024)
+        assert mock_run.call_args[1]['arguments'] == ['1024']
+        assert message['stdout'] == {"data": {}, "cursor": 2048}
+        # Without a cursor the script is run with no arguments
+        manager.data()
+        assert 'arguments' not in mock_run.call_args[1]
+        # Packed columns are passed through as the script's stdout
+        message, code = manager.data(binary=True)
+        assert mock_run.call_args[1]['arguments'] == ['0', 'binary']
+        assert message['stdout'] == '{"data": {}, "cursor": 2048}'
+
     @mock.patch('middleware.job_information_manager.job_information_manager.'
                 '_run_remote_script', side_effect=(
                     lambda script, path: ('5305301.cx1b\n', 'err', '0')))
@@ -407,3 +717,76 @@ class TestJIM(object):
             manager = JIM(job)
             updated_status = manager.update_job_status()
             assert updated_status == s
+
+
+QSTAT_XML = (
+    '<?xml version="1.0"?><Data>'
+    '<Job><Job_Id>93.science-gateway-cluster</Job_Id>'
+    '<Job_Name>pbs.sh</Job_Name><job_state>R</job_state></Job>'
+    '<Job><Job_Id>94.science-gateway-cluster</Job_Id>'
+    '<Job_Name>pbs.sh</Job_Name><job_state>Q</job_state></Job>'
+    '</Data>\n')
+
+
+class TestBatchedStatus(object):
+
+    def test_parse_qstat_xml(self):
+        states = parse_qstat_xml(QSTAT_XML)
+        assert states == {"93.science-gateway-cluster": "R",
+                          "94.science-gateway-cluster": "Q"}
+
+    def test_parse_qstat_xml_with_one_document_per_job(self):
+        xml = ('<?xml version="1.0"?><Data><Job><Job_Id>1.cx1b</Job_Id>'
+               '<job_state>C</job_state></Job></Data>'
+               '<?xml version="1.0"?><Data><Job><Job_Id>2.cx1b</Job_Id>'
+               '<job_state>W</job_state></Job></Data>')
+        assert parse_qstat_xml(xml) == {"1.cx1b": "C", "2.cx1b": "W"}
+
+    def test_parse_qstat_xml_with_empty_or_invalid_output(self):
+        assert parse_qstat_xml("") == {}
+        assert parse_qstat_xml("qstat: Unknown Job Id") == {}
+
+    def test_backend_job_states_uses_a_single_command(self):
+        connection = mock.Mock()
+        connection.pass_command.return_value = (QSTAT_XML, '', 0)
+        with mock.patch('middleware.job_information_manager.connection_pool'
+                        ) as mock_pool:
+            mock_pool.acquire.return_value = connection
+            states = backend_job_states(["94.science-gateway-cluster",
+                                         "93.science-gateway-cluster",
+                                         None])
+        assert connection.pass_command.call_count == 1
+        command = connection.pass_command.call_args[0][0]
+        assert command == ("qstat -x 93.science-gateway-cluster "
+                           "94.science-gateway-cluster")
+        assert states["93.science-gateway-cluster"] == "R"
+
+    def test_backend_job_states_with_no_jobs_makes_no_remote_call(self):
+        with mock.patch('middleware.job_information_manager.connection_pool'
+                        ) as mock_pool:
+            assert backend_job_states([]) == {}
+            assert not mock_pool.acquire.called
+
+    @mock.patch('middleware.job_information_manager.backend_job_states',
+                side_effect=(lambda ids: {"1.cx1b": "R", "2.cx1b": "C"}))
+    def test_job_statuses_fans_out_states(self, mock_states):
+        jobs = []
+        for i, (status, backend_id) in enumerate([("Queued", "1.cx1b"),
+                                                  ("Running", "2.cx1b"),
+                                                  ("Queued", "3.cx1b"),
+                                                  ("Draft", None),
+                                                  ("Complete", "4.cx1b")]):
+            job = new_job5()
+            job.id = str(i)
+            job.status = status
+            job.backend_identifier = backend_id
+            jobs.append(job)
+
+        statuses = job_statuses(jobs)
+
+        assert mock_states.call_count == 1
+        # only jobs on the queue are looked up
+        assert sorted(mock_states.call_args[0][0]) == [
+            "1.cx1b", "2.cx1b", "3.cx1b"]
+        assert statuses == {"0": "Running", "1": "Complete", "2": "Queued",
+                            "3": "Draft", "4": "Complete"}
@@ -249,6 +249,7 @@ def new_job1_output_json():
             "creation_datetime": j1c_utc_string,
             "start_datetime": j1s_utc_string,
             "end_datetime": j1e_utc_string,
+            "status_checked_at": None,
             "families": [
                 {
                     "label": "j1f1label",
@@ -477,6 +478,7 @@ def new_job2_output_json():
             "creation_datetime": j2c_utc_string,
             "start_datetime": j2s_utc_string,
             "end_datetime": j2e_utc_string,
+            "status_checked_at": None,
             "families": [
                 {
                     "label": "j2f1label",
@@ -1,5 +1,6 @@
 import os
 import json
+import base64
 import pytest
 from flask import Flask
 import arrow
@@ -19,6 +20,10 @@ import new_jobs as nj  # for easy access to iso_string values
 from new_jobs import (new_job1, new_job2, new_job3, new_job4,
                       new_case1, new_job1_output_json)
 from config.base import MIDDLEWARE_URL, URI_STEMS
+from middleware.columnar import (COLUMNAR_MIMETYPE, encode_columns,
+                                 decode_columns)
+from middleware.job.result_store import ResultStore
+from middleware.job.pagination import encode_cursor
 
 CONFIG_NAME = "test"
 TEST_DB_URI = 'sqlite://'
@@ -93,11 +98,11 @@ def mock_run_remote_return_json(
     return out, 'err', '0'
 
 
-def mock_patch_all():
+def mock_patch_all(executor=None):
     return True
 
 
-def mock_transfer_all():
+def mock_transfer_all(executor=None):
     return True
 
 
@@ -144,6 +149,63 @@ class TestJobApi(object):
         assert job_response.status_code == 200
         assert response_to_json(job_response) == job1_json
 
+    def test_get_with_matching_etag_returns_304(self, session):
+        jobs = JobRepositorySqlAlchemy(session)
+        cases = CaseRepositorySqlAlchemy(session)
+        client = test_client(case_repository=cases, job_repository=jobs)
+        job1 = new_job1()
+        job1_id = job1.id
+        jobs.create(job1)
+        uri = "{}/{}".format(URI_STEMS['jobs'], job1_id)
+
+        job_response = client.get(uri)
+        etag = job_response.headers["ETag"]
+        assert job_response.status_code == 200
+        assert not etag.startswith("W/")
+
+        job_response = client.get(uri, headers={"If-None-Match": etag})
+        assert job_response.status_code == 304
+        assert job_response.headers["ETag"] == etag
+        assert job_response.get_data() == b""
+
+        # A changed job no longer matches the client's cached version
+        client.patch(uri, data=json.dumps({"id": job1_id, "name": "new"}),
+                     content_type='application/json')
+        job_response = client.get(uri, headers={"If-None-Match": etag})
+        assert job_response.status_code == 200
+        assert job_response.headers["ETag"] != etag
+        assert response_to_json(job_response)["name"] == "new"
+
+        # The job is not serialised just to tell the client it is current
+        etag = job_response.headers["ETag"]
+        with mock.patch('middleware.job.api.job_to_json') as mock_to_json:
+            job_response = client.get(uri, headers={"If-None-Match": etag})
+        assert job_response.status_code == 304
+        assert mock_to_json.call_count == 0
+
+        # Nor does a status change go unnoticed
+        jobs.update_status(job1_id, "Cancelled")
+        job_response = client.get(uri, headers={"If-None-Match": etag})
+        assert job_response.status_code == 200
+        assert response_to_json(job_response)["status"] == "Cancelled"
+
+    def test_get_with_matching_weak_etag_returns_304(self, session):
+        jobs = JobRepositorySqlAlchemy(session)
+        cases = CaseRepositorySqlAlchemy(session)
+        client = test_client(case_repository=cases, job_repository=jobs)
+        job1 = new_job1()
+        uri = "{}/{}".format(URI_STEMS['jobs'], job1.id)
+        jobs.create(job1)
+
+        # Responses that may be compressed carry a weak ETag
+        headers = {"Accept-Encoding": "gzip"}
+        etag = client.get(uri, headers=headers).headers["ETag"]
+        assert etag.startswith("W/")
+        headers["If-None-Match"] = etag
+        job_response = client.get(uri, headers=headers)
+        assert job_response.status_code == 304
+        assert job_response.headers["ETag"] == etag
+
     def test_get_for_nonexistent_job_returns_error_with_404(self, session):
         jobs = JobRepositorySqlAlchemy(session)
         cases = CaseRepositorySqlAlchemy(session)
@@ -604,6 +666,115 @@ class TestJobsApi(object):
             .sort(key=lambda x: x["id"]) ==\
             expected_response["jobs"].sort(key=lambda x: x["id"])
 
+    @mock.patch('middleware.job.api.job_statuses',
+                side_effect=lambda jobs: {job.id: "Complete" for job in jobs})
+    def test_get_saves_refreshed_statuses(self, mock_statuses, session):
+        jobs = JobRepositorySqlAlchemy(session)
+        cases = CaseRepositorySqlAlchemy(session)
+        client = test_client(case_repository=cases, job_repository=jobs)
+        job1 = new_job1()
+        job1.status = "Running"
+        job2 = new_job2()
+        job2.status = "Draft"
+        job1_id, job2_id = job1.id, job2.id
+        jobs.create(job1)
+        jobs.create(job2)
+
+        job_response = client.get(URI_STEMS['jobs'])
+        assert job_response.status_code == 200
+        statuses = {job["id"]: job["status"]
+                    for job in response_to_json(job_response)["jobs"]}
+        # Only the active job is refreshed
+        assert statuses == {job1_id: "Complete", job2_id: "Draft"}
+        assert jobs.get_by_id(job1_id).status == "Complete"
+        assert jobs.get_by_id(job1_id).status_checked_at is not None
+        assert jobs.get_by_id(job2_id).status_checked_at is None
+
+    def test_get_pages_with_limit_and_cursor(self, session):
+        jobs = JobRepositorySqlAlchemy(session)
+        cases = CaseRepositorySqlAlchemy(session)
+        client = test_client(case_repository=cases, job_repository=jobs)
+        job1 = new_job1()
+        job2 = new_job2()
+        job3 = new_job3()
+        # Jobs 2 and 3 were created at the same time so are ordered by id
+        expected_ids = [job3.id, job2.id, job1.id]
+        for job in [job1, job2, job3]:
+            jobs.create(job)
+
+        ids = []
+        query = "?limit=2&order=desc"
+        while True:
+            job_response = client.get(URI_STEMS['jobs'] + query)
+            assert job_response.status_code == 200
+            page = response_to_json(job_response)
+            assert len(page["jobs"]) <= 2
+            ids.extend(job["id"] for job in page["jobs"])
+            if page["next_cursor"] is None:
+                break
+            query = "?limit=2&order=desc&cursor=" + page["next_cursor"]
+        assert ids == expected_ids
+
+    def test_get_filters_by_status_and_user(self, session):
+        jobs = JobRepositorySqlAlchemy(session)
+        cases = CaseRepositorySqlAlchemy(session)
+        client = test_client(case_repository=cases, job_repository=jobs)
+        job1 = new_job1()
+        job2 = new_job2()
+        job3 = new_job3()
+        job_ids = [job1.id, job2.id, job3.id]
+        for job in [job1, job2, job3]:
+            jobs.create(job)
+
+        job_response = client.get(
+            URI_STEMS['jobs'] + "?status=j1status,j2status&user=j2user")
+        assert job_response.status_code == 200
+        assert [job["id"] for job in response_to_json(job_response)["jobs"]] \
+            == [job_ids[1]]
+        # The cursor is only included when a page limit is requested
+        assert "next_cursor" not in response_to_json(job_response)
+
+    def test_get_with_matching_etag_returns_304(self, session):
+        jobs = JobRepositorySqlAlchemy(session)
+        cases = CaseRepositorySqlAlchemy(session)
+        client = test_client(case_repository=cases, job_repository=jobs)
+        jobs.create(new_job1())
+
+        job_response = client.get(URI_STEMS['jobs'])
+        etag = job_response.headers["ETag"]
+        job_response = client.get(URI_STEMS['jobs'],
+                                  headers={"If-None-Match": etag})
+        assert job_response.status_code == 304
+
+        jobs.create(new_job2())
+        job_response = client.get(URI_STEMS['jobs'],
+                                  headers={"If-None-Match": etag})
+        assert job_response.status_code == 200
+        assert len(response_to_json(job_response)["jobs"]) == 2
+
+    def test_get_with_invalid_paging_returns_error_with_400(self, session):
+        jobs = JobRepositorySqlAlchemy(session)
+        cases = CaseRepositorySqlAlchemy(session)
+        client = test_client(case_repository=cases, job_repository=jobs)
+        bad_queries = {
+            "?limit=zero": "Limit must be an integer",
+            "?limit=0": "Limit must be at least 1",
+            "?cursor=not-a-cursor": "Invalid cursor",
+            # A cursor from the case listing holds a label, not a datetime
+            "?cursor=" + encode_cursor("Stirred Tank", "id"):
+                "Invalid cursor",
+            "?cursor=" + base64.urlsafe_b64encode(
+                b'{"a": 1, "b": 2}').decode("ascii"): "Invalid cursor",
+            "?sort=name": "Jobs can only be sorted by creation_datetime, "
+                          "start_datetime, end_datetime",
+            "?order=up": "Sort order must be asc or desc",
+            "?created_after=yesterday":
+                "created_after is not a valid datetime"}
+        for query, message in bad_queries.items():
+            job_response = client.get(URI_STEMS['jobs'] + query)
+            assert job_response.status_code == 400
+            assert response_to_json(job_response) == {"message": message}
+
     # === POST tests (CREATE) ===
     def test_post_for_nonexistent_job_returns_job_with_200(self, session):
         jobs = JobRepositorySqlAlchemy(session)
@@ -729,6 +900,150 @@ class TestRunApi(object):
         assert response_to_json(job_response)['stdout'] == 'j4s1source'
         assert job_response.status_code == 200
 
+    @mock.patch('middleware.job_information_manager.job_information_manager.'
+                '_run_remote_script', side_effect=lambda script, path: (
+                    '1234.cx1b\n', '', 0))
+    @mock.patch('middleware.job_information_manager.job_information_manager.'
+                'patch_all_templates', side_effect=mock_patch_all)
+    @mock.patch('middleware.job_information_manager.job_information_manager.'
+                'transfer_all_files', side_effect=mock_transfer_all)
+    @mock.patch('middleware.job_information_manager.job_information_manager.'
+                'create_job_directory', side_effect=mock_create_job_directory)
+    def test_run_asynchronously_returns_202(self, mock_create, mock_transfer,
+                                            mock_patch, mock_run, session):
+        jobs = JobRepositorySqlAlchemy(session)
+        cases = CaseRepositorySqlAlchemy(session)
+        with mock.patch('config.test.ASYNC_SUBMISSION', True):
+            app = create_app(CONFIG_NAME, cases, jobs)
+        client = app.test_client()
+
+        job = new_job4()
+        job_id = job.id
+        client.post(URI_STEMS['jobs'], data=json.dumps(job_to_json(job)),
+                    content_type='application/json')
+
+        job_response = client.post("{}/{}".format(URI_STEMS['run'], job_id),
+                                   data=json.dumps({"id": job_id}),
+                                   content_type='application/json')
+        assert job_response.status_code == 202
+        assert job_response.headers['Location'] == "{}{}/{}".format(
+            MIDDLEWARE_URL, URI_STEMS['jobs'], job_id)
+        assert response_to_json(job_response)['status'] == 'Submitting'
+
+        app._submission_queue.shutdown()
+        session.expire_all()
+        job = jobs.get_by_id(job_id)
+        assert job.status == "Queued"
+        assert job.backend_identifier == "1234.cx1b"
+        assert job.start_datetime is not None
+
+    @mock.patch('middleware.job_information_manager.job_information_manager.'
+                '_run_remote_script', side_effect=lambda script, path: (
+                    '', '', 0))
+    @mock.patch('middleware.job_information_manager.job_information_manager.'
+                'patch_all_templates', side_effect=mock_patch_all)
+    @mock.patch('middleware.job_information_manager.job_information_manager.'
+                'transfer_all_files', side_effect=mock_transfer_all)
+    @mock.patch('middleware.job_information_manager.job_information_manager.'
+                'create_job_directory', side_effect=mock_create_job_directory)
+    def test_run_after_setup_does_not_set_up_again(
+            self, mock_create, mock_transfer, mock_patch, mock_run, session):
+        jobs = JobRepositorySqlAlchemy(session)
+        cases = CaseRepositorySqlAlchemy(session)
+        client = test_client(case_repository=cases, job_repository=jobs)
+
+        job = new_job4()
+        job_id = job.id
+        client.post(URI_STEMS['jobs'], data=json.dumps(job_to_json(job)),
+                    content_type='application/json')
+        client.post("{}/{}".format(URI_STEMS['setup'], job_id),
+                    data=json.dumps({"id": job_id}),
+                    content_type='application/json')
+        assert mock_transfer.call_count == 1
+
+        job_response = client.post("{}/{}".format(URI_STEMS['run'], job_id),
+                                   data=json.dumps({"id": job_id}),
+                                   content_type='application/json')
+        assert job_response.status_code == 200
+        assert mock_transfer.call_count == 1
+        assert [call[0][0] for call in mock_run.call_args_list] == [
+            'j4s4source', 'j4s1source']
+
+    @mock.patch('middleware.job_information_manager.job_information_manager.'
+                '_run_remote_script', side_effect=lambda script, path: (
+                    '', '', 0))
+    @mock.patch('middleware.job_information_manager.job_information_manager.'
+                'patch_all_templates', side_effect=mock_patch_all)
+    @mock.patch('middleware.job_information_manager.job_information_manager.'
+                'transfer_all_files', side_effect=mock_transfer_all)
+    @mock.patch('middleware.job_information_manager.job_information_manager.'
+                'create_job_directory', side_effect=mock_create_job_directory)
+    def test_run_reuses_results_of_identical_complete_job(
+            self, mock_create, mock_transfer, mock_patch, mock_run, session,
+            tmpdir):
+        jobs = JobRepositorySqlAlchemy(session)
+        cases = CaseRepositorySqlAlchemy(session)
+        with mock.patch('config.test.RESULT_STORE_ROOT', str(tmpdir)):
+            client = test_client(case_repository=cases, job_repository=jobs)
+
+        # A job with the same parameters has already run to completion
+        job = new_job4()
+        complete_id = job.id
+        client.post(URI_STEMS['jobs'], data=json.dumps(job_to_json(job)),
+                    content_type='application/json')
+        client.post("{}/{}".format(URI_STEMS['run'], complete_id),
+                    data=json.dumps({"id": complete_id}),
+                    content_type='application/json')
+        jobs.update_status(complete_id, "Complete")
+        progress = {"stdout": {"progress": {"value": 100}}, "stderr": "",
+                    "exit_code": 0}
+        store = ResultStore(str(tmpdir))
+        store.put(complete_id, "PROGRESS", progress)
+        store.put(complete_id, "DATA", {"stdout": {}, "stderr": "",
+                                        "exit_code": 0})
+        run_count = mock_run.call_count
+
+        job_json = job_to_json(new_job4())
+        job_json["id"] = job_id = "reused-job"
+        client.post(URI_STEMS['jobs'], data=json.dumps(job_json),
+                    content_type='application/json')
+        job_response = client.post(
+            "{}/{}?reuse=true".format(URI_STEMS['run'], job_id),
+            data=json.dumps({"id": job_id}), content_type='application/json')
+        assert job_response.status_code == 200
+        assert response_to_json(job_response)['reused_job_id'] == complete_id
+        assert mock_run.call_count == run_count
+
+        session.expire_all()
+        assert jobs.get_by_id(job_id).status == "Complete"
+        job_response = client.get("{}/{}".format(URI_STEMS['progress'],
+                                                 job_id))
+        assert response_to_json(job_response) == progress
+        assert mock_run.call_count == run_count
+
+    @mock.patch('middleware.job_information_manager.job_information_manager.'
+                'patch_all_templates', side_effect=OSError("Template missing"))
+    def test_failed_asynchronous_run_sets_error_status(self, mock_patch,
+                                                       session):
+        jobs = JobRepositorySqlAlchemy(session)
+        cases = CaseRepositorySqlAlchemy(session)
+        with mock.patch('config.test.ASYNC_SUBMISSION', True):
+            app = create_app(CONFIG_NAME, cases, jobs)
+        client = app.test_client()
+
+        job = new_job4()
+        job_id = job.id
+        client.post(URI_STEMS['jobs'], data=json.dumps(job_to_json(job)),
+                    content_type='application/json')
+        job_response = client.post("{}/{}".format(URI_STEMS['run'], job_id),
+                                   data=json.dumps({"id": job_id}),
+                                   content_type='application/json')
+        assert job_response.status_code == 202
+
+        app._submission_queue.shutdown()
+        session.expire_all()
+        assert jobs.get_by_id(job_id).status == "Error"
+
     def test_run_with_invalid_id(self, session):
         jobs = JobRepositorySqlAlchemy(session)
         cases = CaseRepositorySqlAlchemy(session)
@@ -950,6 +1265,76 @@ class TestProgressApi(object):
         assert response_to_json(job_response)['stdout']['name'] == 'j4s2source'
         assert job_response.status_code == 200
 
+    @mock.patch('middleware.job_information_manager.job_information_manager.'
+                '_run_remote_script', side_effect=lambda script, path: (
+                    json.dumps({"name": script}), '', 0))
+    def test_progress_of_complete_job_is_cached(self, mock_run, session):
+        jobs = JobRepositorySqlAlchemy(session)
+        cases = CaseRepositorySqlAlchemy(session)
+        client = test_client(case_repository=cases, job_repository=jobs)
+
+        job = new_job4()
+        job_id = job.id
+        client.post(URI_STEMS['jobs'], data=json.dumps(job_to_json(job)),
+                    content_type='application/json')
+        uri = "{}/{}".format(URI_STEMS['progress'], job_id)
+
+        # Only Running and Complete jobs are cached
+        client.get(uri)
+        client.get(uri)
+        assert mock_run.call_count == 2
+
+        job = jobs.get_by_id(job_id)
+        job.status = "Complete"
+        jobs.update(job)
+        for _ in range(3):
+            job_response = client.get(uri)
+            assert job_response.status_code == 200
+            assert response_to_json(job_response)['stdout']['name'] == \
+                'j4s2source'
+        assert mock_run.call_count == 3
+
+    @mock.patch('middleware.job_information_manager.job_information_manager.'
+                '_run_remote_script', side_effect=lambda script, path: (
+                    json.dumps({"name": script}), '', 0))
+    @mock.patch('middleware.job_information_manager.job_information_manager.'
+                'patch_all_templates', side_effect=mock_patch_all)
+    @mock.patch('middleware.job_information_manager.job_information_manager.'
+                'transfer_all_files', side_effect=mock_transfer_all)
+    @mock.patch('middleware.job_information_manager.job_information_manager.'
+                'create_job_directory', side_effect=mock_create_job_directory)
+    def test_progress_is_not_cached_across_runs(
+            self, mock_create, mock_transfer, mock_patch, mock_run, session):
+        jobs = JobRepositorySqlAlchemy(session)
+        cases = CaseRepositorySqlAlchemy(session)
+        client = test_client(case_repository=cases, job_repository=jobs)
+
+        job = new_job4()
+        job_id = job.id
+        job.status = "Complete"
+        jobs.create(job)
+        uri = "{}/{}".format(URI_STEMS['progress'], job_id)
+
+        def progress_runs():
+            return [call[0][0] for call in mock_run.call_args_list].count(
+                'j4s2source')
+
+        client.get(uri)
+        client.get(uri)
+        assert progress_runs() == 1
+
+        # Running the job again means its cached progress is out of date
+        for action in ['setup', 'run']:
+            client.post("{}/{}".format(URI_STEMS[action], job_id),
+                        data=json.dumps({"id": job_id}),
+                        content_type='application/json')
+            job = jobs.get_by_id(job_id)
+            job.status = "Complete"
+            jobs.update(job)
+            client.get(uri)
+            client.get(uri)
+        assert progress_runs() == 3
+
     def test_progress_with_invalid_id(self, session):
         jobs = JobRepositorySqlAlchemy(session)
         cases = CaseRepositorySqlAlchemy(session)
@@ -976,6 +1361,175 @@ class TestProgressApi(object):
         assert job_response.status_code == 404
 
 
+def mock_run_remote_return_arguments(
+        script_name, remote_path, debug=True, arguments=None):
+    out = json.dumps({"name": script_name, "arguments": arguments})
+    return out, 'err', '0'
+
+
+class TestDataApi(object):
+
+    @mock.patch('middleware.job_information_manager.job_information_manager.'
+                '_run_remote_script',
+                side_effect=mock_run_remote_return_arguments)
+    def test_data_with_cursor(self, mock_run, session):
+        jobs = JobRepositorySqlAlchemy(session)
+        cases = CaseRepositorySqlAlchemy(session)
+        client = test_client(case_repository=cases, job_repository=jobs)
+
+        job_json = job_to_json(new_job4())
+        job_json["scripts"].append({"action": "DATA",
+                                    "source_uri": "data.sh",
+                                    "destination_path": "."})
+        client.post(URI_STEMS['jobs'], data=json.dumps(job_json),
+                    content_type='application/json')
+
+        uri = "{}/{}".format(URI_STEMS['data'], job_json["id"])
+        job_response = client.get(uri + "?cursor=1024")
+        assert job_response.status_code == 200
+        assert response_to_json(job_response)['stdout'] == {
+            "name": "data.sh", "arguments": ["1024"]}
+
+        job_response = client.get(uri)
+        assert response_to_json(job_response)['stdout'] == {
+            "name": "data.sh", "arguments": None}
+
+    @mock.patch('middleware.job_information_manager.job_information_manager.'
+                '_run_remote_script', side_effect=lambda script, path: (
+                    json.dumps({"data": {"keys": ["time", "value"],
+                                         "time": list(range(100)),
+                                         "value": list(range(100))}}),
+                    '', 0))
+    def test_data_with_points_is_downsampled(self, mock_run, session):
+        jobs = JobRepositorySqlAlchemy(session)
+        cases = CaseRepositorySqlAlchemy(session)
+        client = test_client(case_repository=cases, job_repository=jobs)
+        job_json = job_to_json(new_job4())
+        job_json["scripts"].append({"action": "DATA",
+                                    "source_uri": "data.sh",
+                                    "destination_path": "."})
+        client.post(URI_STEMS['jobs'], data=json.dumps(job_json),
+                    content_type='application/json')
+
+        job_response = client.get("{}/{}?points=10".format(
+            URI_STEMS['data'], job_json["id"]))
+        data = response_to_json(job_response)['stdout']['data']
+        assert job_response.status_code == 200
+        assert len(data["time"]) == len(data["value"]) == 10
+        assert data["time"][0] == 0 and data["time"][-1] == 99
+
+        job_response = client.get("{}/{}?points=2".format(
+            URI_STEMS['data'], job_json["id"]))
+        assert job_response.status_code == 400
+
+    @mock.patch('middleware.job_information_manager.job_information_manager.'
+                '_run_remote_script')
+    def test_data_accepting_columns_returns_packed_columns(self, mock_run,
+                                                           session):
+        data_object = {"data": {"keys": ["time", "value"],
+                                "time": [float(i) for i in range(100)],
+                                "value": [float(i) for i in range(100)]},
+                       "cursor": 100}
+        packed = encode_columns(data_object)
+        mock_run.return_value = (
+            base64.b64encode(packed).decode("ascii") + "\n", "", 0)
+        jobs = JobRepositorySqlAlchemy(session)
+        cases = CaseRepositorySqlAlchemy(session)
+        client = test_client(case_repository=cases, job_repository=jobs)
+        job_json = job_to_json(new_job4())
+        job_json["scripts"].append({"action": "DATA",
+                                    "source_uri": "data.sh",
+                                    "destination_path": "."})
+        client.post(URI_STEMS['jobs'], data=json.dumps(job_json),
+                    content_type='application/json')
+        uri = "{}/{}".format(URI_STEMS['data'], job_json["id"])
+        headers = {"Accept": COLUMNAR_MIMETYPE}
+
+        job_response = client.get(uri, headers=headers)
+        assert job_response.status_code == 200
+        assert job_response.mimetype == COLUMNAR_MIMETYPE
+        assert job_response.get_data() == packed
+        assert mock_run.call_args[1]['arguments'] == ['0', 'binary']
+
+        job_response = client.get(uri + "?points=10", headers=headers)
+        downsampled = decode_columns(job_response.get_data())
+        assert len(downsampled["data"]["time"]) == 10
+        assert downsampled["cursor"] == 100
+
+    @mock.patch('middleware.job_information_manager.job_information_manager.'
+                '_run_remote_script',
+                return_value=("Traceback: no such file\n", "", 0))
+    def test_data_with_malformed_columns_returns_error_with_502(
+            self, mock_run, session):
+        jobs = JobRepositorySqlAlchemy(session)
+        cases = CaseRepositorySqlAlchemy(session)
+        client = test_client(case_repository=cases, job_repository=jobs)
+        job_json = job_to_json(new_job4())
+        job_json["scripts"].append({"action": "DATA",
+                                    "source_uri": "data.sh",
+                                    "destination_path": "."})
+        client.post(URI_STEMS['jobs'], data=json.dumps(job_json),
+                    content_type='application/json')
+        uri = "{}/{}".format(URI_STEMS['data'], job_json["id"])
+
+        job_response = client.get(uri, headers={"Accept": COLUMNAR_MIMETYPE})
+        assert job_response.status_code == 502
+        assert response_to_json(job_response) == {
+            "message": "DATA script output is not base64 encoded packed "
+                       "columns"}
+
+    @mock.patch('middleware.job_information_manager.job_information_manager.'
+                '_run_remote_script', side_effect=lambda script, path: (
+                    json.dumps({"data": {"keys": ["time", "value"],
+                                         "time": [0.0, 1.0],
+                                         "value": [2.0, 3.0]},
+                                "offset": 10, "cursor": 30}), '', 0))
+    def test_complete_job_data_is_served_from_result_store(
+            self, mock_run, session, tmpdir):
+        jobs = JobRepositorySqlAlchemy(session)
+        cases = CaseRepositorySqlAlchemy(session)
+        with mock.patch('config.test.RESULT_STORE_ROOT', str(tmpdir)):
+            client = test_client(case_repository=cases, job_repository=jobs)
+        job = new_job4()
+        job.status = "Complete"
+        job.scripts.append(Script(action="DATA", source_uri="data.sh",
+                                  destination_path="."))
+        job_id = job.id
+        jobs.create(job)
+        uri = "{}/{}".format(URI_STEMS['data'], job_id)
+
+        # The first request pulls just the final DATA result
+        job_response = client.get(uri)
+        assert job_response.status_code == 200
+        assert response_to_json(job_response)['stdout']['cursor'] == 30
+        assert mock_run.call_count == 1
+
+        job_response = client.get(uri + "?cursor=30")
+        assert response_to_json(job_response)['stdout']['data']['time'] == []
+        job_response = client.get(uri, headers={"Accept": COLUMNAR_MIMETYPE})
+        assert decode_columns(job_response.get_data())['data']['value'] == [
+            2.0, 3.0]
+        assert mock_run.call_count == 1
+        for _ in range(2):
+            client.get("{}/{}".format(URI_STEMS['progress'], job_id))
+        assert mock_run.call_count == 2
+
+        client.delete("{}/{}".format(URI_STEMS['jobs'], job_id))
+        assert tmpdir.listdir() == []
+
+    def test_data_with_invalid_cursor(self, session):
+        jobs = JobRepositorySqlAlchemy(session)
+        cases = CaseRepositorySqlAlchemy(session)
+        client = test_client(case_repository=cases, job_repository=jobs)
+        job = new_job4()
+        jobs.create(job)
+        job_response = client.get("{}/{}?cursor=-1".format(
+            URI_STEMS['data'], job.id))
+        assert job_response.status_code == 400
+        assert response_to_json(job_response) == {
+            "message": "Cursor must be a non-negative integer"}
+
+
 class TestCasesApi(object):
 
     def test_get_cases_valid_request(self, session):
@@ -987,13 +1541,14 @@ class TestCasesApi(object):
         case1 = new_case1()
         session.add(case1)
         session.commit()
+        case1_id = case1.id
 
         response = client.get(URI_STEMS['cases'])
 
         expected_json = {
             "cases": [{
                 "label": "c1label",
-                'id': case1.id,
+                'id': case1_id,
                 'description': 'c1description',
                 'thumbnail': 'c1thumbnail',
                 'uri': 'c1uri'}
@@ -1002,6 +1557,153 @@ class TestCasesApi(object):
         assert response.status_code == 200
         assert response_to_json(response) == expected_json
 
+    def test_get_cases_honours_conditional_headers(self, session):
+        cases = CaseRepositorySqlAlchemy(session)
+        jobs = JobRepositorySqlAlchemy(session)
+        client = test_client(case_repository=cases, job_repository=jobs)
+        session.add(new_case1())
+        session.commit()
+
+        response = client.get(URI_STEMS['cases'])
+        etag = response.headers["ETag"]
+        last_modified = response.headers["Last-Modified"]
+        response = client.get(URI_STEMS['cases'],
+                              headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        response = client.get(URI_STEMS['cases'],
+                              headers={"If-Modified-Since": last_modified})
+        assert response.status_code == 304
+        # If-None-Match takes precedence over If-Modified-Since
+        response = client.get(URI_STEMS['cases'],
+                              headers={"If-None-Match": '"other"',
+                                       "If-Modified-Since": last_modified})
+        assert response.status_code == 200
+
+    def test_get_cases_pages_by_label(self, session):
+        cases = CaseRepositorySqlAlchemy(session)
+        jobs = JobRepositorySqlAlchemy(session)
+        client = test_client(case_repository=cases, job_repository=jobs)
+        labels = ["c{}label".format(i) for i in range(5)]
+        for i, label in enumerate(reversed(labels)):
+            case = new_case1()
+            case.id = "case{}".format(i)
+            case.label = label
+            session.add(case)
+        session.commit()
+
+        response = client.get(URI_STEMS['cases'] + "?limit=3")
+        page = response_to_json(response)
+        assert [case["label"] for case in page["cases"]] == labels[:3]
+        response = client.get(URI_STEMS['cases'] + "?limit=3&cursor=" +
+                              page["next_cursor"])
+        page = response_to_json(response)
+        assert [case["label"] for case in page["cases"]] == labels[3:]
+        assert page["next_cursor"] is None
+
+
+def add_stirred_tank_case(session):
+    case = json_to_case_list(CASES_JSON_FILENAME)[0]
+    case_id = case.id
+    session.add(case)
+    session.commit()
+    return case_id
+
+
+class TestSweepsApi(object):
+
+    @mock.patch('middleware.job.api.submit_sweep',
+                return_value=('1234[].cx1b\n', '', 0))
+    def test_sweep_is_submitted_as_array_job(self, mock_submit, session):
+        jobs = JobRepositorySqlAlchemy(session)
+        cases = CaseRepositorySqlAlchemy(session)
+        client = test_client(case_repository=cases, job_repository=jobs)
+        case_id = add_stirred_tank_case(session)
+
+        sweep = {"case_id": case_id,
+                 "parameters": {"tank_radius": {"min_value": "0.01",
+                                                "max_value": "0.03",
+                                                "step": "0.01"}}}
+        response = client.post(URI_STEMS['sweeps'], data=json.dumps(sweep),
+                               content_type='application/json')
+        assert response.status_code == 200
+        response_json = response_to_json(response)
+        assert response_json['backend_identifier'] == '1234[].cx1b'
+        assert response_json['status'] == 'Queued'
+        assert mock_submit.call_count == 1
+
+        session.expire_all()
+        swept = [jobs.get_by_id(job['id']) for job in response_json['jobs']]
+        assert [job.backend_identifier for job in swept] == [
+            '1234[1].cx1b', '1234[2].cx1b', '1234[3].cx1b']
+        assert all(job.status == 'Queued' for job in swept)
+        assert [parameter.value for job in swept
+                for family in job.families
+                for parameter in family.parameters
+                if parameter.name == 'tank_radius'] == [
+            '0.01', '0.02', '0.03']
+
+    @mock.patch('middleware.job.api.submit_sweep',
+                return_value=('1234.cx1b\n', '', 0))
+    def test_sweep_keeps_unexpected_identifier_of_accepted_array_job(
+            self, mock_submit, session):
+        jobs = JobRepositorySqlAlchemy(session)
+        cases = CaseRepositorySqlAlchemy(session)
+        client = test_client(case_repository=cases, job_repository=jobs)
+        case_id = add_stirred_tank_case(session)
+
+        sweep = {"case_id": case_id,
+                 "parameters": {"tank_radius": {"max_value": "0.02"}}}
+        response = client.post(URI_STEMS['sweeps'], data=json.dumps(sweep),
+                               content_type='application/json')
+        response_json = response_to_json(response)
+        assert response_json['backend_identifier'] == '1234.cx1b'
+        assert response_json['status'] == 'Queued'
+        session.expire_all()
+        swept = [jobs.get_by_id(job['id']) for job in response_json['jobs']]
+        assert all(job.status == 'Queued' for job in swept)
+        assert all(job.backend_identifier == '1234.cx1b' for job in swept)
+
+    @mock.patch('middleware.job.api.submit_sweep',
+                return_value=('', 'qsub: illegal -J value', 1))
+    def test_failed_sweep_sets_error_status(self, mock_submit, session):
+        jobs = JobRepositorySqlAlchemy(session)
+        cases = CaseRepositorySqlAlchemy(session)
+        client = test_client(case_repository=cases, job_repository=jobs)
+        case_id = add_stirred_tank_case(session)
+
+        sweep = {"case_id": case_id, "parameters": {"tank_num_blades": {}}}
+        response = client.post(URI_STEMS['sweeps'], data=json.dumps(sweep),
+                               content_type='application/json')
+        response_json = response_to_json(response)
+        assert response_json['status'] == 'Error'
+        assert response_json['stderr'] == 'qsub: illegal -J value'
+        session.expire_all()
+        assert [jobs.get_by_id(job['id']).status
+                for job in response_json['jobs']] == ['Error'] * 5
+
+    @mock.patch('middleware.job.api.submit_sweep')
+    def test_invalid_sweeps_create_no_jobs(self, mock_submit, session):
+        jobs = JobRepositorySqlAlchemy(session)
+        cases = CaseRepositorySqlAlchemy(session)
+        with mock.patch('config.test.SWEEP_MAX_JOBS', 10):
+            client = test_client(case_repository=cases, job_repository=jobs)
+        case_id = add_stirred_tank_case(session)
+
+        response = client.post(URI_STEMS['sweeps'], data=json.dumps(
+            {"case_id": "unknown", "parameters": {"tank_radius": {}}}),
+            content_type='application/json')
+        assert response.status_code == 404
+        # 4 radii and 5 blade counts make 20 jobs
+        response = client.post(URI_STEMS['sweeps'], data=json.dumps(
+            {"case_id": case_id,
+             "parameters": {"tank_radius": {"max_value": "0.004"},
+                            "tank_num_blades": {}}}),
+            content_type='application/json')
+        assert response.status_code == 400
+        assert "maximum of 10" in response_to_json(response)['message']
+        assert jobs.list_ids() == []
+        assert mock_submit.call_count == 0
+
 
 class TestCaseApi(object):
 
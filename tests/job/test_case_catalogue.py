@@ -0,0 +1,141 @@
+import pytest
+from flask import Flask
+from sqlalchemy import event
+from middleware.database import db as _db
+from middleware.job.case_catalogue import CaseCatalogue
+from middleware.job.sqlalchemy_repository import CaseRepositorySqlAlchemy
+from middleware.job.models import case_to_job
+from middleware.job.schema import job_to_json
+from new_jobs import new_case1
+
+
+@pytest.fixture(scope='session')
+def app(request):
+    """Session-wide test Flask app"""
+    app = Flask(__name__, instance_relative_config=True)
+    app.config.from_object("config.test")
+    _db.init_app(app)
+
+    ctx = app.app_context()
+    ctx.push()
+
+    def teardown():
+        ctx.pop()
+
+    request.addfinalizer(teardown)
+    return app
+
+
+@pytest.fixture(scope='session')
+def db(app, request):
+    """Session-wide test database"""
+    def teardown():
+        _db.drop_all()
+
+    _db.app = app
+    _db.create_all()
+
+    request.addfinalizer(teardown)
+    return _db
+
+
+@pytest.fixture(scope='function')
+def session(db, request):
+    """Function-wide SQLAlchemy session for each test"""
+    connection = db.engine.connect()
+    transaction = connection.begin()
+
+    options = dict(bind=connection, binds={}, expire_on_commit=True)
+    session = db.create_scoped_session(options=options)
+
+    db.session = session
+
+    def teardown():
+        transaction.rollback()
+        connection.close()
+        session.remove()
+
+    request.addfinalizer(teardown)
+    return session
+
+
+def add_cases(session, labels):
+    case_ids = []
+    for i, label in enumerate(labels):
+        case = new_case1()
+        case.id = "case{}".format(i)
+        case.label = label
+        session.add(case)
+        case_ids.append(case.id)
+    session.commit()
+    return case_ids
+
+
+def count_statements(session, function):
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    engine = session.get_bind()
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        function()
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    return len(statements)
+
+
+class TestCaseCatalogue(object):
+
+    def test_summaries_are_ordered_by_label(self, session):
+        catalogue = CaseCatalogue(CaseRepositorySqlAlchemy(session))
+        add_cases(session, ["b", "c", "a"])
+        summaries = catalogue.summaries()
+        assert [case["label"] for case in summaries] == ["a", "b", "c"]
+        assert catalogue.summaries(limit=1, after=("a", "case2")) == \
+            summaries[1:2]
+
+    def test_job_json_matches_case_job(self, session):
+        cases = CaseRepositorySqlAlchemy(session)
+        catalogue = CaseCatalogue(cases)
+        case_id, = add_cases(session, ["a"])
+        expected = job_to_json(case_to_job(cases.get_by_id(case_id)))
+        job_json = catalogue.job_json(case_id)
+        for field in ["id", "uri"]:
+            expected.pop(field)
+        assert {key: value for key, value in job_json.items()
+                if key not in ["id", "uri"]} == expected
+        assert job_json["uri"].endswith(job_json["id"])
+
+    def test_job_json_has_a_new_id_each_time(self, session):
+        catalogue = CaseCatalogue(CaseRepositorySqlAlchemy(session))
+        case_id, = add_cases(session, ["a"])
+        assert catalogue.job_json(case_id)["id"] != \
+            catalogue.job_json(case_id)["id"]
+
+    def test_job_json_for_unknown_case_is_none(self, session):
+        catalogue = CaseCatalogue(CaseRepositorySqlAlchemy(session))
+        add_cases(session, ["a"])
+        assert catalogue.job_json("unknown") is None
+
+    def test_cached_catalogue_does_not_query_database(self, session):
+        catalogue = CaseCatalogue(CaseRepositorySqlAlchemy(session))
+        case_id, = add_cases(session, ["a"])
+        assert count_statements(session, catalogue.summaries) > 0
+        assert count_statements(session, catalogue.summaries) == 0
+        assert count_statements(
+            session, lambda: catalogue.job_json(case_id)) == 0
+
+    def test_catalogue_is_rebuilt_when_cases_change(self, session):
+        cases = CaseRepositorySqlAlchemy(session)
+        catalogue = CaseCatalogue(cases)
+        case_id, = add_cases(session, ["a"])
+        assert len(catalogue.summaries()) == 1
+        case = new_case1()
+        case.id = "another case"
+        cases.create(case)
+        assert len(catalogue.summaries()) == 2
+        cases.get_by_id(case_id).label = "renamed"
+        session.commit()
+        assert "renamed" in [case["label"] for case in catalogue.summaries()]
@@ -0,0 +1,183 @@
+import threading
+from types import SimpleNamespace
+from middleware.job.result_cache import ResultCache
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class Script(object):
+    """Stands in for a remote script, counting how often it is run"""
+
+    def __init__(self, exit_code=0, code=200):
+        self.runs = 0
+        self.exit_code = exit_code
+        self.code = code
+
+    def __call__(self):
+        self.runs += 1
+        return {"stdout": {"run": self.runs}, "stderr": "",
+                "exit_code": self.exit_code}, self.code
+
+
+def job(status, job_id="job1"):
+    return SimpleNamespace(id=job_id, status=status)
+
+
+class TestResultCache(object):
+
+    def test_running_results_expire(self):
+        clock = Clock()
+        cache = ResultCache(running_ttl=5, clock=clock)
+        script = Script()
+        running = job("Running")
+
+        cache.get(running, "PROGRESS", [], script)
+        clock.now = 4
+        result, code = cache.get(running, "PROGRESS", [], script)
+        assert script.runs == 1
+        assert result["stdout"] == {"run": 1} and code == 200
+
+        clock.now = 5
+        result, code = cache.get(running, "PROGRESS", [], script)
+        assert script.runs == 2
+        assert result["stdout"] == {"run": 2}
+
+    def test_complete_results_do_not_expire(self):
+        clock = Clock()
+        cache = ResultCache(running_ttl=5, clock=clock)
+        script = Script()
+        cache.get(job("Complete"), "DATA", [None, False], script)
+        clock.now = 10 ** 6
+        cache.get(job("Complete"), "DATA", [None, False], script)
+        assert script.runs == 1
+
+    def test_results_are_keyed_by_job_action_and_arguments(self):
+        cache = ResultCache()
+        script = Script()
+        cache.get(job("Complete"), "DATA", [None, False], script)
+        cache.get(job("Complete"), "DATA", [1024, False], script)
+        cache.get(job("Complete"), "PROGRESS", [], script)
+        cache.get(job("Complete", "job2"), "PROGRESS", [], script)
+        assert script.runs == 4
+        assert len(cache) == 4
+
+    def test_other_statuses_are_not_cached(self):
+        cache = ResultCache()
+        script = Script()
+        for status in ["Draft", "Queued", "Error", "Cancelled"]:
+            cache.get(job(status), "PROGRESS", [], script)
+            cache.get(job(status), "PROGRESS", [], script)
+        assert script.runs == 8
+        assert len(cache) == 0
+
+    def test_results_are_not_reused_after_status_changes(self):
+        cache = ResultCache()
+        script = Script()
+        cache.get(job("Running"), "PROGRESS", [], script)
+        result, code = cache.get(job("Complete"), "PROGRESS", [], script)
+        assert result["stdout"] == {"run": 2}
+
+    def test_failures_are_not_cached(self):
+        cache = ResultCache()
+        for script in [Script(exit_code=1), Script(code=400)]:
+            cache.get(job("Complete"), "PROGRESS", [], script)
+            cache.get(job("Complete"), "PROGRESS", [], script)
+            assert script.runs == 2
+
+    def test_least_recently_used_result_is_evicted(self):
+        cache = ResultCache(max_entries=2)
+        script = Script()
+        cache.get(job("Complete", "job1"), "PROGRESS", [], script)
+        cache.get(job("Complete", "job2"), "PROGRESS", [], script)
+        cache.get(job("Complete", "job1"), "PROGRESS", [], script)
+        cache.get(job("Complete", "job3"), "PROGRESS", [], script)
+        assert script.runs == 3
+
+        cache.get(job("Complete", "job1"), "PROGRESS", [], script)
+        assert script.runs == 3
+        cache.get(job("Complete", "job2"), "PROGRESS", [], script)
+        assert script.runs == 4
+
+    def test_results_are_bounded_by_size(self):
+        # Each result is about 60 bytes as JSON
+        cache = ResultCache(max_bytes=150)
+        script = Script()
+        cache.get(job("Complete", "job1"), "PROGRESS", [], script)
+        cache.get(job("Complete", "job2"), "PROGRESS", [], script)
+        cache.get(job("Complete", "job3"), "PROGRESS", [], script)
+        assert len(cache) == 2
+        cache.get(job("Complete", "job1"), "PROGRESS", [], script)
+        assert script.runs == 4
+
+        # Results larger than the whole cache are not kept at all
+        cache = ResultCache(max_bytes=10)
+        cache.get(job("Complete"), "PROGRESS", [], script)
+        assert len(cache) == 0
+
+    def test_invalidated_results_are_run_again(self):
+        cache = ResultCache()
+        script = Script()
+        cache.get(job("Complete", "job1"), "PROGRESS", [], script)
+        cache.get(job("Complete", "job1"), "DATA", [], script)
+        cache.get(job("Complete", "job2"), "PROGRESS", [], script)
+        cache.invalidate("job1")
+        assert len(cache) == 1
+        cache.get(job("Complete", "job1"), "PROGRESS", [], script)
+        cache.get(job("Complete", "job2"), "PROGRESS", [], script)
+        assert script.runs == 4
+
+    def test_results_of_scripts_running_when_invalidated_are_not_kept(self):
+        cache = ResultCache()
+
+        def script():
+            cache.invalidate("job1")
+            return {"stdout": "old", "stderr": "", "exit_code": 0}, 200
+
+        result, code = cache.get(job("Complete"), "DATA", [], script)
+        assert result["stdout"] == "old"
+        assert len(cache) == 0
+
+    def test_callers_get_their_own_copy(self):
+        cache = ResultCache()
+        script = Script()
+        result, code = cache.get(job("Complete"), "DATA", [], script)
+        result["stdout"]["run"] = 100
+        result, code = cache.get(job("Complete"), "DATA", [], script)
+        assert result["stdout"] == {"run": 1}
+
+    def test_concurrent_requests_share_one_run(self):
+        cache = ResultCache()
+        started = threading.Event()
+        release = threading.Event()
+        runs = []
+
+        def slow_script():
+            runs.append(1)
+            started.set()
+            release.wait(5)
+            return {"stdout": "data", "stderr": "", "exit_code": 0}, 200
+
+        results = []
+
+        def request():
+            results.append(cache.get(job("Running"), "DATA", [], slow_script))
+
+        threads = [threading.Thread(target=request) for _ in range(5)]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        assert len(runs) == 1
+        assert len(results) == 5
+        assert all(result[0]["stdout"] == "data" for result in results)
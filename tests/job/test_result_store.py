@@ -0,0 +1,170 @@
+import json
+import unittest.mock as mock
+import pytest
+from middleware.job.models import Script
+from middleware.job.result_store import ResultStore, data_after_cursor
+from new_jobs import new_job4
+
+DATA_RESULT = {
+    "stdout": {"data": {"keys": ["time", "value"],
+                        "time": [0.0, 1.0], "value": [2.0, 3.0]},
+               "offset": 10, "cursor": 30},
+    "stderr": "",
+    "exit_code": 0
+}
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def job_with_data_script():
+    job = new_job4()
+    job.scripts.append(Script(action="DATA", source_uri="data.sh",
+                              destination_path="."))
+    return job
+
+
+def mock_run_remote_scripts(script_name, remote_path, arguments=None):
+    if script_name == "data.sh":
+        return json.dumps(DATA_RESULT["stdout"]), "", 0
+    return json.dumps({"progress": {"value": 100}}), "", 0
+
+
+class TestResultStore(object):
+
+    def test_put_and_get(self, tmpdir):
+        store = ResultStore(str(tmpdir))
+        assert store.get("job1", "DATA") is None
+        store.put("job1", "DATA", DATA_RESULT)
+        assert store.get("job1", "DATA") == DATA_RESULT
+        assert len(tmpdir.listdir()) == 1
+
+        store.delete("job1")
+        assert store.get("job1", "DATA") is None
+
+    @mock.patch('middleware.job_information_manager.job_information_manager.'
+                '_run_remote_script', side_effect=mock_run_remote_scripts)
+    def test_pull_stores_final_results(self, mock_run, tmpdir):
+        store = ResultStore(str(tmpdir))
+        job = job_with_data_script()
+        assert store.pull(job)
+        assert store.get(job.id, "DATA") == DATA_RESULT
+        assert store.get(job.id, "PROGRESS")["stdout"] == {
+            "progress": {"value": 100}}
+
+        # Stored results are served without running the scripts again
+        assert store.result(job, "DATA") == DATA_RESULT
+        assert mock_run.call_count == 2
+
+    @mock.patch('middleware.job_information_manager.job_information_manager.'
+                '_run_remote_script', side_effect=OSError("unreachable"))
+    def test_pull_tolerates_failure(self, mock_run, tmpdir):
+        store = ResultStore(str(tmpdir))
+        job = job_with_data_script()
+        assert not store.pull(job)
+        assert store.result(job, "DATA") is None
+
+    @mock.patch('middleware.job_information_manager.job_information_manager.'
+                '_run_remote_script', side_effect=mock_run_remote_scripts)
+    def test_result_pulls_only_the_requested_action(self, mock_run, tmpdir):
+        store = ResultStore(str(tmpdir))
+        job = job_with_data_script()
+        assert store.result(job, "DATA") == DATA_RESULT
+        assert mock_run.call_count == 1
+        assert store.get(job.id, "PROGRESS") is None
+
+    @mock.patch('middleware.job_information_manager.job_information_manager.'
+                '_run_remote_script', side_effect=OSError("unreachable"))
+    def test_failed_pulls_back_off(self, mock_run, tmpdir):
+        clock = Clock()
+        logger = mock.Mock()
+        store = ResultStore(str(tmpdir), retry_interval=10,
+                            max_retry_interval=15, logger=logger, clock=clock)
+        job = job_with_data_script()
+        assert store.result(job, "DATA") is None
+        assert logger.exception.call_count == 1
+
+        # Not tried again until the retry interval has passed
+        assert store.result(job, "DATA") is None
+        assert mock_run.call_count == 1
+        clock.now = 10
+        assert store.result(job, "DATA") is None
+        assert mock_run.call_count == 2
+
+        # and then after twice as long, up to the maximum
+        clock.now = 24
+        assert store.result(job, "DATA") is None
+        assert mock_run.call_count == 2
+        clock.now = 25
+        assert store.result(job, "DATA") is None
+        assert mock_run.call_count == 3
+
+        # A successful pull clears the failures
+        mock_run.side_effect = mock_run_remote_scripts
+        assert store.pull(job)
+        mock_run.side_effect = OSError("unreachable")
+        for path in tmpdir.visit("data.json.gz"):
+            path.remove()
+        assert store.result(job, "DATA") is None
+        assert mock_run.call_count == 6
+        clock.now = 35
+        assert store.result(job, "DATA") is None
+        assert mock_run.call_count == 7
+
+    @mock.patch('middleware.job_information_manager.job_information_manager.'
+                '_run_remote_script', side_effect=mock_run_remote_scripts)
+    def test_failed_scripts_are_not_stored(self, mock_run, tmpdir):
+        # new_job4 has no DATA script
+        store = ResultStore(str(tmpdir))
+        job = new_job4()
+        assert not store.pull(job)
+        assert store.get(job.id, "DATA") is None
+        assert store.get(job.id, "PROGRESS") is not None
+
+    @mock.patch('middleware.job_information_manager.job_information_manager.'
+                '_run_remote_script', side_effect=mock_run_remote_scripts)
+    def test_copy_stores_results_of_another_job(self, mock_run, tmpdir):
+        store = ResultStore(str(tmpdir))
+        job = job_with_data_script()
+        assert store.copy(job, "job2")
+        assert store.get("job2", "DATA") == DATA_RESULT
+
+        # Nothing is copied unless every result is available
+        job = new_job4()
+        job.id = "job3"
+        assert not store.copy(job, "job4")
+        assert store.get("job4", "PROGRESS") is None
+
+    @pytest.mark.parametrize("job_id", ["..", ".", "../job1", "job1/..",
+                                        "a/b", "a\\b", "/tmp", "C:\\", ""])
+    def test_results_stay_within_root(self, job_id, tmpdir):
+        root = tmpdir.join("results")
+        tmpdir.join("keep").write("keep")
+        store = ResultStore(str(root))
+        store.put(job_id, "DATA", DATA_RESULT)
+        assert store.get(job_id, "DATA") == DATA_RESULT
+        assert [path.dirpath() for path in root.visit("*.json.gz")] == [
+            child for child in root.listdir()]
+
+        store.delete(job_id)
+        assert store.get(job_id, "DATA") is None
+        assert root.listdir() == []
+        assert tmpdir.join("keep").read() == "keep"
+
+    def test_data_after_cursor(self):
+        assert data_after_cursor(DATA_RESULT, None) == DATA_RESULT
+        assert data_after_cursor(DATA_RESULT, 0) == DATA_RESULT
+        # Rows part way through the file are not known
+        assert data_after_cursor(DATA_RESULT, 20) is None
+
+        result = data_after_cursor(DATA_RESULT, 30)
+        assert result["stdout"] == {
+            "data": {"keys": ["time", "value"], "time": [], "value": []},
+            "offset": 30, "cursor": 30}
+        assert DATA_RESULT["stdout"]["data"]["time"] == [0.0, 1.0]
@@ -1,11 +1,14 @@
 import pytest
+import arrow
 from flask import Flask
+from sqlalchemy import event
 from middleware.job.sqlalchemy_repository import JobRepositorySqlAlchemy
 from middleware.database import db as _db
 from middleware.job.models import Job, Parameter, Template, Script, Input, Case
 from new_jobs import new_job1, new_job2
 
-from middleware.job.schema import job_to_json, json_to_job, JobSchema
+from middleware.job.schema import (job_to_json, json_to_job, JobSchema,
+                                   job_to_summary_json)
 
 TEST_DB_URI = 'sqlite://'
 
@@ -267,3 +270,183 @@ class TestJobRepositorySQLAlchemy(object):
         list_expected = [job1.id, job2.id]
         list_returned = repo.list_ids()
         assert sorted(list_returned) == sorted(list_expected)
+
+    def test_list_summaries_matches_full_job_summaries(self, session):
+        repo = JobRepositorySqlAlchemy(session)
+        job1 = new_job1()
+        job2 = new_job2()
+        job2.case = None
+        session.add(job1)
+        session.add(job2)
+        session.commit()
+        summaries = repo.list_summaries()
+        assert sorted(s.id for s in summaries) == sorted([job1.id, job2.id])
+        for summary in summaries:
+            job = repo.get_by_id(summary.id)
+            assert job_to_summary_json(summary) == job_to_summary_json(job)
+            assert summary.backend_identifier == job.backend_identifier
+
+    def test_list_summaries_uses_a_single_query(self, session):
+        repo = JobRepositorySqlAlchemy(session)
+        session.add(new_job1())
+        session.add(new_job2())
+        session.commit()
+        statements = []
+
+        def count_statement(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        engine = session.get_bind()
+        event.listen(engine, "before_cursor_execute", count_statement)
+        try:
+            repo.list_summaries()
+        finally:
+            event.remove(engine, "before_cursor_execute", count_statement)
+        # One query for jobs with a creation time and one for those without,
+        # however many jobs there are
+        assert len(statements) == 2
+
+
+def add_dated_jobs(session, count, nulls=0):
+    # Two jobs share each creation time to exercise the id tie-breaker, and
+    # the last `nulls` jobs have no creation time at all
+    start = arrow.get("2017-01-01T00:00:00+00:00")
+    jobs = []
+    for i in range(count):
+        created = None if i >= count - nulls else start.shift(hours=i // 2)
+        job = Job(id="job{:02d}".format(i), creation_datetime=created,
+                  status="Complete" if i % 3 else "Running",
+                  user="user{}".format(i % 2))
+        session.add(job)
+        jobs.append(job)
+    session.commit()
+    return [job.id for job in jobs]
+
+
+def page_through(repo, limit, **kwargs):
+    ids = []
+    after = None
+    while True:
+        page = repo.list_summaries(limit=limit, after=after, **kwargs)
+        ids.extend(job.id for job in page)
+        if len(page) < limit:
+            return ids
+        after = (page[-1].creation_datetime, page[-1].id)
+
+
+class TestJobListingPagination(object):
+
+    def test_pages_cover_all_jobs_in_order(self, session):
+        repo = JobRepositorySqlAlchemy(session)
+        ids = add_dated_jobs(session, 9, nulls=2)
+        # Null creation times sort last, ties are broken by id
+        assert page_through(repo, 2) == ids
+
+    def test_pages_cover_all_jobs_in_descending_order(self, session):
+        repo = JobRepositorySqlAlchemy(session)
+        ids = add_dated_jobs(session, 9, nulls=2)
+        expected = list(reversed(ids[:7])) + list(reversed(ids[7:]))
+        assert page_through(repo, 3, descending=True) == expected
+
+    @pytest.mark.parametrize("descending", [False, True])
+    @pytest.mark.parametrize("after", [None, ("2017-01-01T01:00:00+00:00",
+                                              "job02"), (None, "job07")])
+    def test_pages_are_read_in_index_order(self, session, after, descending):
+        repo = JobRepositorySqlAlchemy(session)
+        add_dated_jobs(session, 9, nulls=2)
+        statements = []
+
+        def record_statement(conn, cursor, statement, parameters, *args):
+            statements.append((statement, parameters))
+
+        engine = session.get_bind()
+        event.listen(engine, "before_cursor_execute", record_statement)
+        try:
+            repo.list_summaries(limit=3, after=after, descending=descending)
+        finally:
+            event.remove(engine, "before_cursor_execute", record_statement)
+        assert statements
+        for statement, parameters in statements:
+            plan = session.connection().execute(
+                "EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+            details = " ".join(row[-1] for row in plan)
+            assert "ix_job_creation_datetime_id" in details
+            assert "TEMP B-TREE" not in details
+
+    def test_filters_are_combined(self, session):
+        repo = JobRepositorySqlAlchemy(session)
+        ids = add_dated_jobs(session, 9)
+        summaries = repo.list_summaries(
+            status=["Complete"], user="user1",
+            created_after=arrow.get("2017-01-01T01:00:00+00:00"),
+            created_before=arrow.get("2017-01-01T04:00:00+00:00"))
+        # Jobs 2-7 fall in the date range, of which the odd ones belong to
+        # user1 and only job 3 is Running
+        assert [job.id for job in summaries] == [ids[5], ids[7]]
+
+    def test_update_status_keeps_checked_time_unless_given(self, session):
+        repo = JobRepositorySqlAlchemy(session)
+        checked_at = arrow.get("2017-01-01T00:00:00+00:00")
+        session.add(Job(id="job0", status="Queued"))
+        session.commit()
+        repo.update_status("job0", "Running", checked_at)
+        repo.update_status("job0", "Submitting")
+        session.expire_all()
+        job = repo.get_by_id("job0")
+        assert job.status == "Submitting"
+        assert job.status_checked_at == checked_at
+
+    def test_saving_job_increments_version(self, session):
+        repo = JobRepositorySqlAlchemy(session)
+        job = repo.create(Job(id="job0", status="Draft"))
+        assert job.version == 1
+        job.name = "renamed"
+        assert repo.update(job).version == 2
+        repo.update(Job(id="job0", status="Draft"))
+        repo.update_status("job0", "Queued")
+        session.expire_all()
+        assert repo.get_by_id("job0").version == 4
+        repo.update_many([repo.get_by_id("job0")])
+        session.expire_all()
+        assert repo.get_by_id("job0").version == 5
+
+    def test_create_and_update_many(self, session):
+        repo = JobRepositorySqlAlchemy(session)
+        jobs = repo.create_many([Job(id="job{}".format(i), status="Draft")
+                                 for i in range(3)])
+        assert sorted(repo.list_ids()) == ["job0", "job1", "job2"]
+        for job in jobs:
+            job.status = "Queued"
+        repo.update_many(jobs)
+        session.expire_all()
+        assert [repo.get_by_id(job.id).status for job in jobs] == \
+            ["Queued"] * 3
+
+    def test_find_by_parameter_hash(self, session):
+        repo = JobRepositorySqlAlchemy(session)
+        finished = arrow.get("2017-01-01T00:00:00+00:00")
+        for i, (status, parameter_hash) in enumerate(
+                [("Complete", "a"), ("Complete", "a"), ("Running", "a"),
+                 ("Complete", "b")]):
+            session.add(Job(id="job{}".format(i), status=status,
+                            parameter_hash=parameter_hash,
+                            end_datetime=finished.shift(hours=i)))
+        session.commit()
+        # The most recently finished matching job is returned
+        assert repo.find_by_parameter_hash("a").id == "job2"
+        assert repo.find_by_parameter_hash("a", status="Complete").id == \
+            "job1"
+        assert repo.find_by_parameter_hash(
+            "a", status="Complete", exclude_id="job1").id == "job0"
+        assert repo.find_by_parameter_hash("c") is None
+
+    def test_filter_by_case_id(self, session):
+        repo = JobRepositorySqlAlchemy(session)
+        job1 = new_job1()
+        job2 = new_job2()
+        job2.case = None
+        session.add(job1)
+        session.add(job2)
+        session.commit()
+        summaries = repo.list_summaries(case_id=job1.case.id)
+        assert [job.id for job in summaries] == [job1.id]
@@ -0,0 +1,156 @@
+import threading
+import unittest.mock as mock
+import pytest
+import arrow
+from flask import Flask
+from middleware.job.submission import SubmissionQueue, SubmissionQueueFull
+from new_jobs import new_job4
+
+
+class JobRepository(object):
+    """Minimal in-memory job repository"""
+
+    def __init__(self, *jobs):
+        self.job_list = {job.id: job for job in jobs}
+
+    def get_by_id(self, job_id):
+        return self.job_list.get(job_id)
+
+    def update(self, job):
+        self.job_list[job.id] = job
+        return job
+
+    def update_status(self, job_id, status, status_checked_at=None,
+                      submitted_at=None):
+        self.job_list[job_id].status = status
+        if submitted_at is not None:
+            self.job_list[job_id].submitted_at = submitted_at
+        return True
+
+    def list_by_status(self, statuses):
+        return [job for job in self.job_list.values()
+                if job.status in statuses]
+
+
+def draft_job():
+    job = new_job4()
+    job.status = "Draft"
+    return job
+
+
+class TestSubmissionQueue(object):
+
+    @mock.patch('middleware.job_information_manager.job_information_manager.'
+                'setup', return_value=({"exit_code": 0}, 200))
+    def test_setup_restores_previous_status(self, mock_setup):
+        job = draft_job()
+        jobs = JobRepository(job)
+        queue = SubmissionQueue(Flask(__name__), jobs)
+
+        future = queue.submit(job.id, "SETUP")
+        assert future.result(5) == ({"exit_code": 0}, 200)
+        assert jobs.get_by_id(job.id).status == "Draft"
+
+    @mock.patch('middleware.job_information_manager.job_information_manager.'
+                'transfer_all_files')
+    @mock.patch('middleware.job_information_manager.job_information_manager.'
+                'patch_all_templates')
+    @mock.patch('middleware.job_information_manager.job_information_manager.'
+                'create_job_directory')
+    def test_setup_without_setup_script_succeeds(self, mock_create,
+                                                 mock_patch, mock_transfer):
+        job = draft_job()
+        job.scripts = [script for script in job.scripts
+                       if script.action != "SETUP"]
+        jobs = JobRepository(job)
+        queue = SubmissionQueue(Flask(__name__), jobs)
+
+        queue.submit(job.id, "SETUP").result(5)
+        assert mock_transfer.call_count == 1
+        assert jobs.get_by_id(job.id).status == "Draft"
+
+    @mock.patch('middleware.job_information_manager.job_information_manager.'
+                'setup', side_effect=OSError("unreachable"))
+    def test_failed_setup_sets_error_and_is_logged(self, mock_setup):
+        job = draft_job()
+        jobs = JobRepository(job)
+        app = Flask(__name__)
+        queue = SubmissionQueue(app, jobs)
+
+        with mock.patch.object(app, 'logger') as mock_logger:
+            result, code = queue.submit(job.id, "SETUP").result(5)
+        assert code == 500
+        assert jobs.get_by_id(job.id).status == "Error"
+        assert mock_logger.exception.call_count == 1
+
+    def test_recover_marks_stale_submitting_jobs_as_error(self):
+        now = arrow.utcnow()
+        statuses = [("Submitting", now.shift(hours=-2)),
+                    ("Submitting", None),
+                    ("Submitting", now.shift(minutes=-5)),
+                    ("Queued", now.shift(hours=-2))]
+        job_list = []
+        for i, (status, submitted_at) in enumerate(statuses):
+            job = new_job4()
+            job.id = "job{}".format(i)
+            job.status = status
+            job.submitted_at = submitted_at
+            job_list.append(job)
+        jobs = JobRepository(*job_list)
+        queue = SubmissionQueue(Flask(__name__), jobs)
+
+        # Recently submitted jobs may belong to another running process
+        assert queue.recover(3600) == 2
+        assert [jobs.get_by_id(job.id).status for job in job_list] == \
+            ["Error", "Error", "Submitting", "Queued"]
+
+    @mock.patch('middleware.job_information_manager.job_information_manager.'
+                'setup', return_value=({"exit_code": 0}, 200))
+    def test_submit_records_submission_time(self, mock_setup):
+        job = draft_job()
+        jobs = JobRepository(job)
+        queue = SubmissionQueue(Flask(__name__), jobs)
+
+        before = arrow.utcnow()
+        queue.submit(job.id, "SETUP").result(5)
+        assert before <= jobs.get_by_id(job.id).submitted_at <= arrow.utcnow()
+        # A job that was just submitted is not recovered
+        jobs.get_by_id(job.id).status = "Submitting"
+        assert queue.recover(3600) == 0
+
+    @mock.patch('middleware.job_information_manager.job_information_manager.'
+                'run', return_value=({"exit_code": 0}, 200))
+    def test_run_without_backend_identifier_sets_error(self, mock_run):
+        job = draft_job()
+        jobs = JobRepository(job)
+        queue = SubmissionQueue(Flask(__name__), jobs)
+
+        queue.submit(job.id, "RUN").result(5)
+        assert jobs.get_by_id(job.id).status == "Error"
+
+    def test_full_queue_rejects_jobs(self):
+        job = draft_job()
+        jobs = JobRepository(job)
+        queue = SubmissionQueue(Flask(__name__), jobs, max_workers=1,
+                                max_pending=1)
+        release = threading.Event()
+
+        def slow_setup():
+            release.wait(5)
+            return {"exit_code": 0}, 200
+
+        with mock.patch('middleware.job_information_manager.'
+                        'job_information_manager.setup',
+                        side_effect=slow_setup):
+            future = queue.submit(job.id, "SETUP")
+            assert jobs.get_by_id(job.id).status == "Submitting"
+            with pytest.raises(SubmissionQueueFull):
+                queue.submit(job.id, "SETUP")
+            release.set()
+            future.result(5)
+
+        # The slot is free again once the job has been set up
+        with mock.patch('middleware.job_information_manager.'
+                        'job_information_manager.setup',
+                        return_value=({"exit_code": 0}, 200)):
+            queue.submit(job.id, "SETUP").result(5)
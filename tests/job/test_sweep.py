@@ -0,0 +1,136 @@
+import tarfile
+from io import BytesIO
+import pytest
+from middleware.job.sweep import (SweepError, parameter_values, sweep_points,
+                                  check_job_script, sweep_jobs, sweep_upload,
+                                  array_directives, array_backend_identifiers)
+from middleware.job.models import case_to_job
+from middleware.job.schema import job_to_json
+from middleware.factory import json_to_case_list
+
+CASES_JSON_FILENAME = './resources/cases/blue_cases.json'
+
+
+def stirred_tank_job_json():
+    case = json_to_case_list(CASES_JSON_FILENAME)[0]
+    return job_to_json(case_to_job(case))
+
+
+class TestSweepPoints(object):
+
+    def test_values_are_stepped_exactly(self):
+        parameter = {"min_value": "0.1", "max_value": "0.3", "step": "0.1"}
+        assert parameter_values("p", parameter, {}, 10) == [
+            "0.1", "0.2", "0.3"]
+
+    def test_range_overrides_parameter_template(self):
+        parameter = {"min_value": "2", "max_value": "6", "step": "1"}
+        assert parameter_values("p", parameter, {"min_value": "4"}, 10) == [
+            "4", "5", "6"]
+        # max_value is included only if it falls on a step
+        assert parameter_values("p", parameter, {"step": "3"}, 10) == [
+            "2", "5"]
+
+    @pytest.mark.parametrize("value_range", [
+        {"step": "0"}, {"step": "-1"}, {"step": "x"}, {"max_value": None},
+        {"min_value": "NaN"}, {"min_value": "7"}])
+    def test_invalid_ranges_are_rejected(self, value_range):
+        parameter = {"min_value": "2", "max_value": "6", "step": "1"}
+        with pytest.raises(SweepError):
+            parameter_values("p", parameter, value_range, 10)
+
+    def test_points_are_the_product_of_the_ranges(self):
+        job_json = stirred_tank_job_json()
+        points = sweep_points(job_json, {
+            "tank_radius": {"min_value": "0.01", "max_value": "0.02",
+                            "step": "0.01"},
+            "tank_num_blades": {"max_value": "4"}}, 10)
+        # Parameters are varied in order of name, the last fastest
+        assert points == [
+            {"tank_num_blades": "2", "tank_radius": "0.01"},
+            {"tank_num_blades": "2", "tank_radius": "0.02"},
+            {"tank_num_blades": "3", "tank_radius": "0.01"},
+            {"tank_num_blades": "3", "tank_radius": "0.02"},
+            {"tank_num_blades": "4", "tank_radius": "0.01"},
+            {"tank_num_blades": "4", "tank_radius": "0.02"}]
+
+    def test_sweep_size_is_capped(self):
+        job_json = stirred_tank_job_json()
+        ranges = {"tank_num_blades": {}, "tank_radius": {"max_value": "0.1"}}
+        with pytest.raises(SweepError) as e:
+            sweep_points(job_json, ranges, 100)
+        assert "maximum of 100" in str(e.value)
+
+    @pytest.mark.parametrize("ranges", [None, {}, {"unknown": {}},
+                                        {"tank_radius": [1, 2]}])
+    def test_invalid_sweeps_are_rejected(self, ranges):
+        with pytest.raises(SweepError):
+            sweep_points(stirred_tank_job_json(), ranges, 100)
+
+
+class TestSweepSubmission(object):
+
+    def test_jobs_are_built_from_case(self):
+        job_json = stirred_tank_job_json()
+        check_job_script(job_json)
+        jobs = sweep_jobs(job_json, [{"tank_radius": "0.01"},
+                                     {"tank_radius": "0.02"}])
+        assert len(set(job.id for job in jobs)) == 2
+        assert all(job.status == "Draft" for job in jobs)
+        values = [parameter.value for job in jobs
+                  for family in job.families
+                  for parameter in family.parameters
+                  if parameter.name == "tank_radius"]
+        assert values == ["0.01", "0.02"]
+        assert jobs[0].name.endswith("(tank_radius=0.01)")
+
+    def test_case_without_job_script_is_rejected(self):
+        job_json = stirred_tank_job_json()
+        with pytest.raises(SweepError):
+            check_job_script(job_json, job_script="missing.sh")
+
+    def test_upload_holds_each_distinct_file_once(self):
+        jobs = sweep_jobs(stirred_tank_job_json(), [{"tank_radius": "0.01"},
+                                                    {"tank_radius": "0.02"},
+                                                    {"tank_radius": "0.03"}])
+        archive_bytes, command = sweep_upload("sweep1", jobs)
+
+        with tarfile.open(fileobj=BytesIO(archive_bytes)) as archive:
+            names = archive.getnames()
+            jobs_file = archive.extractfile("sweep/jobs").read().decode()
+            copy_script = archive.extractfile("sweep/copy.sh").read().decode()
+            array_script = archive.extractfile(
+                "sweep/array.sh").read().decode()
+        objects = [name for name in names if name.startswith("objects/")]
+        files_per_job = len(jobs[0].scripts + jobs[0].inputs +
+                            jobs[0].templates)
+        # These templates do not use the swept parameter, so every job's
+        # files are identical
+        assert len(objects) <= files_per_job
+        # Each job gets its own copy of every file
+        assert copy_script.count("\ncp ") == 3 * files_per_job
+        assert "ln " not in copy_script
+        # Subjob i runs in the directory of job i
+        lines = jobs_file.split()
+        assert len(lines) == 3
+        assert all(line.endswith(job.id) for line, job in zip(lines, jobs))
+        assert "#PBS -j oe" in array_script
+        # Each subjob writes its output in its own job directory
+        assert "#PBS -o" not in array_script
+        assert "bash pbs.sh >TEST.out 2>&1" in array_script
+        assert "qsub -J 1-3 array.sh" in command
+
+    def test_array_directives(self):
+        script = (b'#!/bin/bash\n#PBS -N SHORT\n#PBS -o "SHORT.out"\n'
+                  b'#PBS -eSHORT.err\n#PBS -J 1-4\n#PBS -j oe\necho\n')
+        assert array_directives(script) == (
+            ["#PBS -N SHORT", "#PBS -j oe"], "SHORT.out")
+        assert array_directives(b"#PBS -j oe\n") == (["#PBS -j oe"], None)
+
+    def test_array_backend_identifiers(self):
+        assert array_backend_identifiers("1234[].cx1b\n", 3) == [
+            "1234[1].cx1b", "1234[2].cx1b", "1234[3].cx1b"]
+        assert array_backend_identifiers("1234[]\n", 2) == [
+            "1234[1]", "1234[2]"]
+        assert array_backend_identifiers("1234.cx1b\n", 3) is None
+        assert array_backend_identifiers("", 3) is None
@@ -0,0 +1,71 @@
+import base64
+import json
+import os
+import shutil
+import struct
+import subprocess
+import sys
+from middleware.columnar import encode_columns, decode_columns
+
+DATA_OBJECT = {
+    "data": {
+        "keys": ["time", "value"],
+        "labels": ["Time", "Value"],
+        "units": ["s", "m"],
+        "time": [0.0, 0.5, 1.0],
+        "value": [1.5, -2.25, 1e-300]
+    },
+    "offset": 10,
+    "cursor": 100
+}
+
+
+def data_script_directory(case):
+    return os.path.join(os.path.dirname(__file__), "..", "resources", case)
+
+
+def run_data_script(case, *arguments, **kwargs):
+    directory = kwargs.get("directory") or data_script_directory(case)
+    return subprocess.check_output(
+        [sys.executable, "csv_to_data_json.py"] + list(arguments),
+        cwd=directory, env=kwargs.get("env")).decode("utf-8")
+
+
+class TestColumnar(object):
+
+    def test_round_trip(self):
+        assert decode_columns(encode_columns(DATA_OBJECT)) == DATA_OBJECT
+
+    def test_columns_are_little_endian_float64(self):
+        payload = encode_columns(DATA_OBJECT)
+        # Columns follow the header in the order of the keys
+        assert payload[-48:] == struct.pack("<6d", 0.0, 0.5, 1.0,
+                                            1.5, -2.25, 1e-300)
+
+    def test_data_script_output_matches_json(self):
+        expected = json.loads(run_data_script("prerun_stirred_tank", "0"))
+        packed = run_data_script("prerun_stirred_tank", "0", "binary")
+        assert decode_columns(base64.b64decode(packed)) == expected
+
+    def test_data_script_reads_last_row_once_job_has_finished(self, tmpdir):
+        shutil.copy(os.path.join(data_script_directory("minimal_blue_test"),
+                                 "csv_to_data_json.py"), str(tmpdir))
+        csv_content = b"Time(s),Kinetic Energy\n0,1.5\n1,2.5"
+        tmpdir.join("aeration.csv").write_binary(csv_content)
+
+        # While the job is running the last row may be partly written
+        running = json.loads(run_data_script(None, directory=str(tmpdir)))
+        assert running["data"]["Time(s)"] == [0.0]
+        assert running["cursor"] == csv_content.index(b"1,2.5")
+
+        env = dict(os.environ, JOB_FINISHED="1")
+        finished = json.loads(run_data_script(
+            None, str(running["cursor"]), directory=str(tmpdir), env=env))
+        assert finished["data"]["Time(s)"] == [1.0]
+        assert finished["data"]["Kinetic Energy"] == [2.5]
+        assert finished["cursor"] == len(csv_content)
+
+        # and is then only returned once
+        after = json.loads(run_data_script(
+            None, str(finished["cursor"]), directory=str(tmpdir), env=env))
+        assert after["data"]["Time(s)"] == []
@@ -0,0 +1,89 @@
+import gzip
+import json
+import unittest.mock as mock
+import pytest
+from flask import Flask, Response, jsonify
+from middleware.compression import compress_response
+
+LARGE_DATA = {"data": list(range(2000))}
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.config.from_object("config.test")
+    app.after_request(compress_response)
+
+    @app.route('/large')
+    def large():
+        response = jsonify(LARGE_DATA)
+        response.set_etag("abc")
+        return response
+
+    @app.route('/small')
+    def small():
+        return jsonify({"data": [1, 2, 3]})
+
+    @app.route('/streamed')
+    def streamed():
+        chunks = (json.dumps(LARGE_DATA)[i:i + 100]
+                  for i in range(0, len(json.dumps(LARGE_DATA)), 100))
+        return Response(chunks, mimetype='application/json')
+
+    @app.route('/image')
+    def image():
+        return Response(b"\0" * 5000, mimetype='image/png')
+
+    return app.test_client()
+
+
+class TestCompression(object):
+
+    def test_large_json_is_gzipped(self, client):
+        response = client.get('/large', headers={"Accept-Encoding": "gzip"})
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert "Accept-Encoding" in response.headers["Vary"]
+        body = gzip.decompress(response.get_data())
+        assert json.loads(body.decode("utf-8")) == LARGE_DATA
+        assert len(response.get_data()) < len(body)
+
+    def test_etag_is_weak_when_compressed(self, client):
+        response = client.get('/large', headers={"Accept-Encoding": "gzip"})
+        assert response.headers["ETag"] == 'W/"abc"'
+
+    def test_not_compressed_without_accept_encoding(self, client):
+        response = client.get('/large')
+        assert "Content-Encoding" not in response.headers
+        assert response.headers["ETag"] == '"abc"'
+        assert json.loads(response.get_data(as_text=True)) == LARGE_DATA
+
+    def test_small_json_is_not_compressed(self, client):
+        response = client.get('/small', headers={"Accept-Encoding": "gzip"})
+        assert "Content-Encoding" not in response.headers
+
+    def test_other_mimetypes_are_not_compressed(self, client):
+        response = client.get('/image', headers={"Accept-Encoding": "gzip"})
+        assert "Content-Encoding" not in response.headers
+
+    def test_streamed_json_is_compressed_as_it_is_sent(self, client):
+        response = client.get('/streamed',
+                              headers={"Accept-Encoding": "gzip"})
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert "Content-Length" not in response.headers
+        body = gzip.decompress(response.get_data())
+        assert json.loads(body.decode("utf-8")) == LARGE_DATA
+
+    def test_brotli_is_preferred_when_available(self, client):
+        brotli = mock.Mock()
+        brotli.compress.return_value = b"compressed"
+        with mock.patch('middleware.compression.brotli', brotli):
+            response = client.get(
+                '/large', headers={"Accept-Encoding": "gzip, br"})
+        assert response.headers["Content-Encoding"] == "br"
+        assert response.get_data() == b"compressed"
+
+    def test_client_preference_is_respected(self, client):
+        with mock.patch('middleware.compression.brotli', mock.Mock()):
+            response = client.get(
+                '/large', headers={"Accept-Encoding": "gzip, br;q=0.5"})
+        assert response.headers["Content-Encoding"] == "gzip"
@@ -0,0 +1,51 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import pytest
+
+RESOURCES = os.path.join(os.path.dirname(__file__), "..", "resources")
+
+# The csv file read by the DATA script of each case
+DATA_FILES = [
+    ("minimal_blue_test", "aeration.csv"),
+    ("mock_blue_simulation", "output.csv"),
+    ("mock_product_changeover", "output.csv"),
+    ("mock_stirred_tank", "output.csv"),
+    ("mock_stratified_flow", "output.csv"),
+    ("prerun_product_changeover", "output.csv"),
+    ("prerun_stirred_tank", "output.csv"),
+    ("prerun_stratified_flow", "output.csv"),
+]
+
+
+def run_data_script(case, directory, file_name, csv_content, *arguments):
+    shutil.copy(os.path.join(RESOURCES, case, "csv_to_data_json.py"),
+                str(directory))
+    with open(os.path.join(str(directory), file_name), "wb") as f:
+        f.write(csv_content.encode("utf-8"))
+    output = subprocess.check_output(
+        [sys.executable, "csv_to_data_json.py"] + list(arguments),
+        cwd=str(directory))
+    return json.loads(output.decode("utf-8"))
+
+
+class TestDataScripts(object):
+
+    @pytest.mark.parametrize("case, file_name", DATA_FILES)
+    def test_data_of_empty_file(self, case, file_name, tmpdir):
+        # A job that has just started may not have written its header yet
+        for arguments in [[], ["0"], ["100"]]:
+            data_object = run_data_script(case, tmpdir, file_name, "",
+                                          *arguments)
+            data = data_object["data"]
+            assert all(data[key] == [] for key in data["keys"])
+            assert data_object["cursor"] == 0
+
+    @pytest.mark.parametrize("case, file_name", DATA_FILES)
+    def test_data_of_file_without_rows(self, case, file_name, tmpdir):
+        data_object = run_data_script(case, tmpdir, file_name, "Time\n")
+        data = data_object["data"]
+        assert all(data[key] == [] for key in data["keys"])
+        assert data_object["cursor"] == len("Time\n")
@@ -0,0 +1,58 @@
+from middleware.downsample import lttb_indices, downsample
+
+
+class TestLTTB(object):
+
+    def test_short_series_is_unchanged(self):
+        x = [0, 1, 2, 3]
+        assert lttb_indices(x, x, 4) == [0, 1, 2, 3]
+        assert lttb_indices(x, x, 10) == [0, 1, 2, 3]
+
+    def test_threshold_number_of_points_kept(self):
+        x = list(range(1000))
+        y = [i % 7 for i in x]
+        indices = lttb_indices(x, y, 50)
+        assert len(indices) == 50
+        assert indices[0] == 0
+        assert indices[-1] == 999
+        assert indices == sorted(set(indices))
+
+    def test_spikes_are_kept(self):
+        x = list(range(1000))
+        y = [0.0] * 1000
+        y[123] = 10.0
+        y[654] = -10.0
+        indices = lttb_indices(x, y, 10)
+        assert 123 in indices
+        assert 654 in indices
+
+
+class TestDownsample(object):
+
+    def test_series_stay_aligned(self):
+        x = list(range(100))
+        data = {"keys": ["time", "a", "b"],
+                "labels": ["Time", "A", "B"],
+                "time": [float(i) for i in x],
+                "a": [0.0] * 100,
+                "b": [0.0] * 100}
+        data["a"][10] = 1.0
+        data["b"][90] = 1.0
+        result = downsample(data, 5)
+        assert result["keys"] == data["keys"]
+        assert result["labels"] == data["labels"]
+        assert len(result["time"]) == len(result["a"]) == len(result["b"])
+        # Spikes from each series are kept in both series
+        assert 10.0 in result["time"]
+        assert 90.0 in result["time"]
+        assert result["a"][result["time"].index(10.0)] == 1.0
+        assert result["b"][result["time"].index(90.0)] == 1.0
+
+    def test_data_smaller_than_points_is_unchanged(self):
+        data = {"keys": ["time", "a"], "time": [0.0, 1.0], "a": [1.0, 2.0]}
+        assert downsample(data, 10) == data
+
+    def test_data_without_series_is_unchanged(self):
+        assert downsample({}, 10) == {}
+        assert downsample({"keys": ["time"], "time": [0.0]}, 10) == \
+            {"keys": ["time"], "time": [0.0]}
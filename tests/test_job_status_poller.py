@@ -0,0 +1,174 @@
+import pytest
+import unittest.mock as mock
+from flask import Flask
+from middleware.factory import create_app
+from middleware.job.sqlalchemy_repository import (
+    JobRepositorySqlAlchemy, CaseRepositorySqlAlchemy)
+from middleware.job.api import JobApi, JobsApi
+from middleware.job_status_poller import JobStatusPoller
+from middleware.database import db as _db
+from tests.job.new_jobs import new_job1, new_job2, new_job3
+
+CONFIG_NAME = "test"
+
+
+@pytest.fixture(scope='session')
+def app(request):
+    """Session-wide test Flask app"""
+    app = Flask(__name__, instance_relative_config=True)
+    app.config.from_object("config.test")
+    _db.init_app(app)
+
+    ctx = app.app_context()
+    ctx.push()
+
+    def teardown():
+        ctx.pop()
+
+    request.addfinalizer(teardown)
+    return app
+
+
+@pytest.fixture(scope='session')
+def db(app, request):
+    """Session-wide test database"""
+    def teardown():
+        _db.drop_all()
+
+    _db.app = app
+    _db.create_all()
+
+    request.addfinalizer(teardown)
+    return _db
+
+
+@pytest.fixture(scope='function')
+def session(db, request):
+    """Function-wide SQLAlchemy session for each test"""
+    connection = db.engine.connect()
+    transaction = connection.begin()
+
+    options = dict(bind=connection, binds={}, expire_on_commit=True)
+    session = db.create_scoped_session(options=options)
+
+    db.session = session
+
+    def teardown():
+        transaction.rollback()
+        connection.close()
+        session.remove()
+
+    request.addfinalizer(teardown)
+    return session
+
+
+checked_job_ids = []
+
+
+def mock_job_statuses(jobs):
+    checked_job_ids[:] = [job.id for job in jobs]
+    return {job.id: "Running" if job.status == "Queued" else job.status
+            for job in jobs}
+
+
+def mock_job_statuses_unavailable(jobs):
+    raise AssertionError("Backend should not be contacted")
+
+
+def create_jobs(jobs, statuses):
+    created = []
+    for job, status in zip([new_job1(), new_job2(), new_job3()], statuses):
+        job.status = status
+        created.append(jobs.create(job))
+    return created
+
+
+class TestJobStatusPoller(object):
+
+    @mock.patch('middleware.job_status_poller.job_statuses',
+                side_effect=mock_job_statuses)
+    def test_poll_updates_active_jobs(self, mock_statuses, session):
+        jobs = JobRepositorySqlAlchemy(session)
+        cases = CaseRepositorySqlAlchemy(session)
+        app = create_app(CONFIG_NAME, cases, jobs)
+        job1, job2, job3 = create_jobs(jobs, ["Queued", "Running", "Draft"])
+        job1_id, job2_id, job3_id = job1.id, job2.id, job3.id
+
+        poller = JobStatusPoller(app, jobs)
+        changed = poller.poll()
+
+        assert changed == 1
+        # only Queued and Running jobs are checked
+        assert sorted(checked_job_ids) == sorted([job1_id, job2_id])
+        assert jobs.get_by_id(job1_id).status == "Running"
+        assert jobs.get_by_id(job1_id).status_checked_at is not None
+        assert jobs.get_by_id(job2_id).status_checked_at is not None
+        assert jobs.get_by_id(job3_id).status_checked_at is None
+
+    @mock.patch('middleware.job_status_poller.job_statuses',
+                side_effect=lambda jobs: {job.id: "Complete" for job in jobs})
+    def test_poll_stores_results_of_completed_jobs(self, mock_statuses,
+                                                   session):
+        jobs = JobRepositorySqlAlchemy(session)
+        cases = CaseRepositorySqlAlchemy(session)
+        app = create_app(CONFIG_NAME, cases, jobs)
+        job1, job2 = create_jobs(jobs, ["Running", "Draft"])
+        job1_id = job1.id
+        result_store = mock.Mock()
+
+        poller = JobStatusPoller(app, jobs, result_store=result_store)
+        poller.poll()
+
+        assert result_store.pull.call_count == 1
+        assert result_store.pull.call_args[0][0].id == job1_id
+
+    @mock.patch('middleware.job_status_poller.job_statuses',
+                side_effect=mock_job_statuses_unavailable)
+    def test_poll_with_no_active_jobs(self, mock_statuses, session):
+        jobs = JobRepositorySqlAlchemy(session)
+        cases = CaseRepositorySqlAlchemy(session)
+        app = create_app(CONFIG_NAME, cases, jobs)
+        create_jobs(jobs, ["Draft", "Complete"])
+
+        poller = JobStatusPoller(app, jobs)
+        assert poller.poll() is None
+
+    def test_interval_adapts_to_activity(self):
+        poller = JobStatusPoller(None, None, min_interval=10,
+                                 max_interval=60)
+        assert poller.interval == 10
+        poller.interval = poller.next_interval(0)
+        assert poller.interval == 20
+        poller.interval = poller.next_interval(0)
+        assert poller.interval == 40
+        poller.interval = poller.next_interval(0)
+        assert poller.interval == 60
+        poller.interval = poller.next_interval(2)
+        assert poller.interval == 10
+        assert poller.next_interval(None) == 60
+
+
+class TestCachedStatusReads(object):
+
+    @mock.patch('middleware.job.api.job_statuses',
+                side_effect=mock_job_statuses_unavailable)
+    def test_jobs_get_serves_last_known_status(self, mock_statuses, session):
+        jobs = JobRepositorySqlAlchemy(session)
+        create_jobs(jobs, ["Queued", "Running"])
+        api = JobsApi(job_repository=jobs, refresh_status=False)
+        with Flask(__name__).test_request_context():
+            response, code = api.get()[:2]
+        assert code == 200
+        assert sorted(j["status"] for j in response["jobs"]) == [
+            "Queued", "Running"]
+
+    @mock.patch('middleware.job_information_manager.job_information_manager.'
+                'update_job_status', side_effect=AssertionError)
+    def test_job_get_serves_last_known_status(self, mock_update, session):
+        jobs = JobRepositorySqlAlchemy(session)
+        job1, = create_jobs(jobs, ["Running"])
+        api = JobApi(job_repository=jobs, refresh_status=False)
+        with Flask(__name__).test_request_context():
+            response, code = api.get(job1.id)[:2]
+        assert code == 200
+        assert response["status"] == "Running"
@@ -0,0 +1,44 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+RESOURCES = os.path.join(os.path.dirname(__file__), "..", "resources")
+
+
+def run_progress_script(case, directory, output_csv):
+    shutil.copy(os.path.join(RESOURCES, case, "csv_to_progress_json.py"),
+                str(directory))
+    with open(os.path.join(str(directory), "output.csv"), "w") as f:
+        f.write(output_csv)
+    output = subprocess.check_output(
+        [sys.executable, "csv_to_progress_json.py"], cwd=str(directory))
+    return json.loads(output.decode("utf-8"))["progress"]["value"]
+
+
+class TestProgressScripts(object):
+
+    def test_progress_from_last_complete_row(self, tmpdir):
+        # The partly written final row is ignored
+        rows = ["{},1\r\n".format(i / 10) for i in range(1000)]
+        rows = "Time,x\r\n" + "".join(rows) + "99.9,"
+        value = run_progress_script("mock_stirred_tank", tmpdir, rows)
+        assert value == 99.9 / 0.958954545
+
+    def test_progress_without_rows(self, tmpdir):
+        assert run_progress_script("mock_stirred_tank", tmpdir, "") == 100
+        assert run_progress_script("mock_stirred_tank", tmpdir,
+                                   "Time,x\n") == 100
+
+    def test_reference_value_is_cached(self, tmpdir):
+        tmpdir.join("Blue.nml").write("&params\n timestep_max = 2000\n/\n")
+        rows = "timestep,x\n1,2\n1000,3\n"
+        assert run_progress_script("mock_blue_simulation", tmpdir,
+                                   rows) == 0.5
+        assert tmpdir.join(".timestep_max").read() == "2000.0"
+
+        # The cached value is used while the parameters are unchanged
+        tmpdir.join(".timestep_max").write("4000.0")
+        assert run_progress_script("mock_blue_simulation", tmpdir,
+                                   rows) == 0.25
@@ -0,0 +1,235 @@
+import socket
+import threading
+import unittest.mock as mock
+import pytest
+from middleware.ssh import ssh, ConnectionPool
+
+
+class MockConnection(object):
+    """Stands in for middleware.ssh.ssh without opening a real connection"""
+    def __init__(self, hostname, username, port, **kwargs):
+        self.hostname = hostname
+        self.username = username
+        self.port = port
+        self.kwargs = kwargs
+        self.active = True
+        self.closed = False
+
+    def is_active(self):
+        return self.active and not self.closed
+
+    def close_connection(self):
+        self.closed = True
+
+
+@mock.patch('middleware.ssh.ssh', side_effect=MockConnection)
+class TestConnectionPool(object):
+
+    def test_released_connection_is_reused(self, mock_ssh):
+        pool = ConnectionPool()
+        first = pool.acquire('host', 'user', 22)
+        pool.release(first)
+        second = pool.acquire('host', 'user', 22)
+        assert second is first
+        assert mock_ssh.call_count == 1
+
+    def test_connections_are_keyed_by_host_user_port_and_key(self, mock_ssh):
+        pool = ConnectionPool()
+        keys = [('host', 'user', 22, None, None),
+                ('host', 'other_user', 22, None, None),
+                ('other_host', 'user', 22, None, None),
+                ('host', 'user', 2222, None, None),
+                ('host', 'user', 22, 'keys/development', None),
+                ('host', 'user', 22, None, 'key string')]
+        for hostname, username, port, key_path, key_string in keys:
+            connection = pool.acquire(hostname, username, port,
+                                      private_key_path=key_path,
+                                      private_key_string=key_string)
+            pool.release(connection)
+        assert mock_ssh.call_count == len(keys)
+
+    def test_keepalive_passed_to_new_connections(self, mock_ssh):
+        pool = ConnectionPool(keepalive=15)
+        connection = pool.acquire('host', 'user', 22)
+        assert connection.kwargs['keepalive'] == 15
+
+    def test_connection_is_shared_up_to_max_channels(self, mock_ssh):
+        pool = ConnectionPool(max_size=2, max_channels=2)
+        first = pool.acquire('host', 'user', 22)
+        second = pool.acquire('host', 'user', 22)
+        third = pool.acquire('host', 'user', 22)
+        assert second is first
+        assert third is not first
+        assert first.kwargs['max_channels'] == 2
+
+    def test_acquire_times_out_when_pool_is_full(self, mock_ssh):
+        pool = ConnectionPool(max_size=1, max_channels=1,
+                              acquire_timeout=0.01)
+        pool.acquire('host', 'user', 22)
+        with pytest.raises(TimeoutError):
+            pool.acquire('host', 'user', 22)
+
+    def test_unhealthy_connection_is_replaced(self, mock_ssh):
+        pool = ConnectionPool()
+        first = pool.acquire('host', 'user', 22)
+        pool.release(first)
+        first.active = False
+        second = pool.acquire('host', 'user', 22)
+        assert second is not first
+        assert first.closed
+
+    def test_unhealthy_connection_is_not_pooled_on_release(self, mock_ssh):
+        pool = ConnectionPool(max_size=1, max_channels=1,
+                              acquire_timeout=0.01)
+        first = pool.acquire('host', 'user', 22)
+        first.active = False
+        pool.release(first)
+        assert first.closed
+        # The slot held by the dropped connection should be free again
+        second = pool.acquire('host', 'user', 22)
+        assert second is not first
+
+    def test_idle_connections_are_closed_after_timeout(self, mock_ssh):
+        pool = ConnectionPool(idle_timeout=0)
+        first = pool.acquire('host', 'user', 22)
+        pool.release(first)
+        second = pool.acquire('host', 'user', 22)
+        assert first.closed
+        assert second is not first
+
+    def test_failed_connection_frees_its_slot(self, mock_ssh):
+        pool = ConnectionPool(max_size=1, max_channels=1,
+                              acquire_timeout=0.01)
+        mock_ssh.side_effect = Exception()
+        with pytest.raises(Exception):
+            pool.acquire('host', 'user', 22)
+        mock_ssh.side_effect = MockConnection
+        connection = pool.acquire('host', 'user', 22)
+        assert connection.is_active()
+
+    def test_context_manager_releases_connection(self, mock_ssh):
+        pool = ConnectionPool(max_size=1, max_channels=1,
+                              acquire_timeout=0.01)
+        with pool.connection('host', 'user', 22) as first:
+            pass
+        with pool.connection('host', 'user', 22) as second:
+            pass
+        assert second is first
+
+    def test_close_all_closes_idle_connections(self, mock_ssh):
+        pool = ConnectionPool()
+        connection = pool.acquire('host', 'user', 22)
+        pool.release(connection)
+        pool.close_all()
+        assert connection.closed
+
+
+class MockChannelFile(object):
+    def __init__(self, channel, data):
+        self.channel = channel
+        self.data = data
+
+    def read(self):
+        return self.data
+
+
+def mock_client(exec_command):
+    client = mock.Mock()
+    client.exec_command.side_effect = exec_command
+    return client
+
+
+def channel_files(command, exit_status_ready=True):
+    channel = mock.Mock()
+    channel.status_event = threading.Event()
+    if exit_status_ready:
+        channel.status_event.set()
+    channel.recv_exit_status.return_value = 0
+    stdout = MockChannelFile(channel, command.encode("utf-8"))
+    stderr = MockChannelFile(channel, b"")
+    return None, stdout, stderr
+
+
+def bare_ssh(client, max_channels=8):
+    # Build an ssh object around a mock client without connecting
+    connection = ssh.__new__(ssh)
+    connection.client = client
+    connection.max_channels = max_channels
+    connection._channel_slots = threading.BoundedSemaphore(max_channels)
+    return connection
+
+
+class TestSSH(object):
+
+    def test_pass_command_returns_output_and_exit_code(self):
+        connection = bare_ssh(mock_client(
+            lambda command, timeout=None: channel_files(command)))
+        assert connection.pass_command("ls") == ("ls", "", 0)
+
+    def test_pass_command_streams_stdin_data(self):
+        stdin = mock.Mock()
+        channels = []
+
+        def exec_command(command, timeout=None):
+            _, stdout, stderr = channel_files(command)
+            channels.append(stdout.channel)
+            return stdin, stdout, stderr
+
+        connection = bare_ssh(mock_client(exec_command))
+        connection.pass_command("tar -xf -", stdin_data=b"archive")
+        stdin.write.assert_called_once_with(b"archive")
+        # End of file is sent so the command can finish
+        channels[0].shutdown_write.assert_called_once_with()
+
+    @mock.patch('middleware.ssh.SCPClient')
+    def test_secure_copy_data_copies_from_memory(self, mock_scp):
+        connection = bare_ssh(mock.Mock())
+        connection.secure_copy_data(b"content", "/remote/file.txt")
+        scp = mock_scp.return_value.__enter__.return_value
+        data, destination = scp.putfo.call_args[0]
+        assert data.read() == b"content"
+        assert destination == "/remote/file.txt"
+
+    def test_pass_command_times_out_waiting_for_exit(self):
+        connection = bare_ssh(mock_client(
+            lambda command, timeout=None: channel_files(
+                command, exit_status_ready=False)))
+        with pytest.raises(socket.timeout):
+            connection.pass_command("sleep 100", timeout=0.01)
+
+    def test_pass_commands_runs_channels_concurrently(self):
+        # Every command waits at the barrier, so this only completes if all
+        # three channels are open at the same time
+        barrier = threading.Barrier(3, timeout=5)
+
+        def exec_command(command, timeout=None):
+            barrier.wait()
+            return channel_files(command)
+
+        connection = bare_ssh(mock_client(exec_command))
+        results = connection.pass_commands(["a", "b", "c"])
+        assert [out for out, err, code in results] == ["a", "b", "c"]
+
+    def test_in_flight_channels_are_bounded(self):
+        in_flight = []
+        peak = []
+        lock = threading.Lock()
+
+        def exec_command(command, timeout=None):
+            with lock:
+                in_flight.append(command)
+                peak.append(len(in_flight))
+            threading.Event().wait(0.01)
+            with lock:
+                in_flight.remove(command)
+            return channel_files(command)
+
+        connection = bare_ssh(mock_client(exec_command), max_channels=2)
+        # Extra threads beyond the channel limit must wait for a free slot
+        threads = [threading.Thread(target=connection.pass_command,
+                                    args=(str(i),)) for i in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert max(peak) <= 2
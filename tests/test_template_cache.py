@@ -0,0 +1,56 @@
+import os
+from middleware.template_cache import TemplateCache
+
+
+def write_template(tmpdir, name, text):
+    template_file = tmpdir.join(name)
+    template_file.write(text)
+    return str(template_file)
+
+
+class TestTemplateCache(object):
+
+    def test_template_is_compiled_once(self, tmpdir):
+        cache = TemplateCache()
+        path = write_template(tmpdir, "a.nml", "x = ${parameters['x']}")
+        template = cache.get(path)
+        assert cache.get(path) is template
+        assert template.render(parameters={"x": 1}) == "x = 1"
+        assert cache.stats() == {"hits": 1, "misses": 1, "evictions": 0,
+                                 "size": 1, "max_size": 64}
+
+    def test_changed_template_is_compiled_again(self, tmpdir):
+        cache = TemplateCache()
+        path = write_template(tmpdir, "a.nml", "old ${parameters['x']}")
+        cache.get(path)
+        write_template(tmpdir, "a.nml", "new version ${parameters['x']}")
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+        template = cache.get(path)
+        assert template.render(parameters={"x": 1}) == "new version 1"
+        # The entry for the old version is replaced
+        assert cache.stats()["size"] == 1
+
+    def test_least_recently_used_template_is_evicted(self, tmpdir):
+        cache = TemplateCache(max_size=2)
+        paths = [write_template(tmpdir, "{}.nml".format(name), name)
+                 for name in "abc"]
+        cache.get(paths[0])
+        cache.get(paths[1])
+        cache.get(paths[0])
+        cache.get(paths[2])
+        assert cache.stats()["evictions"] == 1
+
+        cache.get(paths[0])
+        assert cache.stats()["hits"] == 2
+        cache.get(paths[1])
+        assert cache.stats()["misses"] == 4
+
+    def test_compiled_modules_are_written_to_module_directory(self, tmpdir):
+        module_directory = tmpdir.join("modules")
+        cache = TemplateCache(module_directory=str(module_directory))
+        path = write_template(tmpdir, "a.nml", "${parameters['x']}")
+        cache.get(path)
+        assert any(name.endswith(".py") for _, _, names in
+                   os.walk(str(module_directory)) for name in names)